@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+"""
+Benchmark per-notice-type dictionary compression of VOEvents.
+
+Compares the size of a collection of VOEvents stored as raw files (one per
+IVORN, as written by `gcn.handlers.archive`) with the size of the same
+VOEvents compressed one at a time by `gcn.DictionaryCodec`, with and without
+dictionaries, and with whole-collection compression as a lower bound. Also
+reports the time to read back a single VOEvent from each format.
+
+By default, the VOEvents are synthesized from the sample notices in the test
+suite. Pass the directory of an archive written by `gcn.handlers.archive` to
+use real notices instead. Dictionaries are trained on half of the VOEvents
+and evaluated on the other half.
+"""
+import argparse
+import lzma
+import os
+import random
+import tempfile
+import timeit
+import zlib
+
+import gcn
+from gcn import notice_types
+from gcn.codec import DictionaryCodec, zstandard
+
+DATA_DIR = os.path.join(os.path.dirname(gcn.__file__), 'tests', 'data')
+
+
+def synthesize(count):
+    """Make VOEvents of a few notice types with random values."""
+    with open(os.path.join(DATA_DIR, 'gbm_flt_pos.xml'), 'rb') as f:
+        template = f.read()
+    rng = random.Random(0)
+    kinds = [notice_types.FERMI_GBM_FLT_POS, notice_types.FERMI_GBM_GND_POS,
+             notice_types.FERMI_GBM_FIN_POS, notice_types.FERMI_GBM_ALERT]
+    payloads = []
+    for i in range(count):
+        payload = template
+        for old, new in [
+                (b'336801278_45-956', b'%d_%d' % (i, rng.randrange(1000))),
+                (b'value="111"', b'value="%d"' % rng.choice(kinds)),
+                (b'336801278', b'%d' % rng.randrange(1 << 30)),
+                (b'193.0000', b'%.4f' % rng.uniform(0, 360)),
+                (b'-31.7500', b'%.4f' % rng.uniform(-90, 90)),
+                (b'17.4333', b'%.4f' % rng.uniform(0, 30)),
+                (b'2011-09-04T03:54:36.02', b'20%02d-%02d-%02dT%02d:%02d:%02d'
+                 % (rng.randrange(8, 26), rng.randrange(1, 13),
+                    rng.randrange(1, 29), rng.randrange(24),
+                    rng.randrange(60), rng.randrange(60)))]:
+            payload = payload.replace(old, new)
+        payloads.append(payload)
+    return payloads
+
+
+def load(directory):
+    payloads = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                payloads.append(f.read())
+    return payloads
+
+
+def time_per_record(func, records):
+    """Best time over a few repeats to call func on every record, per
+    record, in random order."""
+    records = list(records)
+    random.Random(1).shuffle(records)
+
+    def run():
+        for record in records:
+            func(record)
+
+    return min(timeit.repeat(run, number=1, repeat=3)) / len(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('archive', nargs='?',
+                        help='Directory of VOEvent files (default: '
+                        'synthesize VOEvents)')
+    parser.add_argument('--count', type=int, default=4000,
+                        help='Number of VOEvents to synthesize '
+                        '(default: %(default)s)')
+    parser.add_argument('--dict-size', type=int, default=16384,
+                        help='Dictionary size in bytes (default: '
+                        '%(default)s)')
+    args = parser.parse_args()
+
+    payloads = load(args.archive) if args.archive else synthesize(args.count)
+    training, test = payloads[::2], payloads[1::2]
+    raw = sum(len(payload) for payload in test)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        block = os.statvfs(tmpdir).f_bsize
+        paths = []
+        for i, payload in enumerate(test):
+            path = os.path.join(tmpdir, str(i))
+            with open(path, 'wb') as f:
+                f.write(payload)
+            paths.append(path)
+
+        def read_file(path):
+            with open(path, 'rb') as f:
+                f.read()
+
+        read_raw = time_per_record(read_file, paths)
+
+    print('{0} VOEvents, {1} bytes'.format(len(test), raw))
+    print('{0:<28} {1:>12} {2:>8} {3:>14}'.format(
+        'format', 'bytes', 'ratio', 'read (us)'))
+
+    def report(name, size, seconds=None):
+        print('{0:<28} {1:>12} {2:>8.2f} {3:>14}'.format(
+            name, size, raw / size,
+            '' if seconds is None else '{0:.1f}'.format(1e6 * seconds)))
+
+    report('raw files', raw, read_raw)
+    report('raw files, {0} B blocks'.format(block), sum(
+        -(-len(payload) // block) * block for payload in test))
+    report('whole collection, zlib', len(zlib.compress(b''.join(test), 9)))
+    report('whole collection, xz', len(lzma.compress(b''.join(test))))
+
+    backends = ['zlib'] + (['zstd'] if zstandard is not None else [])
+    for backend in backends:
+        plain = DictionaryCodec(backend=backend)
+        trained = DictionaryCodec.train(training, size=args.dict_size,
+                                        backend=backend)
+        for name, codec in [('per record, ' + backend, plain),
+                            ('per record, ' + backend + ' + dict', trained)]:
+            records = [codec.encode(payload) for payload in test]
+            assert all(codec.decode(record) == payload
+                       for record, payload in zip(records, test))
+            report(name, sum(len(record) for record in records),
+                   time_per_record(codec.decode, records))
+        print('  {0} dictionaries, {1} bytes'.format(
+            len(trained.dictionaries),
+            sum(len(d) for d in trained.dictionaries.values())))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+"""
+Benchmark the VOEvent ingest pipeline.
+
+For each payload size, a local stand-in server sends VOEvents as fast as the
+client will take them (or at a fixed rate) to `gcn.listen` running in a
+separate process, and reports the throughput in packets/s, the round-trip
+time from sending each packet to receiving its ack, and the client's CPU time
+per packet and peak RSS. The parsing, dispatch, and archiving stages are also
+timed on their own.
+
+Results are printed and may be written to a JSON file. If a baseline JSON
+file from an earlier run is given, then the script exits with a nonzero
+status if any throughput or timing got worse by more than the tolerance.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import resource
+import socket
+import sys
+import tempfile
+import threading
+import time
+import timeit
+
+import lxml.etree
+from lxml.etree import fromstring
+
+import gcn
+from gcn import handlers, notice_types
+from gcn.voeventclient import _recv_packet, _size_struct
+
+TEMPLATE_PATH = os.path.join(
+    os.path.dirname(gcn.__file__), 'tests', 'data', 'gbm_flt_pos.xml')
+SIZES = {'small': 0, '64KiB': 1 << 16, '1MiB': 1 << 20, '4MiB': 1 << 22}
+
+
+def make_template(size):
+    """Make a VOEvent of at least `size` bytes from the Fermi GBM sample, by
+    padding it with extra parameters. Return the parts before and after a
+    placeholder for a serial number to make its IVORN unique."""
+    with open(TEMPLATE_PATH, 'rb') as f:
+        payload = f.read()
+    param = b'    <Param name="Synthetic_%08d" value="1.2345678" />\n'
+    nparams = max(0, size - len(payload)) // len(param % 0) + (size > 0)
+    group = (b'    <Group name="Synthetic">\n' +
+             b''.join(param % i for i in range(nparams)) +
+             b'    </Group>\n')
+    payload = payload.replace(b'  </What>', group + b'  </What>')
+    ivorn = fromstring(payload).attrib['ivorn'].encode()
+    head, _, tail = payload.partition(ivorn)
+    return head + ivorn + b'_', tail
+
+
+def make_payload(template, i):
+    head, tail = template
+    return head + b'%08d' % i + tail
+
+
+def peak_rss():
+    """Peak resident set size of this process in bytes."""
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+
+def run_client(port, count, archive, conn):
+    """Run `gcn.listen` until it has handled `count` VOEvents, then send
+    resource usage back through the pipe `conn`."""
+    log = logging.getLogger('bench.listen')
+    log.setLevel(logging.CRITICAL)
+    logging.getLogger('gcn.handlers.archive').setLevel(logging.CRITICAL)
+    done = threading.Event()
+    received = [0]
+
+    def handler(payload, root):
+        if archive:
+            handlers.archive(payload, root)
+        received[0] += 1
+        if received[0] >= count:
+            done.set()
+
+    tmpdir = tempfile.TemporaryDirectory()
+    os.chdir(tmpdir.name)
+    thread = threading.Thread(target=gcn.listen, kwargs=dict(
+        host='127.0.0.1', port=port, handler=handler, log=log))
+    thread.daemon = True
+    cpu = time.process_time()
+    thread.start()
+    done.wait()
+    conn.send(dict(cpu=time.process_time() - cpu, peak_rss=peak_rss()))
+    conn.close()
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1,
+                             int(round(q / 100 * (len(sorted_values) - 1))))]
+
+
+def bench_listen(template, count, rate, archive):
+    """Serve `count` packets to a client process and measure it."""
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(1)
+    port = sock.getsockname()[1]
+
+    parent_conn, child_conn = multiprocessing.Pipe()
+    client = multiprocessing.Process(
+        target=run_client, args=(port, count, archive, child_conn))
+    client.start()
+
+    conn, _ = sock.accept()
+    conn.settimeout(60)
+    sock.close()
+    payloads = [make_payload(template, i) for i in range(min(count, 64))]
+    sent = [0.0] * count
+    rtt = [0.0] * count
+
+    def send():
+        interval = 1 / rate if rate else 0
+        start = time.perf_counter()
+        for i in range(count):
+            if interval:
+                delay = start + i * interval - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            payload = payloads[i % len(payloads)]
+            sent[i] = time.perf_counter()
+            conn.sendall(_size_struct.pack(len(payload)) + payload)
+
+    sender = threading.Thread(target=send)
+    sender.daemon = True
+    start = time.perf_counter()
+    sender.start()
+    for i in range(count):
+        _recv_packet(conn)
+        rtt[i] = time.perf_counter() - sent[i]
+    elapsed = time.perf_counter() - start
+
+    usage = parent_conn.recv()
+    client.join()
+    conn.close()
+
+    rtt.sort()
+    return dict(
+        count=count,
+        packets_per_second=count / elapsed,
+        ack_rtt_p50=percentile(rtt, 50),
+        ack_rtt_p90=percentile(rtt, 90),
+        ack_rtt_p99=percentile(rtt, 99),
+        ack_rtt_max=rtt[-1],
+        cpu_per_packet=usage['cpu'] / count,
+        peak_rss=usage['peak_rss'])
+
+
+def bench_stages(template, count):
+    """Time parsing, dispatch, and archiving separately, in seconds per
+    packet."""
+    payloads = [make_payload(template, i) for i in range(count)]
+    roots = [fromstring(payload) for payload in payloads]
+
+    # A dispatcher with a typical number of handlers, one of which matches.
+    dispatcher = handlers.Dispatcher()
+    for notice_type in list(notice_types.NoticeType)[:19]:
+        dispatcher.add(lambda payload, root: None, notice_type)
+    dispatcher.add(lambda payload, root: None, notice_types.FERMI_GBM_FLT_POS)
+
+    def parse():
+        for payload in payloads:
+            fromstring(payload)
+
+    def dispatch():
+        for payload, root in zip(payloads, roots):
+            dispatcher(payload, root)
+
+    def archive():
+        for payload, root in zip(payloads, roots):
+            handlers.archive(payload, root)
+
+    logging.getLogger('gcn.handlers.archive').setLevel(logging.CRITICAL)
+    result = {}
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        os.chdir(tmpdir)
+        try:
+            for name, func in [('parse', parse), ('dispatch', dispatch),
+                               ('archive', archive)]:
+                result[name] = min(timeit.repeat(
+                    func, number=1, repeat=3)) / count
+        finally:
+            os.chdir(cwd)
+    return result
+
+
+# Metrics for which bigger is better; for the others, smaller is better.
+HIGHER_IS_BETTER = {'packets_per_second'}
+# Metrics that are compared against the baseline.
+COMPARED = {'packets_per_second', 'ack_rtt_p50', 'ack_rtt_p99',
+            'cpu_per_packet', 'peak_rss', 'parse', 'dispatch', 'archive'}
+
+
+def compare(results, baseline, tolerance):
+    """Return a list of descriptions of regressions relative to the
+    baseline."""
+    regressions = []
+    for size, result in results['sizes'].items():
+        for key, value in result.items():
+            try:
+                old = baseline['sizes'][size][key]
+            except KeyError:
+                continue
+            if key not in COMPARED or not old:
+                continue
+            change = value / old - 1
+            if key in HIGHER_IS_BETTER:
+                change = -change
+            if change > tolerance:
+                regressions.append('{0} {1}: {2:.4g} -> {3:.4g}'.format(
+                    size, key, old, value))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', nargs='+', choices=list(SIZES),
+                        default=list(SIZES),
+                        help='Payload sizes (default: all)')
+    parser.add_argument('--count', type=int, default=2000,
+                        help='Packets per size, reduced for large payloads '
+                        'to stay under --max-bytes (default: %(default)s)')
+    parser.add_argument('--max-bytes', type=int, default=256 << 20,
+                        help='Bytes per size (default: %(default)s)')
+    parser.add_argument('--rate', type=float, default=0,
+                        help='Packets per second, or 0 to send as fast as '
+                        'possible (default: %(default)s)')
+    parser.add_argument('--archive', action='store_true',
+                        help='Archive each VOEvent in the client')
+    parser.add_argument('--output', '-o', metavar='RESULTS.json',
+                        help='Write results to this file')
+    parser.add_argument('--baseline', metavar='BASELINE.json',
+                        help='Compare results to this earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Fractional change that counts as a regression '
+                        '(default: %(default)s)')
+    args = parser.parse_args()
+
+    results = dict(
+        pygcn=gcn.__version__,
+        lxml=lxml.etree.__version__,
+        python=platform.python_version(),
+        platform=platform.platform(),
+        rate=args.rate,
+        archive=args.archive,
+        sizes={})
+
+    for size in args.sizes:
+        template = make_template(SIZES[size])
+        nbytes = len(make_payload(template, 0))
+        count = max(10, min(args.count, args.max_bytes // nbytes))
+        result = dict(payload_bytes=nbytes)
+        result.update(bench_listen(template, count, args.rate, args.archive))
+        result.update(bench_stages(template, min(count, 200)))
+        results['sizes'][size] = result
+
+        print('{0} ({1} bytes, {2} packets)'.format(size, nbytes, count))
+        print('  {0:.1f} packets/s'.format(result['packets_per_second']))
+        print('  ack round trip: p50 {0:.3f} ms, p90 {1:.3f} ms, '
+              'p99 {2:.3f} ms, max {3:.3f} ms'.format(
+                  *(1e3 * result[key] for key in [
+                      'ack_rtt_p50', 'ack_rtt_p90', 'ack_rtt_p99',
+                      'ack_rtt_max'])))
+        print('  client: {0:.1f} us CPU per packet, peak RSS {1:.1f} '
+              'MiB'.format(1e6 * result['cpu_per_packet'],
+                           result['peak_rss'] / (1 << 20)))
+        print('  stages: parse {0:.1f} us, dispatch {1:.1f} us, '
+              'archive {2:.1f} us'.format(
+                  *(1e6 * result[key]
+                    for key in ['parse', 'dispatch', 'archive'])))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for regression in regressions:
+            print('regression:', regression)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
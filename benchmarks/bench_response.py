@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+Micro-benchmark for forming and sending VOEvent Transport Protocol `ack`
+responses with `gcn.voeventclient._form_response` and `_send_packet`. Also
+compares answering an `iamalive` message by parsing it with lxml with
+recognizing it from its bytes with `gcn.voeventclient._iamalive_origin`.
+"""
+import argparse
+import socket
+import threading
+import timeit
+
+from lxml.etree import fromstring
+
+from gcn.voeventclient import (
+    _form_response, _get_now_iso8601, _iamalive_origin, _match_iamalive,
+    _send_packet)
+
+ORIGIN = ('ivo://nasa.gsfc.gcn/Fermi#GBM_Flt_Pos_2011-09-04T03:54:36.02_'
+          '336801278_45-956')
+IVORN = 'ivo://python_voeventclient/anonymous'
+IAMALIVE = b"""<?xml version = '1.0' encoding = 'UTF-8'?>
+<trn:Transport
+      version="1.0"
+      xmlns:trn="http://telescope-networks.org/schema/Transport/v1.1"
+      xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"
+      xsi:schemaLocation="http://telescope-networks.org/schema/Transport/v1.1 \
+http://telescope-networks.org/schema/Transport-v1.1.xsd"
+      role="iamalive">
+<Origin>ivo://nasa.gsfc.gcn/gcn</Origin>
+<TimeStamp>2022-07-20T12:00:00</TimeStamp>
+</trn:Transport>
+"""
+
+
+def drain(sock):
+    while sock.recv(1 << 20):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--number', '-n', type=int, default=100000,
+                        help='Responses per trial (default: %(default)s)')
+    parser.add_argument('--repeat', '-r', type=int, default=5,
+                        help='Number of trials (default: %(default)s)')
+    args = parser.parse_args()
+
+    timestamp = _get_now_iso8601()
+    a, b = socket.socketpair()
+    thread = threading.Thread(target=drain, args=(b,))
+    thread.daemon = True
+    thread.start()
+
+    cases = [
+        ('form', lambda: _form_response(
+            'ack', ORIGIN, IVORN, timestamp)),
+        ('form and send', lambda: _send_packet(
+            a, _form_response('ack', ORIGIN, IVORN, timestamp))),
+        ('time stamp', _get_now_iso8601),
+        ('iamalive origin, lxml', lambda: fromstring(
+            IAMALIVE).find('Origin').text),
+        ('iamalive origin, checked', lambda: _match_iamalive(IAMALIVE)),
+        ('iamalive origin, cached', lambda: _iamalive_origin(IAMALIVE)),
+    ]
+    for name, func in cases:
+        best = min(timeit.repeat(func, number=args.number,
+                                 repeat=args.repeat)) / args.number
+        print('{0:30s} {1:8.3f} us'.format(name, best * 1e6))
+
+    a.close()
+
+
+if __name__ == '__main__':
+    main()
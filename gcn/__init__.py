@@ -31,12 +31,56 @@ TCP/IP VOEvent Transport Protocol
 (http://www.ivoa.net/documents/Notes/VOEventTransport).
 """
 
+import importlib
+
 from . import handlers
 from . import notice_types
+from . import reconnect
 from . import voeventclient
 from ._version import version as __version__  # noqa: F401
 from .handlers import *  # noqa: F401, F403
 from .notice_types import *  # noqa: F401, F403
+from .reconnect import *  # noqa: F401, F403
 from .voeventclient import *  # noqa: F401, F403
 
-__all__ = handlers.__all__ + notice_types.__all__ + voeventclient.__all__
+# Modules that are not needed to listen for notices, and the names that they
+# export. They are imported the first time that they or one of their names
+# are used, so that they do not slow down starting a listener. Their names
+# are left out of __all__, because `from gcn import *` would otherwise
+# import all of them.
+_lazy_modules = {
+    'aio': ('listen_async',),
+    'cache': ('NoticeCache',),
+    'codec': ('DictionaryCodec',),
+    'extract': ('extract_columns',),
+    'metrics': ('Metrics', 'InMemoryMetrics', 'serve_metrics'),
+    'notice': ('Notice',),
+    'playback': ('replay', 'serve_replay', 'ReplayResult'),
+    'query': ('NoticeIndex', 'IndexedNotice'),
+    'regions': ('Cone', 'Polygon', 'HEALPixMask', 'get_position'),
+    'server': ('Broadcaster', 'broadcast', 'Relay'),
+    'store': ('SegmentedArchive', 'ArchiveReader', 'ArchiveEntry',
+              'BackgroundArchive'),
+    'workers': ('WorkerPool', 'ShardedProcessPool')}
+_lazy_names = {name: module for module, names in _lazy_modules.items()
+               for name in names}
+
+__all__ = (handlers.__all__ + notice_types.__all__ + reconnect.__all__ +
+           voeventclient.__all__)
+
+
+def __getattr__(name):
+    if name in _lazy_modules:
+        value = importlib.import_module('.' + name, __name__)
+    elif name in _lazy_names:
+        value = getattr(importlib.import_module(
+            '.' + _lazy_names[name], __name__), name)
+    else:
+        raise AttributeError(
+            'module {0!r} has no attribute {1!r}'.format(__name__, name))
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy_modules) | set(_lazy_names))
@@ -0,0 +1,151 @@
+# Copyright (C) 2026  Leo Singer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+"""
+Anonymous VOEvent client for asyncio applications, implementing the same
+VOEvent Transport Protocol as `gcn.voeventclient.listen` on top of asyncio
+streams.
+"""
+
+import asyncio
+import inspect
+import itertools
+import logging
+
+from lxml.etree import XMLSyntaxError
+
+from .voeventclient import (
+    _respond, _size_len, _size_struct, _validate_host_port)
+
+__all__ = ('listen_async',)
+
+
+async def _open_connection(hosts_ports, iamalive_timeout,
+                           max_reconnect_timeout, log):
+    """Establish a connection. Wait 1 second after the first failed attempt.
+    Double the timeout after each failed attempt thereafter, until the
+    timeout reaches MAX_RECONNECT_TIMEOUT. Return the new stream reader and
+    writer."""
+    reconnect_timeout = 1
+    for host, port in hosts_ports:
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, port), iamalive_timeout)
+        except (OSError, asyncio.TimeoutError):
+            if reconnect_timeout < max_reconnect_timeout:
+                reconnect_timeout <<= 1
+            log.exception(
+                'could not connect to %s:%d, will retry in %d seconds',
+                host, port, reconnect_timeout)
+            await asyncio.sleep(reconnect_timeout)
+        else:
+            log.info("connected to %s:%d", host, port)
+            return reader, writer
+
+
+async def _recv_packet(reader, timeout):
+    """Read a length-prefixed VOEvent Transport Protocol packet and return the
+    payload."""
+    try:
+        # Receive and unpack size of payload to follow
+        payload_len, = _size_struct.unpack(await asyncio.wait_for(
+            reader.readexactly(_size_len), timeout))
+
+        # Receive payload
+        return await asyncio.wait_for(
+            reader.readexactly(payload_len), timeout)
+    except asyncio.IncompleteReadError:
+        raise ConnectionError('connection closed by peer')
+
+
+async def _send_packet(writer, payload):
+    """Send an array of bytes as a length-prefixed VOEvent Transport Protocol
+    packet."""
+    writer.write(_size_struct.pack(len(payload)) + payload)
+    await writer.drain()
+
+
+async def _ingest_packet(reader, writer, ivorn, handler, timeout, log):
+    """Ingest one VOEvent Transport Protocol packet and act on it, first
+    sending the appropriate response and then calling (and, if it is a
+    coroutine function, awaiting) the handler if the payload is a VOEvent."""
+    # Receive payload
+    payload = await _recv_packet(reader, timeout)
+    log.debug("received packet of %d bytes", len(payload))
+    log.debug("payload is:\n%s", payload)
+
+    # Parse payload and act on it
+    response, root = _respond(payload, ivorn, log,
+                              getattr(handler, 'accepts', None))
+    if response is not None:
+        await _send_packet(writer, response)
+        log.debug("sent response")
+    if root is not None and handler is not None:
+        try:
+            result = handler(payload, root)
+            if inspect.isawaitable(result):
+                await result
+        except asyncio.CancelledError:
+            raise
+        except:  # noqa: E722
+            log.exception("exception in payload handler")
+
+
+async def listen_async(host=("45.58.43.186", "68.169.57.253"), port=8099,
+                       ivorn="ivo://python_voeventclient/anonymous",
+                       iamalive_timeout=150, max_reconnect_timeout=1024,
+                       handler=None, log=None):
+    """Connect to a VOEvent Transport Protocol server on the given `host` and
+    `port`, then listen for VOEvents until the task is cancelled.
+
+    This is the asyncio counterpart of `gcn.voeventclient.listen` and takes
+    the same arguments. The connection is made with asyncio streams, so that
+    the client can share an event loop with other I/O.
+
+    If `handler` is provided, it should be a callable that takes two
+    arguments, the raw VOEvent payload and the ElementTree root object of the
+    XML document. It may be either an ordinary function or a coroutine
+    function; if it returns an awaitable, then the awaitable is awaited before
+    the next packet is read.
+
+    Note that this coroutine does not return."""
+    if log is None:
+        log = logging.getLogger('gcn.listen_async')
+
+    hosts_ports = itertools.cycle(zip(*_validate_host_port(host, port)))
+
+    while True:
+
+        reader, writer = await _open_connection(
+            hosts_ports, iamalive_timeout, max_reconnect_timeout, log)
+
+        try:
+            while True:
+                await _ingest_packet(reader, writer, ivorn, handler,
+                                     iamalive_timeout, log)
+        except asyncio.TimeoutError:
+            log.warning("timed out")
+        except OSError:
+            log.exception("socket error")
+        except XMLSyntaxError:
+            log.warning("XML syntax error")
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                log.exception("could not close socket")
+            else:
+                log.info("closed socket")
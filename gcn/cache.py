@@ -0,0 +1,178 @@
+# Copyright (C) 2026  Leo Singer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+"""
+Memory-bounded cache of the notices for each trigger.
+"""
+
+import collections
+import functools
+import threading
+import time
+
+from .extract import _trigger
+from .handlers import _keep_accepts
+from .notice import Notice
+
+__all__ = ('NoticeCache',)
+
+
+def _key(ivorn, trigger):
+    """Make the cache key for a trigger from the IVORN of one of its notices
+    and its trigger number."""
+    if trigger is None:
+        return None
+    return (ivorn or '').partition('#')[0], trigger
+
+
+class NoticeCache(object):
+    """Payload handler that keeps track of the sequence of notices for each
+    trigger, such as the Fermi GBM alert, flight position, ground position,
+    and final position notices for one burst, or the preliminary, initial,
+    update, and retraction notices for one LIGO/Virgo/KAGRA superevent.
+
+    Notices are grouped by trigger, identified by a key that is a tuple of
+    the stream part of the IVORN (the part before the ``#``, such as
+    ``'ivo://nasa.gsfc.gcn/Fermi'``) and the `TrigID` or `GraceID` parameter,
+    so that trigger numbers from different missions are kept apart. Notices
+    that have neither parameter are ignored. Each notice is kept as a
+    `gcn.Notice`, without the payload or the element tree. The cache holds at
+    most `maxsize` triggers and at most `max_chain` notices per trigger. When
+    it is full, the trigger that was updated least recently is evicted.
+    Triggers that have not been updated for `ttl` seconds are evicted as
+    well.
+
+    Use it as a handler on its own, or wrap another handler with `track` so
+    that the cache is updated before the handler runs, as in:
+
+        import gcn
+
+        cache = gcn.NoticeCache()
+
+        @cache.track
+        def handle(payload, root):
+            key = cache.key(root)
+            print('notices so far:', cache.chain(key))
+
+    Looking up the notices for a trigger takes constant time."""
+
+    def __init__(self, maxsize=4096, ttl=7 * 86400, max_chain=64):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_chain = max_chain
+        self._lock = threading.Lock()
+        self._chains = collections.OrderedDict()
+        # The last VOEvent that each thread added, and its key, so that `key`
+        # does not have to look for the trigger number again.
+        self._last = threading.local()
+
+    def key(self, root):
+        """Return the key of the trigger of a VOEvent, or None if it does not
+        have a trigger number."""
+        last = getattr(self._last, 'added', None)
+        if last is not None and last[0] is root:
+            return last[1]
+        return _key(root.get('ivorn'), _trigger(root))
+
+    def _expire(self, now):
+        """Evict triggers that have not been updated in `ttl` seconds. The
+        least recently updated triggers are at the front."""
+        if self.ttl is None:
+            return
+        while self._chains:
+            key, chain = next(iter(self._chains.items()))
+            if now - chain[-1][0] <= self.ttl:
+                break
+            del self._chains[key]
+
+    def __call__(self, payload, root):
+        self.add(root)
+
+    def add(self, notice):
+        """Add a notice to the cache, given either as a `gcn.Notice` or as the
+        root element of a VOEvent. Return the key of its trigger, or None if
+        it does not have a trigger number."""
+        if isinstance(notice, Notice):
+            key = _key(notice.ivorn, notice.trigger)
+        else:
+            root, notice = notice, Notice.from_root(notice)
+            key = _key(notice.ivorn, notice.trigger)
+            self._last.added = (root, key)
+        if key is None:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            chain = self._chains.pop(key, None)
+            if chain is None:
+                chain = collections.deque(maxlen=self.max_chain)
+            chain.append((now, notice))
+            self._chains[key] = chain
+            while len(self._chains) > self.maxsize:
+                self._chains.popitem(last=False)
+        return key
+
+    def track(self, handler):
+        """Decorator that adds each VOEvent to the cache before passing it to
+        `handler`."""
+        @functools.wraps(handler)
+        def handle(payload, root, *args, **kwargs):
+            self.add(root)
+            return handler(payload, root, *args, **kwargs)
+        _keep_accepts(handle, handler)
+        return handle
+
+    def _get(self, key):
+        """Look up the chain for a trigger. Must be called with the lock
+        held."""
+        if key is None:
+            return None
+        stream, trigger = key
+        key = (stream, str(trigger))
+        chain = self._chains.get(key)
+        if chain is not None and self.ttl is not None and (
+                time.monotonic() - chain[-1][0] > self.ttl):
+            del self._chains[key]
+            chain = None
+        return chain
+
+    def chain(self, key):
+        """Return a tuple of the cached `gcn.Notice` objects for the trigger
+        with the given key, oldest first, or an empty tuple if there are
+        none."""
+        with self._lock:
+            chain = self._get(key)
+            return () if chain is None else tuple(
+                notice for _, notice in chain)
+
+    def latest(self, key):
+        """Return the latest cached `gcn.Notice` for the trigger with the
+        given key, or None."""
+        with self._lock:
+            chain = self._get(key)
+            return None if chain is None else chain[-1][1]
+
+    def __contains__(self, key):
+        with self._lock:
+            return self._get(key) is not None
+
+    def __len__(self):
+        with self._lock:
+            self._expire(time.monotonic())
+            return len(self._chains)
+
+    def clear(self):
+        with self._lock:
+            self._chains.clear()
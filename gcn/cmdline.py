@@ -18,7 +18,9 @@ Utilities for command-line interface.
 """
 import argparse
 import collections
+import importlib
 import logging
+import os
 
 from . import handlers, listen, serve, __version__
 
@@ -88,10 +90,112 @@ def listen_main(args=None):
     listen(host=host, port=port, handler=handlers.archive)
 
 
+def relay_main(args=None):
+    """VOEvent relay that keeps one connection to GCN and rebroadcasts all
+    incoming VOEvents to any number of local clients."""
+
+    # Command line interface
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('addr', default='68.169.57.253:8099',
+                        action=HostPortAction, nargs='*',
+                        help='Server host and port; if multiple options are '
+                        'provided, then loop over hosts until a connection '
+                        'with one of them is established. '
+                        '(default: %(default)s)')
+    parser.add_argument('--bind', default='127.0.0.1:8099',
+                        action=HostPortAction,
+                        help='Host and port on which to serve local clients '
+                        '(default: %(default)s)')
+    parser.add_argument('--unix', metavar='PATH',
+                        help='Also serve local clients on a Unix domain '
+                        'socket at this path')
+    parser.add_argument('--max-buffer', metavar='BYTES', type=int,
+                        default=1 << 22,
+                        help='Disconnect clients that fall this many bytes '
+                        'behind (default: %(default)s)')
+    parser.add_argument('--archive', action='store_true',
+                        help='Also save all incoming VOEvents to disk')
+    parser.add_argument('--version', action='version',
+                        version='pygcn ' + __version__)
+    args = parser.parse_args(args)
+
+    # Set up logger
+    logging.basicConfig(level=logging.INFO)
+
+    # Relay GCN notices (until interrupted or killed)
+    from . import Relay
+    host, port = [list(_) for _ in zip(*args.addr)]
+    relay = Relay(args.bind.host, args.bind.port, unix_path=args.unix,
+                  handler=handlers.archive if args.archive else None,
+                  max_buffer=args.max_buffer)
+    relay.run(host=host, port=port)
+
+
+def _import_handler(string):
+    """Import a handler given as 'module:name'."""
+    module, _, name = string.partition(':')
+    if not name:
+        raise argparse.ArgumentTypeError(
+            'expected MODULE:NAME, got {0!r}'.format(string))
+    try:
+        return getattr(importlib.import_module(module), name)
+    except (ImportError, AttributeError) as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def replay_main(args=None):
+    """Replay archived VOEvents as fast as possible or at a scaled rate,
+    either to a handler in this process or over the VOEvent Transport Protocol
+    to a client, and report the throughput."""
+
+    # Command line interface
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('source', nargs='+', metavar='ARCHIVE|PAYLOAD.xml',
+                        help='An archive directory written by '
+                        'gcn.SegmentedArchive, or VOEvent files')
+    parser.add_argument('--speed', type=float,
+                        help='Replay at this many times the original rate, '
+                        'instead of as fast as possible')
+    parser.add_argument('--handler', metavar='MODULE:NAME',
+                        type=_import_handler,
+                        help='Payload handler to call in this process')
+    parser.add_argument('--serve', metavar='HOST[:PORT]',
+                        type=HostPortType('127.0.0.1', 8099),
+                        help='Instead of calling a handler, wait for a client '
+                        'to connect to this address and send it the VOEvents')
+    parser.add_argument('--version', action='version',
+                        version='pygcn ' + __version__)
+    args = parser.parse_args(args)
+
+    if args.speed is not None and args.speed <= 0:
+        parser.error('--speed must be positive')
+    if args.serve and args.handler:
+        parser.error('--handler and --serve are mutually exclusive')
+    if len(args.source) == 1 and os.path.isdir(args.source[0]):
+        source = args.source[0]
+    else:
+        source = args.source
+
+    # Set up logger
+    logging.basicConfig(level=logging.INFO)
+
+    from . import replay, serve_replay
+    if args.serve:
+        result = serve_replay(source, host=args.serve.host,
+                              port=args.serve.port, speed=args.speed)
+    else:
+        result = replay(source, handler=args.handler, speed=args.speed)
+    print('{0} packets, {1} bytes, {2} responses in {3:.3f} s: '
+          '{4:.1f} packets/s'.format(
+              result.packets, result.bytes, result.responses, result.seconds,
+              result.packets_per_second))
+
+
 def serve_main(args=None):
     """Rudimentary GCN server, for testing purposes. Serves just one connection
     at a time, and repeats the same payloads in order, repeating, for each
-    connection."""
+    connection. With --broadcast, serves any number of connections at once and
+    sends each payload to all of them."""
 
     # Command line interface
     parser = argparse.ArgumentParser(description=__doc__)
@@ -101,14 +205,42 @@ def serve_main(args=None):
     parser.add_argument('--retransmit-timeout', '-t', metavar='SECONDS',
                         type=int, default=1,
                         help='Delay between packets (default: %(default)s)')
+    parser.add_argument('--broadcast', action='store_true',
+                        help='Serve any number of connections at once, and '
+                        'send each payload to all of them')
+    parser.add_argument('--rate', metavar='PACKETS_PER_SECOND', type=float,
+                        help='With --broadcast, number of packets to send '
+                        'per second (default: 1 / retransmit timeout)')
+    parser.add_argument('--max-buffer', metavar='BYTES', type=int,
+                        default=1 << 22,
+                        help='With --broadcast, disconnect clients that fall '
+                        'this many bytes behind (default: %(default)s)')
     parser.add_argument('payloads', nargs='+', metavar='PAYLOAD.xml')
     parser.add_argument('--version', action='version',
                         version='pygcn ' + __version__)
     args = parser.parse_args(args)
 
+    if args.broadcast:
+        if args.rate is not None:
+            rate = args.rate
+        elif args.retransmit_timeout > 0:
+            rate = 1 / args.retransmit_timeout
+        else:
+            parser.error('--broadcast requires --rate or a nonzero '
+                         '--retransmit-timeout')
+        if rate <= 0:
+            parser.error('--rate must be positive')
+    elif args.rate is not None:
+        parser.error('--rate requires --broadcast')
+
     # Set up logger
     logging.basicConfig(level=logging.INFO)
 
     # Serve GCN notices (until interrupted or killed)
-    serve(args.payloads, host=args.addr.host, port=args.addr.port,
-          retransmit_timeout=args.retransmit_timeout)
+    if args.broadcast:
+        from . import broadcast
+        broadcast(args.payloads, host=args.addr.host, port=args.addr.port,
+                  rate=rate, max_buffer=args.max_buffer)
+    else:
+        serve(args.payloads, host=args.addr.host, port=args.addr.port,
+              retransmit_timeout=args.retransmit_timeout)
@@ -0,0 +1,237 @@
+# Copyright (C) 2026  Leo Singer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+"""
+Compression of individual VOEvents with dictionaries trained per notice type.
+
+VOEvents of the same notice type share most of their text, so compressing
+each one on its own wastes most of the opportunity for compression. Against
+a dictionary made from other VOEvents of the same type, a single VOEvent
+compresses almost as well as a whole archive does, while still being
+decompressible on its own.
+"""
+
+import collections
+import struct
+import zlib
+
+from .voeventclient import _parse_header
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+__all__ = ('DictionaryCodec',)
+
+# Notice type of each record, or -1 if it was compressed without a dictionary
+_record_struct = struct.Struct('!i')
+
+# File header: magic number, backend name, number of dictionaries
+_file_magic = b'GCNDICT1'
+_file_struct = struct.Struct('!8s8sI')
+# Dictionary header: notice type, length
+_dict_struct = struct.Struct('!iI')
+
+
+def _zlib_dictionary(samples, size):
+    """Make a zlib dictionary out of sample VOEvents. zlib looks for matches
+    in the last 32 KiB of the dictionary, and matches are cheapest to encode
+    when they are close by, so the most common text should come last. Use
+    the lines that occur in the most samples, in order of increasing
+    frequency."""
+    counts = collections.Counter()
+    for sample in samples:
+        counts.update(set(sample.splitlines(True)))
+    lines = [line for line, count in counts.most_common() if count > 1]
+    if not lines:
+        lines = [line for line, _ in counts.most_common()]
+    dictionary = []
+    total = 0
+    for line in lines:
+        if total + len(line) > size:
+            break
+        dictionary.append(line)
+        total += len(line)
+    return b''.join(reversed(dictionary))
+
+
+class _ZlibBackend(object):
+
+    name = 'zlib'
+
+    def __init__(self, level):
+        self.level = 9 if level is None else level
+
+    def train(self, samples, size):
+        return _zlib_dictionary(samples, min(size, 32768))
+
+    def compress(self, data, dictionary):
+        if dictionary:
+            c = zlib.compressobj(self.level, zlib.DEFLATED, -15,
+                                 zdict=dictionary)
+        else:
+            c = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        return c.compress(data) + c.flush()
+
+    def decompress(self, data, dictionary):
+        if dictionary:
+            d = zlib.decompressobj(-15, zdict=dictionary)
+        else:
+            d = zlib.decompressobj(-15)
+        return d.decompress(data) + d.flush()
+
+
+class _ZstdBackend(object):
+
+    name = 'zstd'
+
+    def __init__(self, level):
+        if zstandard is None:
+            raise ImportError('the zstd backend requires zstandard')
+        self.level = 19 if level is None else level
+        self._compressors = {}
+        self._decompressors = {}
+
+    def train(self, samples, size):
+        try:
+            return zstandard.train_dictionary(size, samples).as_bytes()
+        except zstandard.ZstdError:
+            # Too few samples to train on; use their text as is.
+            return _zlib_dictionary(samples, size)
+
+    def _dict(self, dictionary):
+        if dictionary:
+            return zstandard.ZstdCompressionDict(dictionary)
+
+    def compress(self, data, dictionary):
+        c = self._compressors.get(dictionary)
+        if c is None:
+            c = self._compressors[dictionary] = zstandard.ZstdCompressor(
+                level=self.level, dict_data=self._dict(dictionary))
+        return c.compress(data)
+
+    def decompress(self, data, dictionary):
+        d = self._decompressors.get(dictionary)
+        if d is None:
+            d = self._decompressors[dictionary] = zstandard.ZstdDecompressor(
+                dict_data=self._dict(dictionary))
+        return d.decompress(data)
+
+
+_backends = {'zlib': _ZlibBackend, 'zstd': _ZstdBackend}
+
+
+class DictionaryCodec(object):
+    """Compress and decompress individual VOEvents, each against the
+    dictionary for its notice type.
+
+    The `dictionaries` argument maps notice types to dictionaries, which are
+    usually made with `train`. The `backend` is either ``'zstd'``, which
+    requires the zstandard package, or ``'zlib'``; by default, zstd is used if
+    it is available. VOEvents whose notice types have no dictionary are
+    compressed without one.
+
+    Pass the codec as the `codec` argument of `gcn.SegmentedArchive` to
+    compress the VOEvents in an archive, which still allows reading them one
+    at a time."""
+
+    def __init__(self, dictionaries=None, backend=None, level=None):
+        if backend is None:
+            backend = 'zlib' if zstandard is None else 'zstd'
+        if backend not in _backends:
+            raise ValueError('backend must be one of {0}'.format(
+                ', '.join(sorted(_backends))))
+        self.dictionaries = dict(dictionaries or {})
+        self._backend = _backends[backend](level)
+
+    @property
+    def backend(self):
+        return self._backend.name
+
+    @classmethod
+    def train(cls, payloads, size=16384, backend=None, level=None,
+              min_samples=4):
+        """Make a codec with a dictionary of up to `size` bytes (or 32 KiB for
+        zlib) for each notice type that occurs at least `min_samples` times in
+        `payloads`."""
+        codec = cls(backend=backend, level=level)
+        samples = collections.defaultdict(list)
+        for payload in payloads:
+            payload = bytes(payload)
+            samples[_parse_header(payload).notice_type].append(payload)
+        samples.pop(None, None)
+        for notice_type, group in samples.items():
+            if len(group) >= min_samples:
+                codec.dictionaries[notice_type] = codec._backend.train(
+                    group, size)
+        return codec
+
+    def encode(self, payload, notice_type=None):
+        """Compress a VOEvent. If the notice type is not given, it is read
+        from the payload."""
+        if notice_type is None:
+            notice_type = _parse_header(payload).notice_type
+        dictionary = self.dictionaries.get(notice_type)
+        if dictionary is None:
+            notice_type = -1
+        return _record_struct.pack(notice_type) + self._backend.compress(
+            bytes(payload), dictionary)
+
+    def decode(self, record):
+        """Decompress a VOEvent."""
+        notice_type, = _record_struct.unpack_from(record)
+        if notice_type == -1:
+            dictionary = None
+        else:
+            try:
+                dictionary = self.dictionaries[notice_type]
+            except KeyError:
+                raise ValueError(
+                    'no dictionary for notice type {0}'.format(notice_type))
+        return self._backend.decompress(
+            bytes(record[_record_struct.size:]), dictionary)
+
+    def dumps(self):
+        """Serialize the backend and dictionaries."""
+        return b''.join([_file_struct.pack(
+            _file_magic, self.backend.encode(), len(self.dictionaries))] + [
+            _dict_struct.pack(notice_type, len(dictionary)) + dictionary
+            for notice_type, dictionary in sorted(self.dictionaries.items())])
+
+    @classmethod
+    def loads(cls, data, level=None):
+        """Make a codec out of the output of `dumps`."""
+        magic, backend, count = _file_struct.unpack_from(data)
+        if magic != _file_magic:
+            raise ValueError('not a dictionary file')
+        pos = _file_struct.size
+        dictionaries = {}
+        for _ in range(count):
+            notice_type, length = _dict_struct.unpack_from(data, pos)
+            pos += _dict_struct.size
+            dictionaries[notice_type] = bytes(data[pos:pos + length])
+            pos += length
+        return cls(dictionaries, backend.rstrip(b'\0').decode(), level)
+
+    def __eq__(self, other):
+        if not isinstance(other, DictionaryCodec):
+            return NotImplemented
+        return (self.backend == other.backend and
+                self.dictionaries == other.dictionaries)
+
+    # Codecs compare equal by their dictionaries, which can still be changed
+    # (as `train` does), so they cannot be hashed.
+    __hash__ = None
@@ -0,0 +1,255 @@
+# Copyright (C) 2026  Leo Singer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+"""
+Extract fields from many VOEvents at once into columns.
+"""
+
+import calendar
+import functools
+import itertools
+import multiprocessing
+import re
+import time
+
+from lxml.etree import fromstring, XMLSyntaxError, XPath
+
+from .handlers import _get_notice_type
+
+__all__ = ('extract_columns',)
+
+_outputs = frozenset({'dict', 'numpy', 'pandas', 'arrow'})
+
+# Compiled once and shared by every payload. The STC elements in WhereWhen may
+# or may not be in a namespace, so match them by local name. Smart strings
+# would keep a reference to the whole element tree.
+_coords_xpath = XPath("WhereWhen//*[local-name()='AstroCoords']",
+                      smart_strings=False)
+_time_xpath = XPath("string(.//*[local-name()='ISOTime'])",
+                    smart_strings=False)
+_ra_xpath = XPath(
+    "string(.//*[local-name()='Position2D']//*[local-name()='C1'])",
+    smart_strings=False)
+_dec_xpath = XPath(
+    "string(.//*[local-name()='Position2D']//*[local-name()='C2'])",
+    smart_strings=False)
+_error_xpath = XPath(
+    "string(.//*[local-name()='Position2D']/*[local-name()='Error2Radius'])",
+    smart_strings=False)
+_param_xpath = XPath("What//Param[@name=$name]/@value", smart_strings=False)
+
+_fixed_columns = ('ivorn', 'notice_type', 'time', 'ra', 'dec', 'error')
+
+# Parameters that identify a trigger. They are kept as strings, like the
+# trigger numbers in `gcn.NoticeCache` and `gcn.NoticeIndex`.
+_trigger_params = ('TrigID', 'GraceID')
+
+_integer_pattern = re.compile(r'\s*[+-]?[0-9]+\s*\Z')
+
+
+def _parse_time(value):
+    """Convert an ISO 8601 time stamp in UTC to seconds since the epoch.
+    `datetime.fromisoformat` before Python 3.11 does not accept the variable
+    number of fractional digits that appear in VOEvents."""
+    value = value.strip().rstrip('Z')
+    whole, _, fraction = value.partition('.')
+    t = calendar.timegm(time.strptime(whole, '%Y-%m-%dT%H:%M:%S'))
+    if fraction:
+        t += float('.' + fraction)
+    return t
+
+
+def _float(text):
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def _position(coords):
+    """Pull the right ascension, declination, and error radius in degrees out
+    of an `AstroCoords` element. Any of them is None if it is not given."""
+    return (_float(_ra_xpath(coords)), _float(_dec_xpath(coords)),
+            _float(_error_xpath(coords)))
+
+
+def _trigger(root):
+    """Get the trigger number of a VOEvent (its `TrigID` or `GraceID`
+    parameter) as a string, or None if it does not have one."""
+    for name in _trigger_params:
+        value = _param_xpath(root, name=name)
+        if value:
+            return value[0]
+    return None
+
+
+def _extract(root):
+    """Pull the main fields out of a VOEvent: its notice type, trigger number
+    (the `TrigID` or `GraceID` parameter), event time in seconds since the
+    epoch, and right ascension, declination, and error radius in degrees. Any
+    of them is None if the VOEvent does not provide it."""
+    notice_type = _get_notice_type(root)
+    trigger = _trigger(root)
+
+    coords = _coords_xpath(root)
+    if coords:
+        coords = coords[0]
+        try:
+            event_time = _parse_time(_time_xpath(coords))
+        except ValueError:
+            event_time = None
+        ra, dec, error = _position(coords)
+    else:
+        event_time = ra = dec = error = None
+
+    return notice_type, trigger, event_time, ra, dec, error
+
+
+def _extract_row(params, payload):
+    """Extract one row of fields from a payload. All fields are None if it is
+    not well-formed XML."""
+    try:
+        root = fromstring(payload)
+    except XMLSyntaxError:
+        return (None,) * (len(_fixed_columns) + len(params))
+
+    notice_type, _, event_time, ra, dec, error = _extract(root)
+
+    values = []
+    for name in params:
+        value = _param_xpath(root, name=name)
+        values.append(value[0] if value else None)
+
+    return (root.get('ivorn'), notice_type, event_time, ra, dec,
+            error) + tuple(values)
+
+
+def _extract_rows(params, payloads):
+    return [_extract_row(params, payload) for payload in payloads]
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = [bytes(item) for item in itertools.islice(iterator, size)]
+        if not chunk:
+            return
+        yield chunk
+
+
+def _param_column(name, values):
+    """Convert a column of parameter values to ints if they all look like
+    integers, or else to floats if they all look like numbers, and otherwise
+    leave them as strings. Trigger numbers are always left as strings."""
+    if name in _trigger_params:
+        return values
+    present = [value for value in values if value is not None]
+    if all(_integer_pattern.match(value) for value in present):
+        convert = int
+    else:
+        convert = _float
+    numbers = [None if value is None else convert(value) for value in values]
+    if all(number is not None or value is None
+           for number, value in zip(numbers, values)):
+        return numbers
+    return values
+
+
+def extract_columns(payloads, params=(), output='dict', processes=None,
+                    chunksize=256):
+    """Extract fields from many VOEvents and return them as columns.
+
+    The columns are `ivorn`, `notice_type`, `time` (the event time in seconds
+    since the epoch), `ra`, `dec`, and `error` (the position and error radius
+    in degrees), followed by one column for each name in `params` holding the
+    values of the `What` parameters with that name. Parameter columns hold
+    ints if every value is an integer, floats if every value is a number, or
+    strings otherwise; `TrigID` and `GraceID` columns always hold strings,
+    because they are identifiers. There is one row for each payload, in
+    order; missing values are None in lists, NaN in float arrays, and -1 for
+    the notice type in arrays.
+
+    Parameters
+    ----------
+    payloads : iterable of bytes
+        The VOEvents, for example from `gcn.ArchiveReader.payloads`.
+    params : sequence of str, optional
+        Names of `What` parameters to extract.
+    output : str, optional
+        One of ``'dict'`` (the default) for a dictionary of lists,
+        ``'numpy'`` for a dictionary of NumPy arrays, ``'pandas'`` for a
+        `pandas.DataFrame`, or ``'arrow'`` for a `pyarrow.Table`. Each output
+        other than ``'dict'`` requires the corresponding package to be
+        installed.
+    processes : int, optional
+        If provided, parse the payloads in a pool of this many processes.
+    chunksize : int, optional
+        Number of payloads to send to a process at a time.
+    """
+    if output not in _outputs:
+        raise ValueError('output must be one of {0}'.format(
+            ', '.join(sorted(_outputs))))
+    params = tuple(params)
+    columns = _fixed_columns + params
+    extract = functools.partial(_extract_rows, params)
+
+    if processes is None:
+        rows = extract(bytes(payload) for payload in payloads)
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            rows = [row for chunk in pool.imap(
+                extract, _chunks(payloads, chunksize)) for row in chunk]
+
+    data = {name: list(values) for name, values in zip(
+        columns, zip(*rows) if rows else [()] * len(columns))}
+    for name in params:
+        data[name] = _param_column(name, data[name])
+
+    if output == 'dict':
+        return data
+    elif output == 'numpy':
+        return _to_numpy(data, params)
+    elif output == 'pandas':
+        import pandas
+        return pandas.DataFrame(_to_numpy(data, params), columns=columns)
+    else:
+        import pyarrow
+        return pyarrow.table(data)
+
+
+def _to_numpy(data, params):
+    import numpy as np
+
+    def floats(values):
+        return np.asarray([np.nan if value is None else value
+                           for value in values], dtype=float)
+
+    result = {
+        'ivorn': np.asarray(data['ivorn'], dtype=object),
+        'notice_type': np.asarray([-1 if value is None else value
+                                   for value in data['notice_type']],
+                                  dtype=int)}
+    for name in ('time', 'ra', 'dec', 'error'):
+        result[name] = floats(data[name])
+    for name in params:
+        values = data[name]
+        if values and all(isinstance(value, int) for value in values):
+            result[name] = np.asarray(values, dtype=int)
+        elif all(value is None or isinstance(value, (int, float))
+                 for value in values):
+            result[name] = floats(values)
+        else:
+            result[name] = np.asarray(values, dtype=object)
+    return result
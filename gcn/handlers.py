@@ -21,12 +21,41 @@ import functools
 import logging
 from urllib.parse import quote_plus
 
+from lxml.etree import XPath
+
 __all__ = ('get_notice_type', 'include_notice_types', 'exclude_notice_types',
-           'archive')
+           'include_sky_region', 'exclude_sky_region', 'with_notice',
+           'Dispatcher', 'archive')
+
+
+_notice_type_xpath = XPath("string(What/Param[@name='Packet_Type']/@value)")
 
 
 def get_notice_type(root):
-    return int(root.find("./What/Param[@name='Packet_Type']").attrib['value'])
+    notice_type = _get_notice_type(root)
+    if notice_type is None:
+        raise ValueError('VOEvent has no valid Packet_Type parameter')
+    return notice_type
+
+
+def _get_notice_type(root):
+    """Like `get_notice_type`, but return None if the VOEvent does not have a
+    valid `Packet_Type` parameter."""
+    try:
+        return int(_notice_type_xpath(root))
+    except ValueError:
+        return None
+
+
+def _set_accepts(handle, handler, accepts):
+    """Record which notice types a decorated handler accepts, so that
+    `gcn.listen` can skip parsing VOEvents that it would ignore anyway."""
+    inner = getattr(handler, 'accepts', None)
+    if inner is None:
+        handle.accepts = accepts
+    else:
+        handle.accepts = lambda notice_type: (
+            accepts(notice_type) and inner(notice_type))
 
 
 def include_notice_types(*notice_types):
@@ -47,7 +76,8 @@ def include_notice_types(*notice_types):
         @functools.wraps(handler)
         def handle(payload, root, *args, **kwargs):
             if get_notice_type(root) in notice_types:
-                handler(payload, root, *args, **kwargs)
+                return handler(payload, root, *args, **kwargs)
+        _set_accepts(handle, handler, notice_types.__contains__)
         return handle
     return decorate
 
@@ -71,11 +101,173 @@ def exclude_notice_types(*notice_types):
         @functools.wraps(handler)
         def handle(payload, root, *args, **kwargs):
             if get_notice_type(root) not in notice_types:
-                handler(payload, root, *args, **kwargs)
+                return handler(payload, root, *args, **kwargs)
+        _set_accepts(handle, handler,
+                     lambda notice_type: notice_type not in notice_types)
         return handle
     return decorate
 
 
+def _in_regions(get_position, root, regions, error):
+    """Return whether the position of a VOEvent is in any of the regions, or
+    None if it has no position."""
+    position = get_position(root)
+    if position is None:
+        return None
+    vector, radius = position
+    if not error:
+        radius = 0.0
+    return any(region.contains(vector, radius) for region in regions)
+
+
+def _keep_accepts(handle, handler):
+    inner = getattr(handler, 'accepts', None)
+    if inner is not None:
+        handle.accepts = inner
+
+
+def include_sky_region(*regions, error=True):
+    """Process only VOEvents whose positions are in any of the `regions`,
+    which are instances of `gcn.Cone`, `gcn.Polygon`, or `gcn.HEALPixMask`.
+    If `error` is true, then a VOEvent also counts as being in a region if any
+    part of its error circle overlaps it. VOEvents that have no position are
+    ignored. Should be used as a decorator, as in:
+
+        import gcn
+
+        @gcn.include_sky_region(gcn.Cone(83.6, 22.0, 10.0))
+        def handle(payload, root):
+            print('Got notice of an event within 10 degrees of the Crab')
+    """
+    # Imported here because gcn.regions depends on this module.
+    from .regions import get_position
+
+    def decorate(handler):
+        @functools.wraps(handler)
+        def handle(payload, root, *args, **kwargs):
+            if _in_regions(get_position, root, regions, error):
+                return handler(payload, root, *args, **kwargs)
+        _keep_accepts(handle, handler)
+        return handle
+    return decorate
+
+
+def exclude_sky_region(*regions, error=True):
+    """Process only VOEvents whose positions are not in any of the `regions`;
+    see `include_sky_region`. VOEvents that have no position are processed.
+    Should be used as a decorator, as in:
+
+        import gcn
+
+        @gcn.exclude_sky_region(gcn.Cone(266.4, -29.0, 5.0))
+        def handle(payload, root):
+            print('Got notice of an event away from the Galactic center')
+    """
+    # Imported here because gcn.regions depends on this module.
+    from .regions import get_position
+
+    def decorate(handler):
+        @functools.wraps(handler)
+        def handle(payload, root, *args, **kwargs):
+            if not _in_regions(get_position, root, regions, error):
+                return handler(payload, root, *args, **kwargs)
+        _keep_accepts(handle, handler)
+        return handle
+    return decorate
+
+
+def with_notice(handler):
+    """Adapt a handler that takes a `gcn.Notice` into a payload handler.
+    The notice is extracted from the element tree only when the handler is
+    called, and it keeps the payload. Should be used as a decorator, as in:
+
+        import gcn
+
+        @gcn.handlers.with_notice
+        def handle(notice):
+            print('Got notice', notice.ivorn, 'of type', notice.notice_type)
+    """
+    # Imported here because gcn.notice depends on this module.
+    from .notice import Notice
+
+    @functools.wraps(handler)
+    def handle(payload, root, *args, **kwargs):
+        return handler(Notice.from_root(root, payload), *args, **kwargs)
+    _keep_accepts(handle, handler)
+    return handle
+
+
+class Dispatcher(object):
+    """Payload handler that routes each VOEvent to the handlers that are
+    registered for its notice type. The notice type is looked up once per
+    VOEvent, and the handlers for it are found in a table that is built when
+    handlers are registered. Use as a decorator factory, as in:
+
+        import gcn
+        import gcn.notice_types as n
+
+        dispatcher = gcn.Dispatcher()
+
+        @dispatcher.register(n.FERMI_GBM_GND_POS, n.FERMI_GBM_FIN_POS)
+        def handle_gbm(payload, root):
+            print('Got notice of type FERMI_GBM_GND_POS or FERMI_GBM_FIN_POS')
+
+        @dispatcher.register()
+        def handle_all(payload, root):
+            print('Got a notice')
+
+        gcn.listen(handler=dispatcher)
+
+    Handlers are called in the order in which they were registered. An
+    exception in one handler is logged and does not prevent the others from
+    running."""
+
+    def __init__(self, log=None):
+        if log is None:
+            log = logging.getLogger('gcn.handlers.Dispatcher')
+        self.log = log
+        self._entries = []
+        self._table = {}
+        self._default = ()
+
+    def add(self, handler, *notice_types):
+        """Register `handler` for VOEvents whose integer GCN packet types are
+        in `notice_types`, or for all VOEvents if no notice types are
+        given."""
+        self._entries.append(
+            (handler, frozenset(notice_types) if notice_types else None))
+
+        # Rebuild the table.
+        keys = set()
+        for _, types in self._entries:
+            if types is not None:
+                keys |= types
+        self._table = {
+            key: tuple(handler for handler, types in self._entries
+                       if types is None or key in types)
+            for key in keys}
+        self._default = tuple(
+            handler for handler, types in self._entries if types is None)
+
+    def register(self, *notice_types):
+        """Decorator to register a handler; see `add`."""
+        def decorate(handler):
+            self.add(handler, *notice_types)
+            return handler
+        return decorate
+
+    def accepts(self, notice_type):
+        return bool(self._default) or notice_type in self._table
+
+    def __call__(self, payload, root):
+        handlers = self._table.get(_get_notice_type(root), self._default)
+        for handler in handlers:
+            try:
+                handler(payload, root)
+            except:  # noqa: E722
+                self.log.exception("exception in payload handler")
+
+
 def archive(payload, root):
     """Payload handler that archives VOEvent messages as files in the current
     working directory. The filename is a URL-escaped version of the messages'
@@ -0,0 +1,234 @@
+# Copyright (C) 2026  Leo Singer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+"""
+Metrics for monitoring `gcn.listen`.
+"""
+
+import bisect
+import collections
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+
+__all__ = ('Metrics', 'InMemoryMetrics', 'serve_metrics')
+
+
+class Metrics(object):
+    """Interface for collecting metrics from `gcn.listen`. Pass an instance
+    as the `metrics` argument of `gcn.listen`, which calls these methods at
+    the corresponding points. The methods of this base class do nothing;
+    subclasses may override any of them."""
+
+    def connected(self, host, port):
+        """Called after connecting to a server. In redundant mode, there may
+        be several connections open at once."""
+
+    def disconnected(self, host, port):
+        """Called after closing the connection to a server."""
+
+    def received(self, nbytes):
+        """Called after receiving a packet of `nbytes` bytes, including the
+        length prefix."""
+
+    def parsed(self, seconds):
+        """Called after parsing a packet, with the time that it took."""
+
+    def sent(self, seconds):
+        """Called after sending an ack or iamalive response, with the time
+        that it took."""
+
+    def iamalive(self):
+        """Called after receiving an iamalive message."""
+
+    def handled(self, seconds, exception=None):
+        """Called after the handler returns or raises, with the time that it
+        took and the exception that it raised, if any. If `gcn.listen` runs
+        the handler in a `gcn.WorkerPool` or `gcn.ShardedProcessPool`, then
+        this is only the time that it took to queue the payload."""
+
+
+class _Histogram(object):
+    """Histogram with fixed bucket upper bounds."""
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class InMemoryMetrics(Metrics):
+    """Metrics that are kept as counters and histograms in memory. Read them
+    with `snapshot` or `prometheus_text`, or serve them over HTTP with
+    `serve_metrics`."""
+
+    # Histogram bucket upper bounds in seconds, from 10 us to 10 s.
+    bounds = tuple(m * 10.0 ** e for e in range(-5, 1) for m in (1, 2.5, 5))
+    bounds += (10.0,)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        #: Number of open connections to each server, by (host, port).
+        self.connections = collections.Counter()
+        self.last_iamalive = None
+        self.counters = dict.fromkeys(
+            ['connects', 'disconnects', 'packets', 'bytes', 'iamalives',
+             'handler_exceptions'], 0)
+        self.histograms = {
+            key: _Histogram(self.bounds)
+            for key in ['parse_seconds', 'send_seconds', 'handler_seconds']}
+
+    def connected(self, host, port):
+        with self._lock:
+            self.counters['connects'] += 1
+            self.connections[host, port] += 1
+
+    def disconnected(self, host, port):
+        with self._lock:
+            self.counters['disconnects'] += 1
+            self.connections[host, port] -= 1
+
+    def received(self, nbytes):
+        with self._lock:
+            self.counters['packets'] += 1
+            self.counters['bytes'] += nbytes
+
+    def parsed(self, seconds):
+        with self._lock:
+            self.histograms['parse_seconds'].observe(seconds)
+
+    def sent(self, seconds):
+        with self._lock:
+            self.histograms['send_seconds'].observe(seconds)
+
+    def iamalive(self):
+        with self._lock:
+            self.counters['iamalives'] += 1
+            self.last_iamalive = time.monotonic()
+
+    def handled(self, seconds, exception=None):
+        with self._lock:
+            self.histograms['handler_seconds'].observe(seconds)
+            if exception is not None:
+                self.counters['handler_exceptions'] += 1
+
+    def seconds_since_iamalive(self):
+        """Time since the last iamalive message, or None if there has not
+        been one yet."""
+        if self.last_iamalive is None:
+            return None
+        return time.monotonic() - self.last_iamalive
+
+    def snapshot(self):
+        """Return a dictionary of the current values of all metrics."""
+        with self._lock:
+            result = dict(self.counters)
+            for key, histogram in self.histograms.items():
+                result[key] = dict(count=histogram.count, sum=histogram.sum,
+                                   buckets=list(histogram.counts))
+            # Servers that were connected once stay in the snapshot with a
+            # count of 0, so that the Prometheus gauge does not vanish.
+            result['connections'] = dict(self.connections)
+            result['connected'] = sum(self.connections.values())
+        result['seconds_since_iamalive'] = self.seconds_since_iamalive()
+        return result
+
+    def prometheus_text(self):
+        """Return the current values of all metrics in the Prometheus text
+        exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+
+        def add(name, kind, help, value):
+            lines.append('# HELP gcn_{0} {1}'.format(name, help))
+            lines.append('# TYPE gcn_{0} {1}'.format(name, kind))
+            lines.append('gcn_{0} {1}'.format(name, value))
+
+        add('connects_total', 'counter', 'Connections made.',
+            snapshot['connects'])
+        add('disconnects_total', 'counter', 'Connections closed.',
+            snapshot['disconnects'])
+        add('connections', 'gauge', 'Number of open connections.',
+            snapshot['connected'])
+        lines.append('# HELP gcn_connected Whether there is a connection to '
+                     'a server now.')
+        lines.append('# TYPE gcn_connected gauge')
+        for (host, port), count in sorted(snapshot['connections'].items()):
+            lines.append('gcn_connected{{host="{0}",port="{1}"}} {2}'.format(
+                host, port, int(count > 0)))
+        add('received_packets_total', 'counter', 'Packets received.',
+            snapshot['packets'])
+        add('received_bytes_total', 'counter', 'Bytes received.',
+            snapshot['bytes'])
+        add('iamalives_total', 'counter', 'Iamalive messages received.',
+            snapshot['iamalives'])
+        add('handler_exceptions_total', 'counter',
+            'Exceptions raised by the handler.',
+            snapshot['handler_exceptions'])
+        if snapshot['seconds_since_iamalive'] is not None:
+            add('seconds_since_iamalive', 'gauge',
+                'Time since the last iamalive message.',
+                snapshot['seconds_since_iamalive'])
+
+        for name, help in [
+                ('parse_seconds', 'Time to parse a packet.'),
+                ('send_seconds', 'Time to send a response.'),
+                ('handler_seconds', 'Time spent in the handler.')]:
+            histogram = snapshot[name]
+            lines.append('# HELP gcn_{0} {1}'.format(name, help))
+            lines.append('# TYPE gcn_{0} histogram'.format(name))
+            cumulative = 0
+            for bound, count in zip(self.bounds + ('+Inf',),
+                                    histogram['buckets']):
+                cumulative += count
+                lines.append('gcn_{0}_bucket{{le="{1}"}} {2}'.format(
+                    name, bound, cumulative))
+            lines.append('gcn_{0}_sum {1}'.format(name, histogram['sum']))
+            lines.append('gcn_{0}_count {1}'.format(name, histogram['count']))
+
+        return '\n'.join(lines) + '\n'
+
+
+def serve_metrics(metrics, host='127.0.0.1', port=9099):
+    """Serve an `InMemoryMetrics` instance in the Prometheus text format over
+    HTTP from a background thread. Return the `http.server.HTTPServer`; call
+    its `shutdown` method to stop it."""
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            body = metrics.prometheus_text().encode('UTF-8')
+            self.send_response(200)
+            self.send_header('Content-Type',
+                             'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    thread = threading.Thread(target=server.serve_forever,
+                              name='gcn-metrics')
+    thread.daemon = True
+    thread.start()
+    return server
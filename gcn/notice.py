@@ -0,0 +1,103 @@
+# Copyright (C) 2026  Leo Singer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+"""
+Compact records of GCN notices.
+"""
+
+from lxml.etree import fromstring
+
+from .extract import _extract, _parse_time
+
+__all__ = ('Notice',)
+
+
+class Notice(object):
+    """Immutable record of the main fields of a GCN notice: its IVORN, notice
+    type, role, trigger number (the `TrigID` or `GraceID` parameter), event
+    time and issue time (the `Who/Date` element) in seconds since the epoch,
+    and position and error radius in degrees. Fields other than the IVORN
+    are None if the VOEvent does not provide them.
+
+    The raw payload may be kept too, so that the full document can be parsed
+    again with `parse`, but the element tree is not. A notice uses much less
+    memory than an element tree and can be pickled, so it is a good thing to
+    keep in caches and queues or to send to other processes.
+
+    Create one from an element tree with `from_root`, or use the
+    `gcn.handlers.with_notice` decorator to write handlers that take a
+    notice instead of a payload and element tree."""
+
+    __slots__ = ('ivorn', 'notice_type', 'role', 'trigger', 'time', 'date',
+                 'ra', 'dec', 'error', 'payload')
+
+    def __init__(self, ivorn, notice_type=None, role=None, trigger=None,
+                 time=None, date=None, ra=None, dec=None, error=None,
+                 payload=None):
+        for name, value in zip(self.__slots__, (
+                ivorn, notice_type, role, trigger, time, date, ra, dec, error,
+                payload)):
+            object.__setattr__(self, name, value)
+
+    @classmethod
+    def from_root(cls, root, payload=None):
+        """Extract a notice from the root element of a VOEvent, optionally
+        keeping the payload."""
+        notice_type, trigger, event_time, ra, dec, error = _extract(root)
+        try:
+            date = _parse_time(root.findtext('./Who/Date'))
+        except (AttributeError, ValueError):
+            date = None
+        if payload is not None:
+            payload = bytes(payload)
+        return cls(root.get('ivorn'), notice_type, root.get('role'), trigger,
+                   event_time, date, ra, dec, error, payload)
+
+    @classmethod
+    def from_payload(cls, payload):
+        """Parse a payload and extract a notice from it, keeping the
+        payload."""
+        return cls.from_root(fromstring(payload), payload)
+
+    def parse(self):
+        """Parse the payload again and return the root element."""
+        if self.payload is None:
+            raise ValueError('the payload was not kept')
+        return fromstring(self.payload)
+
+    def _astuple(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Notice is immutable')
+
+    def __delattr__(self, name):
+        raise AttributeError('Notice is immutable')
+
+    def __reduce__(self):
+        return type(self), self._astuple()
+
+    def __eq__(self, other):
+        if not isinstance(other, Notice):
+            return NotImplemented
+        return self._astuple() == other._astuple()
+
+    def __hash__(self):
+        return hash(self._astuple())
+
+    def __repr__(self):
+        return 'Notice({0})'.format(', '.join(
+            '{0}={1!r}'.format(name, getattr(self, name))
+            for name in self.__slots__[:-1]))
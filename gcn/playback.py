@@ -0,0 +1,197 @@
+# Copyright (C) 2026  Leo Singer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+"""
+Replay archived VOEvents through payload handlers, for backtesting.
+"""
+
+import collections
+import logging
+import socket
+import threading
+import time
+
+from lxml.etree import fromstring, XMLSyntaxError
+
+from .extract import _parse_time
+from .store import ArchiveReader
+from .voeventclient import _dispatch, _recv_packet, _send_packet
+
+__all__ = ('replay', 'serve_replay', 'ReplayResult')
+
+
+class ReplayResult(collections.namedtuple(
+        'ReplayResult', 'packets bytes responses seconds')):
+    """Summary of a replay: the number of packets and bytes replayed, the
+    number of responses (acks) that they produced, and the elapsed time."""
+
+    __slots__ = ()
+
+    @property
+    def packets_per_second(self):
+        return self.packets / self.seconds if self.seconds else float('inf')
+
+
+def _timestamped(source):
+    """Iterate over (time stamp, payload) pairs from a replay source. The time
+    stamp is None if it is not known."""
+    if isinstance(source, str):
+        source = ArchiveReader(source)
+    if isinstance(source, ArchiveReader):
+        for entry in source:
+            yield entry.timestamp, source.read(entry)
+        return
+    for item in source:
+        if isinstance(item, tuple):
+            yield item
+        elif isinstance(item, (bytes, bytearray, memoryview)):
+            yield None, item
+        else:
+            # A file name
+            with open(item, 'rb') as f:
+                yield None, f.read()
+
+
+def _event_date(payload):
+    """Get the time stamp in the `Who/Date` element of a VOEvent, or None."""
+    try:
+        return _parse_time(fromstring(payload).findtext('./Who/Date'))
+    except (AttributeError, ValueError, XMLSyntaxError):
+        return None
+
+
+def _paced(source, speed):
+    """Iterate over the payloads from a replay source. If `speed` is not None,
+    wait between payloads so that they come out at `speed` times the rate at
+    which they originally arrived; VOEvents that do not have time stamps are
+    timed by their `Who/Date` elements."""
+    first = None
+    for timestamp, payload in _timestamped(source):
+        if speed is not None:
+            if timestamp is None:
+                timestamp = _event_date(payload)
+            if timestamp is not None:
+                if first is None:
+                    first = timestamp
+                    start = time.monotonic()
+                else:
+                    delay = (start + (timestamp - first) / speed -
+                             time.monotonic())
+                    if delay > 0:
+                        time.sleep(delay)
+        yield payload
+
+
+def replay(source, handler=None, speed=None,
+           ivorn="ivo://python_voeventclient/anonymous", log=None):
+    """Feed VOEvents to `handler` in this process, through the same code that
+    `gcn.listen` uses to act on packets that it receives, and return a
+    `ReplayResult` when they run out.
+
+    The `source` may be the path of an archive directory written by
+    `gcn.SegmentedArchive`, a `gcn.ArchiveReader`, or an iterable of payloads,
+    file names, or (time stamp, payload) tuples, where the time stamp is in
+    seconds since the epoch.
+
+    If `speed` is None, replay the VOEvents as fast as possible. Otherwise,
+    space them out in time as they originally arrived, sped up by a factor of
+    `speed`; for example, 1 is real time and 3600 replays an hour per
+    second."""
+    if log is None:
+        log = logging.getLogger('gcn.replay')
+
+    packets = nbytes = responses = 0
+    start = time.perf_counter()
+    for payload in _paced(source, speed):
+        packets += 1
+        nbytes += len(payload)
+        try:
+            responses += _dispatch(payload, None, ivorn, handler, log)
+        except XMLSyntaxError:
+            log.warning("XML syntax error")
+    result = ReplayResult(packets, nbytes, responses,
+                          time.perf_counter() - start)
+    log.info("replayed %d packets in %.3f s (%.1f packets/s)",
+             result.packets, result.seconds, result.packets_per_second)
+    return result
+
+
+def serve_replay(source, host='127.0.0.1', port=8099, speed=None,
+                 timeout=150, log=None):
+    """Wait for one client (such as `gcn.listen`) to connect, send it the
+    VOEvents from `source` over the VOEvent Transport Protocol, and return a
+    `ReplayResult` once the client has responded to all of them and closed the
+    connection. Give up if the client does not respond within `timeout`
+    seconds after the last VOEvent is sent. The `source` and `speed` arguments
+    are the same as for `replay`."""
+    if log is None:
+        log = logging.getLogger('gcn.replay')
+
+    sock = socket.socket()
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+        sock.listen(1)
+        log.info("bound to %s:%d", *sock.getsockname()[:2])
+        conn, addr = sock.accept()
+    finally:
+        sock.close()
+    log.info("connected to %s:%d", *addr[:2])
+    conn.settimeout(timeout)
+
+    counts = [0, 0]
+
+    def send():
+        try:
+            for payload in _paced(source, speed):
+                _send_packet(conn, payload)
+                counts[0] += 1
+                counts[1] += len(payload)
+        except socket.error:
+            log.exception("error communicating with peer")
+        finally:
+            # The client closes the connection after responding to the last
+            # packet, because it reads packets and responds in order.
+            try:
+                conn.shutdown(socket.SHUT_WR)
+            except socket.error:
+                pass
+
+    responses = 0
+    start = time.perf_counter()
+    thread = threading.Thread(target=send, name='gcn-replay')
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            try:
+                _recv_packet(conn)
+            except socket.timeout:
+                # There may be long gaps between packets when pacing them.
+                if thread.is_alive():
+                    continue
+                raise
+            except socket.error:
+                break
+            responses += 1
+    finally:
+        thread.join()
+        conn.close()
+
+    result = ReplayResult(counts[0], counts[1], responses,
+                          time.perf_counter() - start)
+    log.info("replayed %d packets in %.3f s (%.1f packets/s)",
+             result.packets, result.seconds, result.packets_per_second)
+    return result
@@ -0,0 +1,221 @@
+# Copyright (C) 2026  Leo Singer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+"""
+Searchable index of VOEvents.
+"""
+
+import collections
+import datetime
+import logging
+import math
+import sqlite3
+import threading
+
+from .extract import _extract, _parse_time
+
+__all__ = ('NoticeIndex', 'IndexedNotice')
+
+IndexedNotice = collections.namedtuple(
+    'IndexedNotice', 'ivorn notice_type trigger time ra dec error payload')
+IndexedNotice.__doc__ = """A VOEvent found in a `NoticeIndex`. The time is the
+event time in seconds since the epoch. The right ascension, declination, and
+error radius are in degrees. Any of the fields other than the IVORN and the
+payload may be None if the VOEvent does not provide it."""
+
+_schema = """
+CREATE TABLE IF NOT EXISTS notices (
+    ivorn TEXT PRIMARY KEY,
+    notice_type INTEGER,
+    trigger TEXT,
+    time REAL,
+    ra REAL,
+    dec REAL,
+    error REAL,
+    payload BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS notices_type_time ON notices (notice_type, time);
+CREATE INDEX IF NOT EXISTS notices_time ON notices (time);
+CREATE INDEX IF NOT EXISTS notices_trigger ON notices (trigger, time);
+CREATE INDEX IF NOT EXISTS notices_dec ON notices (dec);
+"""
+
+_columns = ', '.join(IndexedNotice._fields)
+
+
+def _to_seconds(value):
+    """Convert a `datetime.datetime`, ISO 8601 string, or number of seconds
+    since the epoch to seconds since the epoch."""
+    if value is None:
+        return None
+    elif isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return value.timestamp()
+    elif isinstance(value, str):
+        return _parse_time(value)
+    else:
+        return float(value)
+
+
+def _angular_distance(ra1, dec1, ra2, dec2):
+    """Great-circle distance in degrees, by the haversine formula."""
+    ra1, dec1, ra2, dec2 = map(math.radians, (ra1, dec1, ra2, dec2))
+    a = (math.sin(0.5 * (dec2 - dec1)) ** 2 +
+         math.cos(dec1) * math.cos(dec2) * math.sin(0.5 * (ra2 - ra1)) ** 2)
+    return math.degrees(2 * math.asin(min(1.0, math.sqrt(a))))
+
+
+class NoticeIndex(object):
+    """Payload handler that stores each VOEvent in an SQLite database at
+    `path`, along with its notice type, trigger number (the `TrigID` or
+    `GraceID` parameter), event time, sky position, and error radius, which
+    are extracted once when the VOEvent arrives. The database is indexed so
+    that `query` and `latest` can find VOEvents by any of these fields without
+    parsing them again.
+
+    Pass `path=':memory:'` for a database that is not saved to disk."""
+
+    def __init__(self, path='notices.sqlite', log=None):
+        if log is None:
+            log = logging.getLogger('gcn.query')
+        self.path = path
+        self.log = log
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        if path != ':memory:':
+            self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.executescript(_schema)
+
+    def __call__(self, payload, root):
+        self.add(payload, root)
+
+    def add(self, payload, root):
+        """Add a VOEvent to the index, replacing any VOEvent with the same
+        IVORN."""
+        ivorn = root.attrib['ivorn']
+        row = (ivorn,) + _extract(root) + (bytes(payload),)
+        with self._lock, self._db:
+            self._db.execute(
+                'INSERT OR REPLACE INTO notices ({0}) VALUES '
+                '(?, ?, ?, ?, ?, ?, ?, ?)'.format(_columns), row)
+        self.log.info("indexed %s", ivorn)
+
+    def query(self, notice_types=None, start=None, end=None, trigger=None,
+              cone=None, limit=None, descending=False):
+        """Find VOEvents, in order of event time.
+
+        Parameters
+        ----------
+        notice_types : int or sequence of int, optional
+            Return only VOEvents of these notice types.
+        start, end : float, str, or datetime.datetime, optional
+            Return only VOEvents with event times in the half-open interval
+            [start, end), given in seconds since the epoch, as ISO 8601
+            strings, or as `datetime.datetime` objects (naive ones are taken
+            to be in UTC).
+        trigger : str, optional
+            Return only VOEvents with this trigger number.
+        cone : tuple, optional
+            A tuple of (RA, Dec, radius) in degrees. Return only VOEvents
+            whose positions are within the cone.
+        limit : int, optional
+            Return at most this many VOEvents.
+        descending : bool, optional
+            Return the latest VOEvents first.
+
+        Returns
+        -------
+        list of `IndexedNotice`
+        """
+        clauses = []
+        params = []
+        if notice_types is not None:
+            if isinstance(notice_types, int):
+                notice_types = [notice_types]
+            notice_types = [int(t) for t in notice_types]
+            clauses.append('notice_type IN ({0})'.format(
+                ', '.join('?' * len(notice_types))))
+            params.extend(notice_types)
+        if start is not None:
+            clauses.append('time >= ?')
+            params.append(_to_seconds(start))
+        if end is not None:
+            clauses.append('time < ?')
+            params.append(_to_seconds(end))
+        if trigger is not None:
+            clauses.append('trigger = ?')
+            params.append(str(trigger))
+        if cone is not None:
+            # Narrow the search with the index on declination, and then test
+            # the exact distance below.
+            ra, dec, radius = cone
+            clauses.append('dec BETWEEN ? AND ?')
+            params.extend([dec - radius, dec + radius])
+
+        sql = 'SELECT {0} FROM notices'.format(_columns)
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY time {0}, rowid {0}'.format(
+            'DESC' if descending else 'ASC')
+        if limit is not None and cone is None:
+            sql += ' LIMIT {0:d}'.format(limit)
+
+        with self._lock:
+            cursor = self._db.execute(sql, params)
+            result = []
+            for row in cursor:
+                notice = IndexedNotice(*row)
+                if cone is not None and (
+                        notice.ra is None or _angular_distance(
+                            ra, dec, notice.ra, notice.dec) > radius):
+                    continue
+                result.append(notice)
+                if limit is not None and len(result) >= limit:
+                    break
+            cursor.close()
+        return result
+
+    def latest(self, notice_types=None, trigger=None):
+        """Return the VOEvent with the latest event time that matches the
+        given notice types and trigger number, or None if there is none."""
+        result = self.query(notice_types=notice_types, trigger=trigger,
+                            limit=1, descending=True)
+        return result[0] if result else None
+
+    def __getitem__(self, ivorn):
+        """Return the payload of the VOEvent with the given IVORN."""
+        with self._lock:
+            row = self._db.execute(
+                'SELECT payload FROM notices WHERE ivorn = ?',
+                (ivorn,)).fetchone()
+        if row is None:
+            raise KeyError(ivorn)
+        return row[0]
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute(
+                'SELECT COUNT(*) FROM notices').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,221 @@
+# Copyright (C) 2026  Leo Singer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+"""
+Choose which server to connect to, and when.
+"""
+
+import errno
+import logging
+import math
+import random
+import selectors
+import socket
+import time
+
+__all__ = ('ReconnectScheduler', 'HostHealth')
+
+# Weight of the newest sample in exponentially weighted moving averages.
+_alpha = 0.5
+
+
+def _average(old, new):
+    return new if old is None else _alpha * new + (1 - _alpha) * old
+
+
+class HostHealth(object):
+    """Connection history of one server, used by `ReconnectScheduler`."""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        #: Number of consecutive failed connection attempts.
+        self.consecutive_failures = 0
+        #: Count of failed attempts that decays by half after each success.
+        self.recent_failures = 0.0
+        #: Moving average of the time to connect, in seconds.
+        self.latency = None
+        #: Moving average of how long connections lasted, in seconds.
+        self.uptime = None
+        #: Time (from `time.monotonic`) before which not to try again.
+        self.retry_at = 0.0
+        self.connected_at = None
+
+    @property
+    def score(self):
+        """Health score; lower is better. It is the number of recent failures,
+        plus the connection latency in seconds, minus the average uptime as a
+        fraction of an hour."""
+        return (self.recent_failures + (self.latency or 0.0) -
+                min(self.uptime or 0.0, 3600.0) / 3600.0)
+
+    def __repr__(self):
+        return '<HostHealth {0}:{1} score={2:.3f}>'.format(
+            self.host, self.port, self.score)
+
+
+class ReconnectScheduler(object):
+    """Connect to whichever of several servers answers first, keeping track of
+    the health of each one.
+
+    After each failed attempt to connect to a server, it is not tried again
+    for a time that starts at `min_backoff` seconds and doubles with each
+    consecutive failure up to `max_backoff` seconds, scaled by a random
+    factor between 0.5 and 1 so that many clients do not all retry at once.
+
+    The servers that are not backing off are tried in order of their health
+    scores. Like the "happy eyeballs" algorithm, if the first attempt has not
+    succeeded within `stagger` seconds, the next server is tried without
+    abandoning the first one, and so on; the first connection to be
+    established wins and the others are closed. Attempts time out after
+    `timeout` seconds, which is also set as the timeout of the returned
+    socket."""
+
+    def __init__(self, hosts_ports, timeout=150, min_backoff=0.25,
+                 max_backoff=1024, stagger=0.25, log=None):
+        if log is None:
+            log = logging.getLogger('gcn.reconnect')
+        self.hosts = [HostHealth(host, port) for host, port in hosts_ports]
+        if not self.hosts:
+            raise ValueError('at least one host is required')
+        self.timeout = timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        # Number of doublings after which the backoff reaches its maximum.
+        # Stopping there keeps 2 ** n from overflowing in a long outage.
+        if 0 < min_backoff < max_backoff:
+            self._max_doublings = math.ceil(
+                math.log2(max_backoff / min_backoff))
+        else:
+            self._max_doublings = 0
+        self.stagger = stagger
+        self.log = log
+
+    def _failed(self, health, now):
+        health.consecutive_failures += 1
+        health.recent_failures += 1
+        backoff = min(self.max_backoff, self.min_backoff * 2 ** min(
+            health.consecutive_failures - 1, self._max_doublings))
+        backoff *= random.uniform(0.5, 1.0)
+        health.retry_at = now + backoff
+        self.log.warning('could not connect to %s:%d, will retry in %.3g '
+                         'seconds', health.host, health.port, backoff)
+
+    def _succeeded(self, health, now, latency):
+        health.consecutive_failures = 0
+        health.recent_failures *= 0.5
+        health.latency = _average(health.latency, latency)
+        health.retry_at = 0.0
+        health.connected_at = now
+        self.log.info("connected to %s:%d", health.host, health.port)
+
+    def disconnected(self, health):
+        """Record that the connection to a server has been closed."""
+        if health.connected_at is not None:
+            health.uptime = _average(
+                health.uptime, time.monotonic() - health.connected_at)
+            health.connected_at = None
+
+    def connect(self):
+        """Connect to a server, waiting as long as it takes. Return the
+        connected socket and the `HostHealth` of the server."""
+        while True:
+            now = time.monotonic()
+            ready = sorted((health for health in self.hosts
+                            if health.retry_at <= now),
+                           key=lambda health: health.score)
+            if not ready:
+                time.sleep(min(health.retry_at for health in self.hosts) -
+                           now)
+                continue
+            result = self._race(ready)
+            if result is not None:
+                return result
+
+    def _race(self, candidates):
+        """Try to connect to each of the candidates in turn, staggered in
+        time, and return the first socket to connect and its `HostHealth`, or
+        None if they all fail."""
+        candidates = list(candidates)
+        pending = {}
+        next_start = time.monotonic()
+
+        with selectors.DefaultSelector() as selector:
+            try:
+                while candidates or pending:
+                    now = time.monotonic()
+                    if candidates and (not pending or now >= next_start):
+                        health = candidates.pop(0)
+                        sock = self._start(health, now)
+                        if sock is not None:
+                            selector.register(sock, selectors.EVENT_WRITE)
+                            pending[sock] = (health, now)
+                            next_start = now + self.stagger
+                        continue
+
+                    deadlines = [start + self.timeout
+                                 for _, start in pending.values()]
+                    if candidates:
+                        deadlines.append(next_start)
+                    timeout = max(0.0, min(deadlines) - now)
+
+                    for key, _ in selector.select(timeout):
+                        sock = key.fileobj
+                        health, start = pending.pop(sock)
+                        selector.unregister(sock)
+                        now = time.monotonic()
+                        err = sock.getsockopt(
+                            socket.SOL_SOCKET, socket.SO_ERROR)
+                        if err:
+                            sock.close()
+                            self._failed(health, now)
+                        else:
+                            sock.settimeout(self.timeout)
+                            self._succeeded(health, now, now - start)
+                            return sock, health
+
+                    now = time.monotonic()
+                    for sock, (health, start) in list(pending.items()):
+                        if now - start >= self.timeout:
+                            del pending[sock]
+                            selector.unregister(sock)
+                            sock.close()
+                            self._failed(health, now)
+            finally:
+                for sock in pending:
+                    sock.close()
+        return None
+
+    def _start(self, health, now):
+        """Start a non-blocking connection attempt. Return the socket, or None
+        if the attempt failed right away."""
+        try:
+            sock = socket.socket()
+        except socket.error:
+            self.log.exception("could not open socket")
+            self._failed(health, now)
+            return None
+        sock.setblocking(False)
+        try:
+            err = sock.connect_ex((health.host, health.port))
+        except socket.error:
+            # For example, the host name could not be resolved.
+            err = -1
+        if err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EAGAIN):
+            sock.close()
+            self._failed(health, now)
+            return None
+        self.log.debug("connecting to %s:%d", health.host, health.port)
+        return sock
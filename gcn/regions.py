@@ -0,0 +1,173 @@
+# Copyright (C) 2026  Leo Singer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+"""
+Sky regions for filtering VOEvents by position.
+
+The geometry of each region is worked out when it is created, so that testing
+whether a position is inside it takes only a few dot products. Positions are
+unit vectors, as returned by `get_position`, and angles are in degrees.
+"""
+
+import math
+
+from .extract import _coords_xpath, _position
+
+__all__ = ('Cone', 'Polygon', 'HEALPixMask', 'get_position')
+
+
+def _unit_vector(ra, dec):
+    ra = math.radians(ra)
+    dec = math.radians(dec)
+    cos_dec = math.cos(dec)
+    return (cos_dec * math.cos(ra), cos_dec * math.sin(ra), math.sin(dec))
+
+
+def _dot(a, b):
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+
+def _cross(a, b):
+    return (a[1] * b[2] - a[2] * b[1],
+            a[2] * b[0] - a[0] * b[2],
+            a[0] * b[1] - a[1] * b[0])
+
+
+def _normalize(a):
+    norm = math.sqrt(_dot(a, a))
+    return (a[0] / norm, a[1] / norm, a[2] / norm)
+
+
+def _angle(a, b):
+    """Angle between two unit vectors in radians."""
+    c = _cross(a, b)
+    return math.atan2(math.sqrt(_dot(c, c)), _dot(a, b))
+
+
+def get_position(root):
+    """Get the position of a VOEvent from its `WhereWhen` section. Return a
+    tuple of a unit vector and the error radius in degrees (0 if it is not
+    given), or None if the VOEvent does not have a position."""
+    coords = _coords_xpath(root)
+    if not coords:
+        return None
+    ra, dec, error = _position(coords[0])
+    if ra is None or dec is None:
+        return None
+    return _unit_vector(ra, dec), error or 0.0
+
+
+class Cone(object):
+    """Circle of the given `radius` around the point (`ra`, `dec`)."""
+
+    def __init__(self, ra, dec, radius):
+        self.ra = ra
+        self.dec = dec
+        self.radius = radius
+        self._center = _unit_vector(ra, dec)
+        self._cos_radius = math.cos(math.radians(radius))
+
+    def contains(self, vector, error=0.0):
+        """Return whether a position, or any part of its error circle, is in
+        the region."""
+        if error:
+            cos_radius = math.cos(math.radians(min(180, self.radius + error)))
+        else:
+            cos_radius = self._cos_radius
+        return _dot(vector, self._center) >= cos_radius
+
+    def __repr__(self):
+        return 'Cone({0!r}, {1!r}, {2!r})'.format(
+            self.ra, self.dec, self.radius)
+
+
+class Polygon(object):
+    """Convex spherical polygon with the given `vertices`, a sequence of
+    (RA, Dec) tuples, in either winding order. The edges are great-circle
+    arcs."""
+
+    def __init__(self, vertices):
+        if len(vertices) < 3:
+            raise ValueError('a polygon must have at least 3 vertices')
+        self.vertices = [tuple(vertex) for vertex in vertices]
+        self._points = [_unit_vector(*vertex) for vertex in self.vertices]
+        self._edges = [
+            (a, b, _normalize(_cross(a, b))) for a, b in
+            zip(self._points, self._points[1:] + self._points[:1])]
+
+        # Orient the edge normals to point into the polygon.
+        center = _normalize(tuple(map(sum, zip(*self._points))))
+        self._normals = [normal for _, _, normal in self._edges]
+        if _dot(center, self._normals[0]) < 0:
+            self._normals = [tuple(-x for x in n) for n in self._normals]
+
+    @staticmethod
+    def _distance_to_edge(vector, a, b, normal):
+        """Angular distance in radians from a point to the great-circle arc
+        from `a` to `b`, where `normal` is the unit vector along a x b."""
+        projected = _cross(_cross(normal, vector), normal)
+        if (_dot(_cross(a, projected), normal) >= 0 and
+                _dot(_cross(projected, b), normal) >= 0):
+            return abs(math.asin(max(-1.0, min(1.0, _dot(vector, normal)))))
+        return min(_angle(vector, a), _angle(vector, b))
+
+    def contains(self, vector, error=0.0):
+        """Return whether a position, or any part of its error circle, is in
+        the region."""
+        if all(_dot(vector, normal) >= 0 for normal in self._normals):
+            return True
+        if error:
+            error = math.radians(error)
+            return any(self._distance_to_edge(vector, *edge) <= error
+                       for edge in self._edges)
+        return False
+
+    def __repr__(self):
+        return 'Polygon({0!r})'.format(self.vertices)
+
+
+class HEALPixMask(object):
+    """Region made of the HEALPix pixels whose indices are in `pixels` at
+    resolution `nside`, in the nested ordering if `nest` is true and in the
+    ring ordering otherwise. Requires healpy.
+
+    To make a region out of a boolean HEALPix map `mask`, use:
+
+        HEALPixMask(numpy.flatnonzero(mask), healpy.npix2nside(len(mask)))
+    """
+
+    def __init__(self, pixels, nside, nest=False):
+        import healpy
+        self._healpy = healpy
+        self.nside = nside
+        self.nest = nest
+        self.pixels = frozenset(int(pixel) for pixel in pixels)
+
+    def contains(self, vector, error=0.0):
+        """Return whether a position, or any part of its error circle, is in
+        the region."""
+        pixel = int(self._healpy.vec2pix(self.nside, *vector, nest=self.nest))
+        if pixel in self.pixels:
+            return True
+        if error:
+            return not self.pixels.isdisjoint(
+                int(pixel) for pixel in self._healpy.query_disc(
+                    self.nside, vector, math.radians(error), inclusive=True,
+                    nest=self.nest))
+        return False
+
+    def __repr__(self):
+        return 'HEALPixMask(<{0} pixels>, {1!r}, nest={2!r})'.format(
+            len(self.pixels), self.nside, self.nest)
@@ -0,0 +1,397 @@
+# Copyright (C) 2026  Leo Singer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+"""
+VOEvent Transport Protocol server that broadcasts to many subscribers at once.
+"""
+
+import collections
+import logging
+import os
+import selectors
+import socket
+import stat
+import threading
+import time
+
+from lxml.etree import fromstring, XMLSyntaxError
+
+from .voeventclient import (
+    _form_response, _get_now_iso8601, _size_len, _size_struct, listen)
+
+__all__ = ('Broadcaster', 'broadcast', 'Relay')
+
+
+class _Subscriber(object):
+    """State of one connected subscriber."""
+
+    def __init__(self, sock, addr):
+        self.sock = sock
+        self.addr = addr
+        self.outgoing = collections.deque()
+        self.buffered = 0
+        self.incoming = bytearray()
+        self.responses = 0
+        self.acks = 0
+        self.unacked = collections.OrderedDict()
+        self.last_iamalive = None
+
+    def __str__(self):
+        if isinstance(self.addr, tuple):
+            return '{0}:{1}'.format(*self.addr[:2])
+        else:
+            return str(self.addr) or 'unix socket'
+
+
+class Broadcaster(object):
+    """VOEvent Transport Protocol server that handles any number of
+    subscribers with a single `selectors` event loop, and sends every payload
+    passed to `publish` to all of them.
+
+    The server listens on TCP `host` and `port`. Each published payload is
+    framed once and the same bytes are queued for every subscriber. If more
+    than `max_buffer` bytes are waiting to be sent to a subscriber, it is
+    considered too slow to keep up and is disconnected.
+
+    Every `iamalive_interval` seconds, the server sends each subscriber an
+    iamalive message identifying itself by `ivorn`. Responses from
+    subscribers are read and counted. For payloads that were published with
+    an IVORN, each subscriber keeps track of which ones it has not yet
+    acknowledged, up to `max_unacked` of them.
+
+    Call `serve_forever` to run the event loop, and `publish` from any thread
+    to send a payload. Call `close` to stop the event loop and disconnect
+    everyone."""
+
+    def __init__(self, host='127.0.0.1', port=8099, max_buffer=1 << 22,
+                 ivorn='ivo://python_voeventclient/broadcast',
+                 iamalive_interval=60, max_unacked=1024, log=None):
+        if log is None:
+            log = logging.getLogger('gcn.server')
+        self.max_buffer = max_buffer
+        self.max_unacked = max_unacked
+        self.ivorn = ivorn
+        self.iamalive_interval = iamalive_interval
+        self.log = log
+        self.subscribers = {}
+
+        self._selector = selectors.DefaultSelector()
+        self._pending = collections.deque()
+        self._closed = False
+        self._wakeup_recv, self._wakeup_send = socket.socketpair()
+        self._wakeup_recv.setblocking(False)
+        self._wakeup_send.setblocking(False)
+        self._selector.register(
+            self._wakeup_recv, selectors.EVENT_READ, self._wakeup)
+
+        sock = socket.socket()
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((host, port))
+        self.add_listener(sock)
+        self.address = sock.getsockname()
+        log.info("bound to %s:%d", *self.address[:2])
+
+    def add_listener(self, sock):
+        """Accept subscribers on another bound socket, such as a Unix domain
+        socket."""
+        sock.listen(socket.SOMAXCONN)
+        sock.setblocking(False)
+        self._selector.register(sock, selectors.EVENT_READ, self._accept)
+
+    def publish(self, payload, ivorn=None):
+        """Send a payload to every subscriber. If `ivorn` is provided, then
+        expect every subscriber to acknowledge it. May be called from any
+        thread."""
+        self._pending.append(
+            (_size_struct.pack(len(payload)) + payload, ivorn))
+        self._wake()
+
+    def _wake(self):
+        try:
+            self._wakeup_send.send(b'\0')
+        except (BlockingIOError, OSError):
+            # The event loop has already been woken up, or has been closed.
+            pass
+
+    def close(self):
+        """Stop the event loop. May be called from any thread."""
+        self._closed = True
+        self._wake()
+
+    def _accept(self, sock, mask):
+        try:
+            conn, addr = sock.accept()
+        except (BlockingIOError, InterruptedError):
+            return
+        conn.setblocking(False)
+        subscriber = _Subscriber(conn, addr)
+        self.subscribers[conn] = subscriber
+        self._selector.register(conn, selectors.EVENT_READ, self._service)
+        self.log.info("connected to %s", subscriber)
+        self.subscribed(subscriber)
+
+    def _wakeup(self, sock, mask):
+        try:
+            while sock.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+        while self._pending:
+            self._enqueue_all(*self._pending.popleft())
+
+    def _enqueue_all(self, packet, ivorn=None):
+        for subscriber in list(self.subscribers.values()):
+            if self._enqueue(subscriber, packet) and ivorn is not None:
+                unacked = subscriber.unacked
+                unacked[ivorn] = time.monotonic()
+                if len(unacked) > self.max_unacked:
+                    self.log.warning(
+                        "%s has not acknowledged %s", subscriber,
+                        unacked.popitem(last=False)[0])
+
+    def _enqueue(self, subscriber, packet):
+        """Queue a packet to send to a subscriber, or disconnect the
+        subscriber if it has fallen too far behind. Return True if the packet
+        was queued."""
+        if subscriber.buffered + len(packet) > self.max_buffer:
+            self.log.warning(
+                "disconnecting %s, which has %d bytes waiting to be sent",
+                subscriber, subscriber.buffered)
+            self._disconnect(subscriber)
+            return False
+        if not subscriber.outgoing:
+            self._selector.modify(
+                subscriber.sock, selectors.EVENT_READ | selectors.EVENT_WRITE,
+                self._service)
+        subscriber.outgoing.append(memoryview(packet))
+        subscriber.buffered += len(packet)
+        return True
+
+    def _service(self, sock, mask):
+        subscriber = self.subscribers.get(sock)
+        if subscriber is None:
+            return
+        try:
+            if mask & selectors.EVENT_READ:
+                self._read(subscriber)
+            if mask & selectors.EVENT_WRITE and sock in self.subscribers:
+                self._write(subscriber)
+        except OSError:
+            self.log.exception("error communicating with %s", subscriber)
+            self._disconnect(subscriber)
+
+    def _read(self, subscriber):
+        try:
+            data = subscriber.sock.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        if not data:
+            self.log.info("%s closed the connection", subscriber)
+            self._disconnect(subscriber)
+            return
+        incoming = subscriber.incoming
+        incoming += data
+        while len(incoming) >= _size_len:
+            size, = _size_struct.unpack_from(incoming)
+            if len(incoming) < _size_len + size:
+                break
+            payload = bytes(incoming[_size_len:_size_len + size])
+            del incoming[:_size_len + size]
+            subscriber.responses += 1
+            self._respond(subscriber, payload)
+
+    def _respond(self, subscriber, payload):
+        try:
+            root = fromstring(payload)
+        except XMLSyntaxError:
+            self.log.exception("could not parse response from %s", subscriber)
+            return
+        role = root.get('role')
+        origin = root.findtext('Origin')
+        if role == 'ack':
+            if subscriber.unacked.pop(origin, None) is not None:
+                subscriber.acks += 1
+            else:
+                self.log.warning("%s acknowledged unknown IVORN %s",
+                                 subscriber, origin)
+        elif role == 'iamalive':
+            subscriber.last_iamalive = time.monotonic()
+        else:
+            self.log.warning("%s sent response with unrecognized role: %s",
+                             subscriber, role)
+        self.responded(subscriber, root)
+
+    def _write(self, subscriber):
+        outgoing = subscriber.outgoing
+        while outgoing:
+            try:
+                nsent = subscriber.sock.send(outgoing[0])
+            except (BlockingIOError, InterruptedError):
+                return
+            subscriber.buffered -= nsent
+            if nsent < len(outgoing[0]):
+                outgoing[0] = outgoing[0][nsent:]
+                return
+            outgoing.popleft()
+        self._selector.modify(
+            subscriber.sock, selectors.EVENT_READ, self._service)
+
+    def _disconnect(self, subscriber):
+        del self.subscribers[subscriber.sock]
+        self._selector.unregister(subscriber.sock)
+        try:
+            subscriber.sock.close()
+        except OSError:
+            self.log.exception("could not close socket")
+        else:
+            self.log.info("closed connection to %s", subscriber)
+        self.unsubscribed(subscriber)
+
+    def subscribed(self, subscriber):
+        """Called when a subscriber connects. Subclasses may override this."""
+
+    def unsubscribed(self, subscriber):
+        """Called when a subscriber disconnects. Subclasses may override
+        this."""
+
+    def responded(self, subscriber, root):
+        """Called with the root element of each response that a subscriber
+        sends. Subclasses may override this."""
+
+    def _send_iamalive(self):
+        iamalive = _form_response(
+            'iamalive', self.ivorn, self.ivorn, _get_now_iso8601())
+        self._enqueue_all(_size_struct.pack(len(iamalive)) + iamalive)
+
+    def serve_forever(self):
+        """Run the event loop until `close` is called."""
+        next_iamalive = time.monotonic() + self.iamalive_interval
+        try:
+            while not self._closed:
+                timeout = max(0, next_iamalive - time.monotonic())
+                for key, mask in self._selector.select(timeout):
+                    key.data(key.fileobj, mask)
+                if time.monotonic() >= next_iamalive:
+                    self._send_iamalive()
+                    next_iamalive += self.iamalive_interval
+        finally:
+            for subscriber in list(self.subscribers.values()):
+                self._disconnect(subscriber)
+            for key in list(self._selector.get_map().values()):
+                self._selector.unregister(key.fileobj)
+                key.fileobj.close()
+            self._wakeup_send.close()
+            self._selector.close()
+            self.log.info("closed listening socket")
+
+
+def broadcast(payloads, host='127.0.0.1', port=8099, rate=1,
+              max_buffer=1 << 22, log=None):
+    """GCN server for testing purposes and load generation. Unlike
+    `gcn.serve`, it serves any number of connections at once. It sends the
+    payloads (which are file names) to all connected subscribers in order,
+    repeating, at `rate` packets per second. Subscribers that fall more than
+    `max_buffer` bytes behind are disconnected. This function does not
+    return."""
+    payloads = [open(payload, 'rb').read() for payload in payloads]
+    server = Broadcaster(host, port, max_buffer=max_buffer, log=log)
+
+    def produce():
+        interval = 1 / rate
+        next_time = time.monotonic()
+        i = 0
+        while True:
+            server.publish(payloads[i])
+            i += 1
+            i %= len(payloads)
+            next_time += interval
+            delay = next_time - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    thread = threading.Thread(target=produce, name='gcn-broadcast')
+    thread.daemon = True
+    thread.start()
+    server.serve_forever()
+
+
+class Relay(Broadcaster):
+    """Relay that keeps one upstream connection to GCN and rebroadcasts
+    every VOEvent to any number of local subscribers over the VOEvent
+    Transport Protocol, so that many local pipelines can share one upstream
+    connection.
+
+    The relay is a `Broadcaster` listening on TCP `host` and `port` and, if
+    `unix_path` is provided, on a Unix domain socket at that path as well. It
+    is also a payload handler for `gcn.listen`: for each VOEvent, it
+    publishes the raw payload, tracks acknowledgements from each subscriber
+    by IVORN, and then calls `handler` (if provided) with the payload and the
+    root element that `gcn.listen` has already parsed. The relay sends its
+    own iamalive messages to subscribers and answers the upstream server's
+    iamalive messages itself.
+
+    Call `run` to connect upstream and serve subscribers until interrupted.
+    The remaining keyword arguments are passed to `Broadcaster`."""
+
+    def __init__(self, host='127.0.0.1', port=8099, unix_path=None,
+                 handler=None, **kwargs):
+        super(Relay, self).__init__(host, port, **kwargs)
+        self.handler = handler
+        self.unix_path = unix_path
+        if unix_path is not None:
+            self._remove_stale_socket(unix_path)
+            sock = socket.socket(socket.AF_UNIX)
+            sock.bind(unix_path)
+            self.add_listener(sock)
+            self.log.info("bound to %s", unix_path)
+
+    def _remove_stale_socket(self, path):
+        """Remove a Unix domain socket that was left behind by a relay that
+        did not shut down cleanly, so that it can be bound again. Anything
+        else at that path, including a socket that is still in use, is left
+        alone."""
+        try:
+            mode = os.stat(path).st_mode
+        except FileNotFoundError:
+            return
+        if not stat.S_ISSOCK(mode):
+            return
+        with socket.socket(socket.AF_UNIX) as probe:
+            try:
+                probe.connect(path)
+            except ConnectionRefusedError:
+                os.remove(path)
+                self.log.info("removed stale socket %s", path)
+
+    def __call__(self, payload, root):
+        self.publish(payload, root.attrib['ivorn'])
+        if self.handler is not None:
+            self.handler(payload, root)
+
+    def run(self, **kwargs):
+        """Serve subscribers from a background thread, and call `gcn.listen`
+        in this thread with the given keyword arguments and the relay as the
+        handler. Does not return."""
+        thread = threading.Thread(target=self.serve_forever,
+                                  name='gcn-relay')
+        thread.daemon = True
+        thread.start()
+        try:
+            listen(handler=self, **kwargs)
+        finally:
+            self.close()
+            thread.join()
+            if self.unix_path is not None:
+                os.remove(self.unix_path)
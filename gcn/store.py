@@ -0,0 +1,476 @@
+# Copyright (C) 2026  Leo Singer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+"""
+Archives of VOEvents.
+
+A segmented archive, written by `SegmentedArchive` and read by
+`ArchiveReader`, is a directory of numbered segments. Each segment consists of
+a data file, `NNNNNNNN.vtp`, which holds VOEvent payloads framed with the same
+4-byte length prefix as the VOEvent Transport Protocol, and an index file,
+`NNNNNNNN.idx`, which holds one fixed-size record for each payload (its offset
+in the data file, length, GCN notice type, and time of arrival) followed by
+its IVORN.
+
+If the VOEvents in a segmented archive are compressed with a
+`gcn.DictionaryCodec`, then the codec is saved in the archive as the file
+`dictionaries`.
+
+`BackgroundArchive` writes one file per VOEvent, like
+`gcn.handlers.archive`, but from a background thread.
+"""
+
+import bz2
+import collections
+import glob
+import gzip
+import logging
+import lzma
+import mmap
+import os
+import queue
+import struct
+import tempfile
+import threading
+import time
+from urllib.parse import quote_plus
+
+from .codec import DictionaryCodec
+from .handlers import _get_notice_type
+from .voeventclient import _size_len, _size_struct
+
+__all__ = ('SegmentedArchive', 'ArchiveReader', 'ArchiveEntry',
+           'BackgroundArchive')
+
+# File name extension and compression function for each compression method.
+_compressors = {
+    None: ('', bytes),
+    'gzip': ('.gz', gzip.compress),
+    'bz2': ('.bz2', bz2.compress),
+    'xz': ('.xz', lzma.compress)}
+
+# offset, payload length, notice type, time of arrival, IVORN length
+_index_struct = struct.Struct('!QIidH')
+
+ArchiveEntry = collections.namedtuple(
+    'ArchiveEntry', 'ivorn notice_type timestamp segment offset length')
+ArchiveEntry.__doc__ = """Index entry for one archived VOEvent. The notice
+type is -1 if the VOEvent has no `Packet_Type` parameter. The time stamp is
+the time of arrival in seconds since the epoch."""
+
+
+def _segment_paths(directory):
+    """Return a sorted list of the numbers of the segments in an archive."""
+    return sorted(
+        int(os.path.basename(path)[:-4])
+        for path in glob.glob(os.path.join(directory, '[0-9]' * 8 + '.idx')))
+
+
+def _index_records(data):
+    """Iterate over the complete records in the contents of an index file.
+    Yield the position of the end of each record, its fields, and its IVORN
+    as bytes."""
+    pos = 0
+    while pos + _index_struct.size <= len(data):
+        fields = _index_struct.unpack_from(data, pos)
+        end = pos + _index_struct.size + fields[-1]
+        if end > len(data):
+            # Partially written record
+            break
+        yield end, fields, data[pos + _index_struct.size:end]
+        pos = end
+
+
+def _dictionaries_path(directory):
+    return os.path.join(directory, 'dictionaries')
+
+
+def _load_codec(directory):
+    """Load the codec of an archive, or return None if it has none."""
+    try:
+        with open(_dictionaries_path(directory), 'rb') as f:
+            return DictionaryCodec.loads(f.read())
+    except FileNotFoundError:
+        return None
+
+
+class SegmentedArchive(object):
+    """Payload handler that appends VOEvents to an archive in `directory`,
+    which is created if it does not exist. When a segment would grow beyond
+    `segment_size` bytes, a new one is started. If the archive already has
+    segments, writing continues at the end of the last one.
+
+    Every write is flushed to the operating system right away. If
+    `fsync_every` is nonzero, then the files are also synced to disk after
+    that many VOEvents, so that a crash loses at most that many of them.
+
+    If `codec` is provided, it should be a `gcn.DictionaryCodec`, and each
+    VOEvent is compressed with it. All VOEvents in an archive must be written
+    with the same codec, or all without one.
+
+    Read archives with `ArchiveReader`."""
+
+    def __init__(self, directory='.', segment_size=1 << 28, fsync_every=0,
+                 codec=None, log=None):
+        if log is None:
+            log = logging.getLogger('gcn.store')
+        self.directory = directory
+        self.segment_size = segment_size
+        self.fsync_every = fsync_every
+        self.log = log
+        self.codec = codec
+        self._lock = threading.Lock()
+        self._unsynced = 0
+
+        os.makedirs(directory, exist_ok=True)
+        segments = _segment_paths(directory)
+        existing = _load_codec(directory)
+        if segments and existing != codec:
+            raise ValueError(
+                'archive {0} was written with a different codec'.format(
+                    directory))
+        if codec is not None and existing is None:
+            tmpname = _dictionaries_path(directory) + '.tmp'
+            with open(tmpname, 'wb') as f:
+                f.write(codec.dumps())
+            os.replace(tmpname, _dictionaries_path(directory))
+        self._open(segments[-1] if segments else 0)
+
+    def _path(self, segment, ext):
+        return os.path.join(self.directory, '{0:08d}.{1}'.format(segment, ext))
+
+    def _recover(self, segment):
+        """Cut off whatever a crash left after the last complete record of a
+        segment: a partly written index record, or payloads that are not in
+        the index."""
+        data_path = self._path(segment, 'vtp')
+        index_path = self._path(segment, 'idx')
+        try:
+            data_size = os.path.getsize(data_path)
+            with open(index_path, 'rb') as f:
+                index = f.read()
+        except FileNotFoundError:
+            return
+        index_end = data_end = 0
+        for end, (offset, length, _, _, _), _ in _index_records(index):
+            if offset != data_end or offset + _size_len + length > data_size:
+                break
+            index_end = end
+            data_end = offset + _size_len + length
+        if index_end < len(index) or data_end < data_size:
+            self.log.warning(
+                "truncating archive segment %s from %d to %d bytes and its "
+                "index from %d to %d bytes after an incomplete write",
+                data_path, data_size, data_end, len(index), index_end)
+            os.truncate(index_path, index_end)
+            os.truncate(data_path, data_end)
+
+    def _open(self, segment):
+        self._recover(segment)
+        self.segment = segment
+        self._data = open(self._path(segment, 'vtp'), 'ab')
+        self._index = open(self._path(segment, 'idx'), 'ab')
+        self._offset = self._data.tell()
+        self.log.info("opened archive segment %s",
+                      self._path(segment, 'vtp'))
+
+    def _close(self):
+        self._sync()
+        self._data.close()
+        self._index.close()
+
+    def _sync(self):
+        self._data.flush()
+        self._index.flush()
+        if self.fsync_every:
+            os.fsync(self._data.fileno())
+            os.fsync(self._index.fileno())
+        self._unsynced = 0
+
+    def __call__(self, payload, root):
+        ivorn = root.attrib['ivorn']
+        notice_type = _get_notice_type(root)
+        self.append(payload, ivorn, -1 if notice_type is None else notice_type)
+
+    def append(self, payload, ivorn, notice_type=-1, timestamp=None):
+        """Append a payload to the archive."""
+        if timestamp is None:
+            timestamp = time.time()
+        if self.codec is not None:
+            payload = self.codec.encode(
+                payload, None if notice_type == -1 else notice_type)
+        ivorn_bytes = ivorn.encode('UTF-8')
+        length = _size_len + len(payload)
+
+        with self._lock:
+            if self._offset and self._offset + length > self.segment_size:
+                self._close()
+                self._open(self.segment + 1)
+
+            # Write the data before the index, so that the index never points
+            # past the end of the data.
+            self._data.write(_size_struct.pack(len(payload)))
+            self._data.write(payload)
+            self._data.flush()
+            self._index.write(_index_struct.pack(
+                self._offset, len(payload), notice_type, timestamp,
+                len(ivorn_bytes)))
+            self._index.write(ivorn_bytes)
+            self._index.flush()
+            self._offset += length
+
+            self._unsynced += 1
+            if self.fsync_every and self._unsynced >= self.fsync_every:
+                self._sync()
+
+        self.log.info("archived %s", ivorn)
+
+    def close(self):
+        """Sync and close the current segment."""
+        with self._lock:
+            self._close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class ArchiveReader(object):
+    """Read VOEvents from an archive written by `SegmentedArchive`. The index
+    is loaded into memory, and payloads are read through memory maps of the
+    segment files, so that looking up a payload by IVORN does not involve
+    any copying other than of the payload itself.
+
+    Iterating over the reader yields an `ArchiveEntry` for each VOEvent in
+    the order in which they were archived. If a VOEvent with the same IVORN
+    was archived more than once, then looking it up returns the latest copy.
+    Call `refresh` to pick up VOEvents that have been archived since the
+    reader was created. VOEvents that were compressed with a codec are
+    decompressed when they are read."""
+
+    def __init__(self, directory='.'):
+        self.directory = directory
+        self.codec = _load_codec(directory)
+        self.entries = []
+        self._by_ivorn = {}
+        self._maps = {}
+        self._index_sizes = {}
+        self.refresh()
+
+    def refresh(self):
+        """Load new index entries."""
+        for segment in _segment_paths(self.directory):
+            path = os.path.join(self.directory, '{0:08d}.idx'.format(segment))
+            start = self._index_sizes.get(segment, 0)
+            with open(path, 'rb') as f:
+                f.seek(start)
+                data = f.read()
+            pos = 0
+            for end, fields, ivorn in _index_records(data):
+                offset, length, notice_type, timestamp, _ = fields
+                ivorn = ivorn.decode('UTF-8')
+                entry = ArchiveEntry(ivorn, notice_type, timestamp, segment,
+                                     offset, length)
+                self.entries.append(entry)
+                self._by_ivorn[ivorn] = entry
+                pos = end
+            self._index_sizes[segment] = start + pos
+
+    def _map(self, segment, end):
+        """Get a memory map of a segment that extends to at least `end`."""
+        m = self._maps.get(segment)
+        if m is None or len(m) < end:
+            if m is not None:
+                m.close()
+            path = os.path.join(self.directory, '{0:08d}.vtp'.format(segment))
+            with open(path, 'rb') as f:
+                m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = m
+        return m
+
+    def read(self, entry):
+        """Return the payload for an `ArchiveEntry`."""
+        start = entry.offset + _size_len
+        end = start + entry.length
+        data = self._map(entry.segment, end)[start:end]
+        if self.codec is not None:
+            data = self.codec.decode(data)
+        return data
+
+    def __getitem__(self, ivorn):
+        """Return the payload of the VOEvent with the given IVORN."""
+        return self.read(self._by_ivorn[ivorn])
+
+    def __contains__(self, ivorn):
+        return ivorn in self._by_ivorn
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def payloads(self):
+        """Iterate over all archived payloads in order."""
+        for entry in self.entries:
+            yield self.read(entry)
+
+    def close(self):
+        for m in self._maps.values():
+            m.close()
+        self._maps.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class BackgroundArchive(object):
+    """Payload handler that archives VOEvents as files in `directory`, named
+    with the URL-escaped IVORN like `gcn.handlers.archive`, but that writes
+    them from a background thread so that a slow file system never delays
+    the socket loop.
+
+    Each file is written under a temporary name and then renamed, so that a
+    crash never leaves a partly written file under the final name. VOEvents
+    are written in batches of up to `max_batch`, collected for at most
+    `max_latency` seconds after the first one in the batch arrives. If
+    `fsync` is true, then each file and, once per batch, the directory are
+    synced to disk.
+
+    If `compression` is ``'gzip'``, ``'bz2'``, or ``'xz'``, then files are
+    compressed with that method, and the corresponding extension is added to
+    their names.
+
+    Call `flush` to wait until everything that has been queued so far is
+    written, and `close` to flush and stop the writer thread."""
+
+    def __init__(self, directory='.', max_batch=64, max_latency=0.1,
+                 compression=None, fsync=False, log=None):
+        if compression not in _compressors:
+            raise ValueError('compression must be one of {0}'.format(
+                ', '.join(sorted(
+                    repr(key) for key in _compressors if key is not None))))
+        if log is None:
+            log = logging.getLogger('gcn.store')
+        self.directory = directory
+        self.max_batch = max_batch
+        self.max_latency = max_latency
+        self.compression = compression
+        self.fsync = fsync
+        self.log = log
+        self.written = 0
+        self._extension, self._compress = _compressors[compression]
+        self._queue = queue.Queue()
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._work,
+                                        name='gcn-archive-writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __call__(self, payload, root):
+        self._queue.put((bytes(payload), root.attrib['ivorn']))
+
+    def _next_batch(self):
+        """Wait for a batch of queued VOEvents."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.max_batch and batch[-1] is not None:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _discard(self, tmpname):
+        """Remove a temporary file that could not be archived."""
+        if tmpname is not None:
+            try:
+                os.unlink(tmpname)
+            except OSError:
+                pass
+
+    def _write(self, batch):
+        renames = []
+        for payload, ivorn in batch:
+            filename = os.path.join(
+                self.directory, quote_plus(ivorn) + self._extension)
+            tmpname = None
+            try:
+                fd, tmpname = tempfile.mkstemp(dir=self.directory,
+                                               prefix='.tmp-')
+                with os.fdopen(fd, 'wb') as f:
+                    f.write(self._compress(payload))
+                    if self.fsync:
+                        f.flush()
+                        os.fsync(f.fileno())
+            except:  # noqa: E722
+                self.log.exception("could not archive %s", ivorn)
+                self._discard(tmpname)
+            else:
+                renames.append((tmpname, filename, ivorn))
+
+        for tmpname, filename, ivorn in renames:
+            try:
+                os.replace(tmpname, filename)
+            except:  # noqa: E722
+                self.log.exception("could not archive %s", ivorn)
+                self._discard(tmpname)
+            else:
+                self.written += 1
+                self.log.info("archived %s", ivorn)
+
+        if self.fsync and renames:
+            fd = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _work(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._write([item for item in batch if item is not None])
+            except:  # noqa: E722
+                self.log.exception("could not write batch")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if batch[-1] is None:
+                return
+
+    def flush(self):
+        """Wait until every queued VOEvent has been written."""
+        self._queue.join()
+
+    def close(self):
+        """Write the queued VOEvents and stop the writer thread."""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,22 @@
+from importlib import resources
+
+from . import data
+
+_template = resources.read_binary(data, 'gbm_flt_pos.xml')
+
+
+def make_payload(serial, notice_type=None, trigger=None, isotime=None,
+                 ra=None, dec=None):
+    """Make a copy of the sample Fermi GBM flight position notice whose IVORN
+    ends with `serial`, optionally with a different notice type, trigger
+    number, event time (as ISO 8601 bytes), or position."""
+    payload = _template.replace(b'336801278_45-956', b'%d' % serial)
+    for old, new, value in [
+            (b'value="111"', b'value="%d"', notice_type),
+            (b'value="336801278"', b'value="%d"', trigger),
+            (b'<ISOTime>2011-09-04T03:54:36.02', b'<ISOTime>%s', isotime),
+            (b'>193.0000<', b'>%.4f<', ra),
+            (b'>-31.7500<', b'>%.4f<', dec)]:
+        if value is not None:
+            payload = payload.replace(old, new % value)
+    return payload
@@ -0,0 +1,95 @@
+import asyncio
+import itertools
+from importlib import resources
+
+from lxml.etree import fromstring
+
+from . import data
+from .. import listen_async
+from .. import notice_types
+from ..handlers import include_notice_types
+from ..voeventclient import _form_response, _size_len, _size_struct
+
+payloads = [resources.read_binary(data, 'gbm_flt_pos.xml'),
+            resources.read_binary(data, 'kill_socket.xml')]
+
+iamalive = _form_response('iamalive', 'ivo://gcn.test/server',
+                          'ivo://gcn.test/server', '2026-01-01T00:00:00')
+
+
+async def serve(payloads, responses, connections, host='127.0.0.1'):
+    """Rudimentary asyncio GCN server, for testing purposes. For each of the
+    first few connections, sends the payloads in order, records the parsed
+    responses, and then closes the connection. Stops listening after the last
+    connection."""
+    count = itertools.count(1)
+
+    async def handle(reader, writer):
+        try:
+            if next(count) >= connections:
+                server.close()
+            for payload in payloads:
+                writer.write(_size_struct.pack(len(payload)) + payload)
+                await writer.drain()
+                size, = _size_struct.unpack(
+                    await reader.readexactly(_size_len))
+                responses.append(fromstring(await reader.readexactly(size)))
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, 0)
+    return server
+
+
+async def run_client(payloads, handler, connections, responses, timeout=10):
+    count = connections * len(payloads)
+    server = await serve(payloads, responses, connections)
+    port = server.sockets[0].getsockname()[1]
+    client = asyncio.ensure_future(listen_async(
+        host='127.0.0.1', port=port, max_reconnect_timeout=1,
+        handler=handler))
+    try:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while len(responses) < count and loop.time() < deadline:
+            await asyncio.sleep(0.01)
+        # Give the client a moment to finish handling the last packet.
+        await asyncio.sleep(0.1)
+    finally:
+        client.cancel()
+        try:
+            await client
+        except asyncio.CancelledError:
+            pass
+        server.close()
+        await server.wait_closed()
+
+
+def test_reconnect_after_kill():
+    """Test that the client acks each VOEvent, calls coroutine handlers, and
+    recovers if the server closes the connection."""
+    received = []
+    responses = []
+
+    @include_notice_types(notice_types.FERMI_GBM_FLT_POS)
+    async def handler(payload, root):
+        await asyncio.sleep(0)
+        received.append(root.attrib['ivorn'])
+
+    asyncio.run(run_client(payloads, handler, 3, responses))
+
+    assert len(received) == 3
+    assert [response.attrib['role'] for response in responses] == ['ack'] * 6
+    assert responses[0].find('Origin').text == fromstring(
+        payloads[0]).attrib['ivorn']
+
+
+def test_iamalive():
+    """Test that the client answers iamalive messages."""
+    responses = []
+    asyncio.run(run_client([iamalive], None, 1, responses))
+
+    assert responses[0].attrib['role'] == 'iamalive'
+    assert responses[0].find('Origin').text == 'ivo://gcn.test/server'
+    assert responses[0].find('Response').text == (
+        'ivo://python_voeventclient/anonymous')
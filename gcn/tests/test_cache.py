@@ -0,0 +1,111 @@
+from importlib import resources
+from unittest import mock
+
+from lxml.etree import fromstring
+
+from . import data, make_payload
+from .. import notice_types
+from ..cache import NoticeCache
+from ..notice import Notice
+
+kill_socket = resources.read_binary(data, 'kill_socket.xml')
+
+
+fermi = 'ivo://nasa.gsfc.gcn/Fermi'
+
+
+def make_root(i, notice_type, trigger):
+    return fromstring(make_payload(i, notice_type, trigger))
+
+
+def test_chain():
+    cache = NoticeCache()
+    for i, (notice_type, trigger) in enumerate([
+            (notice_types.FERMI_GBM_ALERT, 1),
+            (notice_types.FERMI_GBM_FLT_POS, 1),
+            (notice_types.FERMI_GBM_ALERT, 2),
+            (notice_types.FERMI_GBM_GND_POS, 1)]):
+        cache(None, make_root(i, notice_type, trigger))
+    cache(kill_socket, fromstring(kill_socket))
+
+    assert len(cache) == 2
+    assert (fermi, 1) in cache and (fermi, '2') in cache
+    assert (fermi, 3) not in cache and None not in cache
+    assert [notice.notice_type for notice in cache.chain((fermi, 1))] == [
+        notice_types.FERMI_GBM_ALERT, notice_types.FERMI_GBM_FLT_POS,
+        notice_types.FERMI_GBM_GND_POS]
+    latest = cache.latest((fermi, 1))
+    assert latest.ivorn.endswith('_3')
+    assert latest.role == 'observation'
+    assert (latest.ra, latest.dec, latest.error) == (193.0, -31.75, 17.4333)
+    assert cache.latest((fermi, 3)) is None
+    assert cache.chain((fermi, 3)) == ()
+
+
+def test_streams():
+    """Test that the same trigger number from two missions is two
+    triggers."""
+    cache = NoticeCache()
+    fermi_root = make_root(0, notice_types.FERMI_GBM_ALERT, 1)
+    swift_root = fromstring(make_payload(1, notice_types.SWIFT_BAT_GRB_POS_ACK,
+                                         1).replace(b'/Fermi#', b'/SWIFT#'))
+    assert cache.add(fermi_root) == (fermi, '1')
+    assert cache.add(swift_root) == ('ivo://nasa.gsfc.gcn/SWIFT', '1')
+    assert len(cache) == 2
+    assert [notice.notice_type for notice in cache.chain((fermi, 1))] == [
+        notice_types.FERMI_GBM_ALERT]
+
+
+def test_eviction():
+    cache = NoticeCache(maxsize=2, ttl=100, max_chain=2)
+    with mock.patch('time.monotonic', return_value=0):
+        for i in range(3):
+            cache(None, make_root(i, notice_types.FERMI_GBM_ALERT, 1))
+        cache(None, make_root(3, notice_types.FERMI_GBM_ALERT, 2))
+        # Trigger 1 was updated least recently, so it is evicted first.
+        cache(None, make_root(4, notice_types.FERMI_GBM_ALERT, 3))
+        assert (fermi, 1) not in cache
+        assert len(cache) == 2
+
+    with mock.patch('time.monotonic', return_value=50):
+        cache(None, make_root(5, notice_types.FERMI_GBM_ALERT, 2))
+        assert len(cache.chain((fermi, 2))) == 2
+
+    # The wall clock does not matter.
+    with mock.patch('time.monotonic', return_value=120), \
+            mock.patch('time.time', return_value=0):
+        assert (fermi, 2) in cache
+        assert (fermi, 3) not in cache
+        assert len(cache) == 1
+
+
+def test_track():
+    cache = NoticeCache()
+    seen = []
+
+    @cache.track
+    def handler(payload, root):
+        # The key of the VOEvent that was just added is remembered.
+        with mock.patch('gcn.cache._trigger') as trigger:
+            seen.append(cache.latest(cache.key(root)).ivorn)
+        assert not trigger.called
+
+    root = make_root(0, notice_types.FERMI_GBM_ALERT, 1)
+    handler(None, root)
+    assert seen == [root.get('ivorn')]
+    assert cache.key(make_root(1, notice_types.FERMI_GBM_ALERT, 2)) == (
+        fermi, '2')
+
+    def inner(payload, root):
+        pass
+
+    inner.accepts = lambda notice_type: False
+    assert cache.track(inner).accepts is inner.accepts
+
+
+def test_add_notice():
+    cache = NoticeCache()
+    notice = Notice.from_root(make_root(0, notice_types.FERMI_GBM_ALERT, 1))
+    assert cache.add(notice) == (fermi, '1')
+    assert cache.latest((fermi, 1)) is notice
+    assert cache.add(Notice('ivo://gcn.test/no-trigger')) is None
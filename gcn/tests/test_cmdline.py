@@ -1,6 +1,17 @@
+from importlib import resources
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
 import pytest
 
-from ..cmdline import listen_main, serve_main
+from . import data
+from ..cmdline import listen_main, relay_main, replay_main, serve_main
+from ..server import Broadcaster
+from ..voeventclient import _recv_packet
 
 
 def test_listen_main():
@@ -9,7 +20,70 @@ def test_listen_main():
         listen_main(['--version'])
 
 
+def test_relay_main():
+    with pytest.raises(SystemExit):
+        relay_main(['--version'])
+
+
+def test_relay_main_relays(tmp_path):
+    """Run pygcn-relay against a local upstream server, and check that a
+    VOEvent from upstream reaches a client on the Unix socket."""
+    payload = resources.read_binary(data, 'kill_socket.xml')
+    upstream = Broadcaster(port=0)
+    upstream_thread = threading.Thread(target=upstream.serve_forever)
+    upstream_thread.daemon = True
+    upstream_thread.start()
+    unix_path = str(tmp_path / 'relay.sock')
+    process = subprocess.Popen([
+        sys.executable, '-c', 'from gcn.cmdline import relay_main; '
+        'relay_main()', '{0}:{1}'.format(*upstream.address),
+        '--bind', '127.0.0.1:0', '--unix', unix_path])
+    client = socket.socket(socket.AF_UNIX)
+    try:
+        deadline = time.monotonic() + 20
+        while time.monotonic() < deadline and not (
+                upstream.subscribers and os.path.exists(unix_path)):
+            time.sleep(0.01)
+        client.connect(unix_path)
+
+        # The relay may not have accepted the client yet, so publish until
+        # the client gets the VOEvent.
+        client.settimeout(0.5)
+        while True:
+            upstream.publish(payload)
+            try:
+                assert _recv_packet(client) == payload
+            except socket.timeout:
+                assert time.monotonic() < deadline
+            else:
+                break
+    finally:
+        client.close()
+        process.terminate()
+        process.wait(5)
+        upstream.close()
+        upstream_thread.join(5)
+
+
 def test_serve_main():
     # FIXME: test more than just the argument parser!
     with pytest.raises(SystemExit):
         serve_main(['--version'])
+
+
+def test_serve_main_rate_requires_broadcast():
+    with pytest.raises(SystemExit):
+        serve_main(['--rate', '10', 'payload.xml'])
+
+
+def test_replay_main(capsys):
+    with resources.path(data, 'kill_socket.xml') as path:
+        replay_main([str(path), str(path)])
+    assert capsys.readouterr().out.startswith('2 packets')
+
+
+def test_replay_main_invalid():
+    with pytest.raises(SystemExit):
+        replay_main(['--speed', '0', 'payload.xml'])
+    with pytest.raises(SystemExit):
+        replay_main(['--handler', 'gcn.handlers', 'payload.xml'])
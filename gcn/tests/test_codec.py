@@ -0,0 +1,58 @@
+from importlib import resources
+import random
+
+import pytest
+
+from . import data, make_payload
+from .. import notice_types
+from ..codec import DictionaryCodec
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+kill_socket = resources.read_binary(data, 'kill_socket.xml')
+
+
+def make_payloads(n, notice_type=notice_types.FERMI_GBM_FLT_POS):
+    rng = random.Random(n)
+    return [make_payload(i, notice_type, trigger=rng.randrange(1 << 30),
+                         ra=rng.uniform(0, 360)) for i in range(n)]
+
+
+backends = ['zlib', pytest.param('zstd', marks=pytest.mark.skipif(
+    zstandard is None, reason='zstandard is not installed'))]
+
+
+@pytest.mark.parametrize('backend', backends)
+def test_codec(backend):
+    training = make_payloads(20)
+    codec = DictionaryCodec.train(training + [kill_socket], backend=backend)
+    assert codec.backend == backend
+    assert list(codec.dictionaries) == [notice_types.FERMI_GBM_FLT_POS]
+
+    for payload in make_payloads(5) + [kill_socket]:
+        record = codec.encode(payload)
+        assert codec.decode(record) == payload
+        assert codec.decode(memoryview(record)) == payload
+
+    # A dictionary makes a single VOEvent much smaller.
+    payload = make_payloads(1)[0]
+    plain = DictionaryCodec(backend=backend)
+    assert len(codec.encode(payload)) < 0.5 * len(plain.encode(payload))
+
+    copy = DictionaryCodec.loads(codec.dumps())
+    assert copy == codec
+    with pytest.raises(TypeError):
+        hash(codec)
+    assert copy.decode(codec.encode(payload)) == payload
+    with pytest.raises(ValueError):
+        plain.decode(codec.encode(payload))
+
+
+def test_codec_invalid():
+    with pytest.raises(ValueError):
+        DictionaryCodec(backend='lz4')
+    with pytest.raises(ValueError):
+        DictionaryCodec.loads(b'\0' * 32)
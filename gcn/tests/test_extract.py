@@ -0,0 +1,87 @@
+from importlib import resources
+
+from lxml.etree import fromstring
+import pytest
+
+from . import data
+from .. import notice_types
+from ..extract import _extract, extract_columns
+
+payloads = [resources.read_binary(data, 'gbm_flt_pos.xml'),
+            resources.read_binary(data, 'kill_socket.xml'),
+            b'<VOEvent']
+
+
+@pytest.mark.parametrize('processes', [None, 2])
+def test_extract_columns(processes):
+    result = extract_columns(
+        payloads, params=['TrigID', 'Trig_Timescale', 'Sequence_Num'],
+        output='dict', processes=processes, chunksize=1)
+    assert list(result) == ['ivorn', 'notice_type', 'time', 'ra', 'dec',
+                            'error', 'TrigID', 'Trig_Timescale',
+                            'Sequence_Num']
+    assert result['notice_type'] == [
+        notice_types.FERMI_GBM_FLT_POS, notice_types.KILL_SOCKET, None]
+    assert result['time'][0] == pytest.approx(1315108476.02)
+    assert result['ra'] == [193.0, None, None]
+    assert result['dec'] == [-31.75, None, None]
+    assert result['error'] == [17.4333, None, None]
+    # Identifiers stay strings, and integers stay exact.
+    assert result['TrigID'] == ['336801278', None, None]
+    assert result['Trig_Timescale'] == [8.192, None, None]
+    assert result['Sequence_Num'] == [45, None, None]
+    assert type(result['Sequence_Num'][0]) is int
+    assert result['ivorn'][2] is None
+
+
+def test_extract():
+    root = fromstring(payloads[0])
+    notice_type, trigger, event_time, ra, dec, error = _extract(root)
+    assert notice_type == notice_types.FERMI_GBM_FLT_POS
+    # A plain string, which does not keep the element tree alive
+    assert type(trigger) is str and trigger == '336801278'
+    assert event_time == pytest.approx(1315108476.02)
+    assert (ra, dec, error) == (193.0, -31.75, 17.4333)
+
+    root = fromstring(payloads[0].replace(b'"TrigID"', b'"GraceID"'))
+    assert _extract(root)[1] == '336801278'
+    assert _extract(fromstring(payloads[1]))[1:] == (None,) * 5
+
+
+def test_extract_columns_empty():
+    # The default output needs no optional packages.
+    result = extract_columns([], params=['TrigID'])
+    assert result['ivorn'] == result['TrigID'] == []
+
+
+def test_extract_columns_invalid_output():
+    with pytest.raises(ValueError):
+        extract_columns(payloads, output='csv')
+
+
+def test_extract_columns_numpy():
+    np = pytest.importorskip('numpy')
+    result = extract_columns(payloads[:1], params=['TrigID', 'Sequence_Num'],
+                             output='numpy')
+    assert result['TrigID'].tolist() == ['336801278']
+    assert result['Sequence_Num'].dtype.kind == 'i'
+
+    result = extract_columns(payloads, params=['TrigID'], output='numpy')
+    assert result['notice_type'].tolist() == [
+        notice_types.FERMI_GBM_FLT_POS, notice_types.KILL_SOCKET, -1]
+    assert result['ra'][0] == 193.0
+    assert np.isnan(result['ra'][1:]).all()
+
+
+def test_extract_columns_pandas():
+    pytest.importorskip('pandas')
+    result = extract_columns(payloads, output='pandas')
+    assert len(result) == 3
+    assert result['dec'][0] == -31.75
+
+
+def test_extract_columns_arrow():
+    pytest.importorskip('pyarrow')
+    result = extract_columns(payloads, output='arrow')
+    assert result.num_rows == 3
+    assert result.column('error').to_pylist() == [17.4333, None, None]
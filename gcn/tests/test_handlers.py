@@ -3,16 +3,32 @@ import os
 from urllib.parse import quote_plus
 
 from lxml.etree import fromstring
+import pytest
 
 from . import data
 from .. import handlers
 from .. import notice_types
+from ..regions import Cone
 
 
 payloads = [resources.read_binary(data, 'gbm_flt_pos.xml'),
             resources.read_binary(data, 'kill_socket.xml')]
 
 
+def test_get_notice_type():
+    root = fromstring(payloads[0])
+    assert handlers.get_notice_type(root) == notice_types.FERMI_GBM_FLT_POS
+    assert handlers._get_notice_type(root) == notice_types.FERMI_GBM_FLT_POS
+
+    for payload in [
+            payloads[0].replace(b'name="Packet_Type"', b'name="Other"'),
+            payloads[0].replace(b'value="111"', b'value="x"')]:
+        root = fromstring(payload)
+        assert handlers._get_notice_type(root) is None
+        with pytest.raises(ValueError):
+            handlers.get_notice_type(root)
+
+
 def test_include_notice_types():
     t = []
 
@@ -39,6 +55,101 @@ def test_exclude_notice_types():
     assert t == [notice_types.KILL_SOCKET]
 
 
+def test_accepts():
+    @handlers.include_notice_types(notice_types.FERMI_GBM_FLT_POS,
+                                   notice_types.KILL_SOCKET)
+    @handlers.exclude_notice_types(notice_types.KILL_SOCKET)
+    def handler(payload, root):
+        pass
+
+    assert handler.accepts(notice_types.FERMI_GBM_FLT_POS)
+    assert not handler.accepts(notice_types.KILL_SOCKET)
+    assert not handler.accepts(notice_types.FERMI_GBM_GND_POS)
+
+
+def test_sky_region():
+    included = []
+    excluded = []
+
+    @handlers.include_sky_region(Cone(190.0, -30.0, 5.0))
+    def include(payload, root):
+        included.append(payload)
+
+    @handlers.exclude_sky_region(Cone(190.0, -30.0, 5.0), error=False)
+    def exclude(payload, root):
+        excluded.append(payload)
+
+    for payload in payloads:
+        include(payload, fromstring(payload))
+        exclude(payload, fromstring(payload))
+
+    assert included == payloads[:1]
+    assert excluded == payloads[1:]
+
+    # The error circle of the GBM notice overlaps a cone nearby.
+    assert handlers.include_sky_region(Cone(170.0, -31.75, 5.0))(
+        lambda payload, root: True)(payloads[0], fromstring(payloads[0]))
+    assert not handlers.include_sky_region(
+        Cone(170.0, -31.75, 5.0), error=False)(
+        lambda payload, root: True)(payloads[0], fromstring(payloads[0]))
+
+
+def test_sky_region_accepts():
+    handler = handlers.include_sky_region(Cone(0, 0, 1))(
+        handlers.include_notice_types(notice_types.FERMI_GBM_FLT_POS)(
+            lambda payload, root: None))
+    assert handler.accepts(notice_types.FERMI_GBM_FLT_POS)
+    assert not handler.accepts(notice_types.KILL_SOCKET)
+
+
+def test_with_notice():
+    notices = []
+
+    @handlers.with_notice
+    def handler(notice):
+        notices.append(notice)
+
+    for payload in payloads:
+        handler(payload, fromstring(payload))
+
+    assert [notice.notice_type for notice in notices] == [
+        notice_types.FERMI_GBM_FLT_POS, notice_types.KILL_SOCKET]
+    assert [notice.payload for notice in notices] == payloads
+
+
+def test_dispatcher():
+    t = []
+    dispatcher = handlers.Dispatcher()
+
+    @dispatcher.register(notice_types.FERMI_GBM_FLT_POS,
+                         notice_types.FERMI_GBM_GND_POS)
+    def handle_gbm(payload, root):
+        t.append(('gbm', handlers.get_notice_type(root)))
+
+    @dispatcher.register()
+    def handle_all(payload, root):
+        t.append(('all', handlers.get_notice_type(root)))
+
+    @dispatcher.register(notice_types.FERMI_GBM_FLT_POS)
+    def handle_error(payload, root):
+        raise RuntimeError
+
+    assert dispatcher.accepts(notice_types.KILL_SOCKET)
+    for payload in payloads:
+        dispatcher(payload, fromstring(payload))
+
+    assert t == [('gbm', notice_types.FERMI_GBM_FLT_POS),
+                 ('all', notice_types.FERMI_GBM_FLT_POS),
+                 ('all', notice_types.KILL_SOCKET)]
+
+
+def test_dispatcher_accepts():
+    dispatcher = handlers.Dispatcher()
+    dispatcher.add(lambda payload, root: None, notice_types.FERMI_GBM_FLT_POS)
+    assert dispatcher.accepts(notice_types.FERMI_GBM_FLT_POS)
+    assert not dispatcher.accepts(notice_types.KILL_SOCKET)
+
+
 def test_archive(tmpdir):
     try:
         old_dir = os.getcwd()
@@ -0,0 +1,28 @@
+import importlib
+import subprocess
+import sys
+
+import gcn
+
+
+def test_lazy_names():
+    """Test that the names of the lazily imported modules are up to date."""
+    for module, names in gcn._lazy_modules.items():
+        module = importlib.import_module('gcn.' + module)
+        assert tuple(module.__all__) == names
+        for name in names:
+            assert getattr(gcn, name) is getattr(module, name)
+    assert set(gcn.__all__) <= set(dir(gcn))
+
+
+def test_import_is_light():
+    """Test that importing gcn does not import subsystems that are not needed
+    to listen for notices."""
+    heavy = ['asyncio', 'http.server', 'multiprocessing', 'sqlite3',
+             'gcn.query', 'gcn.store', 'gcn.workers']
+    for statement in ['import gcn, gcn.cmdline', 'from gcn import *']:
+        output = subprocess.check_output([
+            sys.executable, '-c', 'import sys; {0}; print(" ".join('
+            'name for name in {1!r} if name in sys.modules))'.format(
+                statement, heavy)])
+        assert output.split() == []
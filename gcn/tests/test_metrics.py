@@ -0,0 +1,95 @@
+from importlib import resources
+import logging
+import socket
+from urllib.request import urlopen
+
+from . import data
+from .. import metrics
+from .. import voeventclient
+
+payloads = [resources.read_binary(data, 'gbm_flt_pos.xml'),
+            resources.read_binary(data, 'kill_socket.xml')]
+
+iamalive = voeventclient._form_response(
+    'iamalive', 'ivo://gcn.test/server', 'ivo://gcn.test/server',
+    '2026-01-01T00:00:00')
+
+
+def ingest(packets, handler, m=None):
+    """Feed packets to _ingest_packet, reporting to the given metrics (by
+    default, a new InMemoryMetrics instance)."""
+    if m is None:
+        m = metrics.InMemoryMetrics()
+    log = logging.getLogger('gcn.test')
+    a, b = socket.socketpair()
+    with a, b:
+        b.settimeout(1)
+        reader = voeventclient._PacketReader(b)
+        for packet in packets:
+            voeventclient._send_packet(a, packet)
+            voeventclient._ingest_packet(
+                reader, 'ivo://gcn.test/client', handler, log, m)
+    return m
+
+
+def test_in_memory_metrics():
+    def handler(payload, root):
+        if b'Packet_Type" value="4"' in payload:
+            raise RuntimeError
+
+    m = ingest(payloads + [iamalive], handler)
+    snapshot = m.snapshot()
+    assert snapshot['packets'] == 3
+    assert snapshot['bytes'] == sum(
+        len(packet) + 4 for packet in payloads + [iamalive])
+    assert snapshot['iamalives'] == 1
+    assert snapshot['handler_exceptions'] == 1
+    assert snapshot['parse_seconds']['count'] == 3
+    assert snapshot['send_seconds']['count'] == 3
+    assert snapshot['handler_seconds']['count'] == 2
+    assert sum(snapshot['handler_seconds']['buckets']) == 2
+    assert snapshot['seconds_since_iamalive'] >= 0
+    assert not snapshot['connected']
+
+
+def test_base_metrics():
+    # The base class accepts every call and does nothing.
+    m = ingest(payloads + [iamalive], lambda payload, root: None,
+               metrics.Metrics())
+    m.connected('127.0.0.1', 8099)
+    m.disconnected('127.0.0.1', 8099)
+
+
+def test_redundant_connections():
+    """Test that one connection closing does not hide the others."""
+    m = metrics.InMemoryMetrics()
+    m.connected('45.58.43.186', 8099)
+    m.connected('68.169.57.253', 8099)
+    m.disconnected('45.58.43.186', 8099)
+    snapshot = m.snapshot()
+    assert snapshot['connected'] == 1
+    assert snapshot['connections'] == {
+        ('45.58.43.186', 8099): 0, ('68.169.57.253', 8099): 1}
+    text = m.prometheus_text()
+    assert 'gcn_connections 1\n' in text
+    assert 'gcn_connected{host="45.58.43.186",port="8099"} 0\n' in text
+    assert 'gcn_connected{host="68.169.57.253",port="8099"} 1\n' in text
+
+
+def test_serve_metrics():
+    m = ingest(payloads, None)
+    m.connected('127.0.0.1', 8099)
+    server = metrics.serve_metrics(m, port=0)
+    try:
+        url = 'http://127.0.0.1:{0}/metrics'.format(server.server_port)
+        with urlopen(url, timeout=5) as response:
+            text = response.read().decode()
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert 'gcn_received_packets_total 2\n' in text
+    assert 'gcn_connections 1\n' in text
+    assert 'gcn_connected{host="127.0.0.1",port="8099"} 1\n' in text
+    assert 'gcn_parse_seconds_bucket{le="+Inf"} 2\n' in text
+    assert 'gcn_parse_seconds_count 2\n' in text
+    assert 'gcn_seconds_since_iamalive' not in text
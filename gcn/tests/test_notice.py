@@ -0,0 +1,51 @@
+from importlib import resources
+import pickle
+
+from lxml.etree import fromstring
+import pytest
+
+from . import data
+from .. import notice_types
+from ..notice import Notice
+
+payloads = [resources.read_binary(data, 'gbm_flt_pos.xml'),
+            resources.read_binary(data, 'kill_socket.xml')]
+
+
+def test_from_root():
+    root = fromstring(payloads[0])
+    notice = Notice.from_root(root)
+    assert notice.ivorn == root.get('ivorn')
+    assert notice.notice_type == notice_types.FERMI_GBM_FLT_POS
+    assert notice.role == 'observation'
+    assert notice.trigger == '336801278'
+    assert notice.time == pytest.approx(1315108476.02)
+    assert notice.date == 1315108491
+    assert (notice.ra, notice.dec, notice.error) == (193.0, -31.75, 17.4333)
+    assert notice.payload is None
+    with pytest.raises(ValueError):
+        notice.parse()
+
+    notice = Notice.from_payload(payloads[1])
+    assert notice.notice_type == notice_types.KILL_SOCKET
+    assert notice.trigger is notice.ra is None
+    assert notice.parse().get('ivorn') == notice.ivorn
+
+
+def test_immutable():
+    notice = Notice.from_payload(payloads[0])
+    assert not hasattr(notice, '__dict__')
+    with pytest.raises(AttributeError):
+        notice.ivorn = 'ivo://gcn.test/other'
+    with pytest.raises(AttributeError):
+        del notice.ivorn
+
+
+def test_pickle():
+    for payload in payloads:
+        notice = Notice.from_payload(payload)
+        copy = pickle.loads(pickle.dumps(notice))
+        assert copy == notice
+        assert hash(copy) == hash(notice)
+        assert copy.payload == payload
+    assert 'payload' not in repr(notice)
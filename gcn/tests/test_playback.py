@@ -0,0 +1,74 @@
+from importlib import resources
+import logging
+import socket
+import threading
+import time
+
+from lxml.etree import fromstring
+
+from . import data
+from .. import listen, notice_types
+from ..handlers import include_notice_types
+from ..playback import replay, serve_replay
+from ..store import SegmentedArchive
+
+payloads = [resources.read_binary(data, 'gbm_flt_pos.xml'),
+            resources.read_binary(data, 'kill_socket.xml')]
+
+
+def test_replay(tmp_path):
+    directory = str(tmp_path / 'archive')
+    with SegmentedArchive(directory) as archive:
+        for payload in payloads * 3:
+            archive(payload, fromstring(payload))
+
+    handled = []
+
+    @include_notice_types(notice_types.KILL_SOCKET)
+    def handler(payload, root):
+        handled.append(payload)
+
+    result = replay(directory, handler)
+    assert result.packets == 6
+    assert result.bytes == 3 * sum(len(payload) for payload in payloads)
+    assert result.responses == 6
+    assert result.packets_per_second > 0
+    assert handled == [payloads[1]] * 3
+
+    # Syntax errors are skipped.
+    assert replay([b'<VOEvent', payloads[0]]).responses == 1
+
+
+def test_replay_speed():
+    timed = [(1000.0, payloads[0]), (1000.5, payloads[1]),
+             (1001.0, payloads[0])]
+    start = time.monotonic()
+    result = replay(timed, speed=10)
+    assert time.monotonic() - start >= 0.1
+    assert result.packets == 3
+
+
+def test_serve_replay():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+
+    results = []
+    server = threading.Thread(target=lambda: results.append(
+        serve_replay(payloads * 2, port=port)))
+    server.start()
+    time.sleep(0.1)
+
+    handled = []
+    log = logging.getLogger('gcn.tests.test_playback')
+    client = threading.Thread(target=listen, kwargs=dict(
+        host='127.0.0.1', port=port, handler=lambda payload, root:
+        handled.append(payload), log=log))
+    client.daemon = True
+    client.start()
+
+    server.join(10)
+    result, = results
+    assert result.packets == result.responses == 4
+    assert handled == payloads * 2
@@ -0,0 +1,79 @@
+import datetime
+from importlib import resources
+
+from lxml.etree import fromstring
+import pytest
+
+from . import data, make_payload
+from .. import notice_types
+from ..query import NoticeIndex, _parse_time
+
+template = resources.read_binary(data, 'gbm_flt_pos.xml')
+
+
+def make_notice(*args):
+    payload = make_payload(*args)
+    return payload, fromstring(payload)
+
+
+@pytest.fixture
+def index():
+    with NoticeIndex(':memory:') as index:
+        for i, args in enumerate([
+                (notice_types.FERMI_GBM_FLT_POS, 1, b'2020-01-01T00:00:00',
+                 10.0, 20.0),
+                (notice_types.FERMI_GBM_GND_POS, 1, b'2020-01-01T00:01:00',
+                 10.5, 20.5),
+                (notice_types.FERMI_GBM_GND_POS, 2, b'2020-01-02T00:00:00.5',
+                 200.0, -60.0),
+                (notice_types.FERMI_GBM_FIN_POS, 1, b'2020-01-01T01:00:00',
+                 11.0, 20.0)]):
+            index(*make_notice(i, *args))
+        yield index
+
+
+def test_parse_time():
+    assert _parse_time('1970-01-01T00:00:01.25Z') == 1.25
+    assert _parse_time('2011-09-04T03:54:36.02') == pytest.approx(
+        1315108476.02)
+
+
+def test_extract(tmp_path):
+    payload = template
+    with NoticeIndex(str(tmp_path / 'notices.sqlite')) as index:
+        index(payload, fromstring(payload))
+    with NoticeIndex(str(tmp_path / 'notices.sqlite')) as index:
+        notice, = index.query()
+    assert notice.ivorn == fromstring(payload).attrib['ivorn']
+    assert notice.notice_type == notice_types.FERMI_GBM_FLT_POS
+    assert notice.trigger == '336801278'
+    assert notice.time == pytest.approx(1315108476.02)
+    assert (notice.ra, notice.dec, notice.error) == (193.0, -31.75, 17.4333)
+    assert notice.payload == payload
+
+
+def test_query(index):
+    assert len(index) == 4
+    gnd = index.query(notice_types.FERMI_GBM_GND_POS)
+    assert [n.trigger for n in gnd] == ['1', '2']
+
+    assert len(index.query(
+        [notice_types.FERMI_GBM_GND_POS, notice_types.FERMI_GBM_FIN_POS],
+        start='2020-01-01T00:00:30')) == 3
+    assert len(index.query(
+        start=datetime.datetime(2020, 1, 1, 0, 0, 30),
+        end=datetime.datetime(2020, 1, 1, 12))) == 2
+
+    latest = index.latest(trigger=1)
+    assert latest.notice_type == notice_types.FERMI_GBM_FIN_POS
+    assert index[latest.ivorn] == latest.payload
+    assert index.latest(notice_types.FERMI_GBM_GND_POS, trigger=2).dec == -60
+    assert index.latest(trigger=3) is None
+    with pytest.raises(KeyError):
+        index['ivo://gcn.test/missing']
+
+    assert len(index.query(cone=(10.0, 20.0, 1.0))) == 3
+    assert len(index.query(cone=(10.0, 20.0, 0.7))) == 2
+    assert [n.ra for n in index.query(cone=(10.0, 20.0, 1.0), limit=1,
+                                      descending=True)] == [11.0]
+    assert len(index.query(cone=(200.0, -60.0, 0.1))) == 1
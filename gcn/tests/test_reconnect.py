@@ -0,0 +1,122 @@
+import logging
+import socket
+import threading
+import time
+
+import pytest
+
+from ..reconnect import ReconnectScheduler
+
+
+def unused_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def server():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(8)
+    with sock:
+        yield sock
+
+
+def test_connect_first_healthy(server):
+    dead = ('127.0.0.1', unused_port())
+    live = server.getsockname()
+    scheduler = ReconnectScheduler([dead, live], timeout=5)
+
+    start = time.monotonic()
+    sock, health = scheduler.connect()
+    with sock:
+        assert time.monotonic() - start < 1
+        assert (health.host, health.port) == live
+        assert sock.gettimeout() == 5
+        assert sock.getpeername() == live
+
+    dead_health = scheduler.hosts[0]
+    assert dead_health.consecutive_failures == 1
+    assert dead_health.retry_at > time.monotonic()
+    assert health.latency is not None
+    assert health.score < dead_health.score
+
+    # The dead host is backing off, so the next attempt does not touch it.
+    sock, health = scheduler.connect()
+    with sock:
+        assert (health.host, health.port) == live
+    assert dead_health.consecutive_failures == 1
+
+    scheduler.disconnected(health)
+    assert health.uptime is not None
+
+
+def test_backoff():
+    scheduler = ReconnectScheduler([('127.0.0.1', unused_port())],
+                                   min_backoff=1, max_backoff=4)
+    health = scheduler.hosts[0]
+    backoffs = []
+    for _ in range(5):
+        now = time.monotonic()
+        scheduler._failed(health, now)
+        backoffs.append(health.retry_at - now)
+    for backoff, limit in zip(backoffs, [1, 2, 4, 4, 4]):
+        assert 0.5 * limit <= backoff <= limit
+
+
+@pytest.mark.parametrize('min_backoff,max_backoff', [
+    (0.25, 1), (0.25, 1024), (0, 1), (1, 1)])
+def test_backoff_long_outage(min_backoff, max_backoff):
+    """The backoff stays at its maximum however many attempts fail."""
+    scheduler = ReconnectScheduler([('127.0.0.1', unused_port())],
+                                   min_backoff=min_backoff,
+                                   max_backoff=max_backoff,
+                                   log=logging.getLogger('gcn.tests'))
+    scheduler.log.disabled = True
+    health = scheduler.hosts[0]
+    try:
+        for _ in range(5000):
+            scheduler._failed(health, 0.0)
+    finally:
+        scheduler.log.disabled = False
+    assert health.consecutive_failures == 5000
+    if min_backoff:
+        assert 0.5 * max_backoff <= health.retry_at <= max_backoff
+    else:
+        assert health.retry_at == 0
+
+
+def test_reconnect_after_restart():
+    """The scheduler reconnects promptly when a server comes back."""
+    port = unused_port()
+    scheduler = ReconnectScheduler([('127.0.0.1', port)], timeout=5,
+                                   min_backoff=0.05, max_backoff=0.2)
+    restarted = threading.Event()
+
+    def restart():
+        time.sleep(0.3)
+        sock = socket.socket()
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(('127.0.0.1', port))
+        sock.listen(1)
+        restarted.sock = sock
+        restarted.set()
+
+    thread = threading.Thread(target=restart)
+    thread.start()
+    start = time.monotonic()
+    sock, health = scheduler.connect()
+    elapsed = time.monotonic() - start
+    thread.join()
+    sock.close()
+    restarted.sock.close()
+    assert restarted.is_set()
+    assert 0.3 <= elapsed < 1
+    assert health.consecutive_failures == 0
+    assert health.recent_failures > 0
+
+
+def test_no_hosts():
+    with pytest.raises(ValueError):
+        ReconnectScheduler([])
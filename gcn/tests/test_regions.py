@@ -0,0 +1,57 @@
+from importlib import resources
+
+from lxml.etree import fromstring
+import pytest
+
+from . import data
+from ..regions import Cone, get_position, HEALPixMask, Polygon, _unit_vector
+
+payloads = [resources.read_binary(data, 'gbm_flt_pos.xml'),
+            resources.read_binary(data, 'kill_socket.xml')]
+
+
+def test_get_position():
+    vector, error = get_position(fromstring(payloads[0]))
+    assert vector == pytest.approx(_unit_vector(193.0, -31.75))
+    assert error == 17.4333
+    assert get_position(fromstring(payloads[1])) is None
+
+
+def test_cone():
+    cone = Cone(10.0, 20.0, 5.0)
+    assert cone.contains(_unit_vector(10.0, 24.9))
+    assert not cone.contains(_unit_vector(10.0, 25.1))
+    assert cone.contains(_unit_vector(10.0, 25.1), 0.2)
+    assert cone.contains(_unit_vector(190.0, -20.0), 180.0)
+
+
+@pytest.mark.parametrize('vertices', [
+    [(0, -10), (20, -10), (20, 10), (0, 10)],
+    [(0, 10), (20, 10), (20, -10), (0, -10)]])
+def test_polygon(vertices):
+    polygon = Polygon(vertices)
+    assert polygon.contains(_unit_vector(10, 0))
+    assert polygon.contains(_unit_vector(1, 9))
+    assert not polygon.contains(_unit_vector(21, 0))
+    assert not polygon.contains(_unit_vector(180, 0))
+    # Near an edge
+    assert polygon.contains(_unit_vector(21, 0), 1.5)
+    assert not polygon.contains(_unit_vector(21, 0), 0.5)
+    # Near a vertex, but beyond the ends of both edges
+    assert polygon.contains(_unit_vector(21, 11), 1.5)
+    assert not polygon.contains(_unit_vector(21, 11), 1.0)
+
+
+def test_polygon_too_few_vertices():
+    with pytest.raises(ValueError):
+        Polygon([(0, 0), (1, 1)])
+
+
+def test_healpix_mask():
+    healpy = pytest.importorskip('healpy')
+    nside = 16
+    pixel = healpy.ang2pix(nside, 193.0, -31.75, lonlat=True)
+    mask = HEALPixMask([pixel], nside)
+    assert mask.contains(_unit_vector(193.0, -31.75))
+    assert not mask.contains(_unit_vector(13.0, 31.75))
+    assert mask.contains(_unit_vector(196.0, -31.75), 5.0)
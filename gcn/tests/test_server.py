@@ -0,0 +1,204 @@
+from importlib import resources
+import os
+import socket
+import threading
+import time
+
+from lxml.etree import fromstring
+import pytest
+
+from . import data
+from ..reconnect import ReconnectScheduler
+from ..server import Broadcaster, Relay
+from ..voeventclient import (
+    _form_response, _recv_packet, _send_packet, _size_len)
+
+payloads = [resources.read_binary(data, 'gbm_flt_pos.xml'),
+            resources.read_binary(data, 'kill_socket.xml')]
+
+
+def start(**kwargs):
+    server = Broadcaster(port=0, **kwargs)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server, thread
+
+
+def connect(server, count):
+    socks = [socket.create_connection(server.address, timeout=5)
+             for _ in range(count)]
+    deadline = time.monotonic() + 5
+    while len(server.subscribers) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return socks
+
+
+def test_broadcast():
+    server, thread = start()
+    socks = connect(server, 3)
+    try:
+        for payload in payloads * 2:
+            server.publish(payload)
+        for sock in socks:
+            for payload in payloads * 2:
+                assert _recv_packet(sock) == payload
+                _send_packet(sock, _form_response(
+                    'ack', fromstring(payload).attrib['ivorn'],
+                    'ivo://gcn.test/client', '2026-01-01T00:00:00'))
+
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and any(
+                subscriber.responses < 4
+                for subscriber in server.subscribers.values()):
+            time.sleep(0.01)
+        assert [subscriber.responses
+                for subscriber in server.subscribers.values()] == [4, 4, 4]
+    finally:
+        server.close()
+        thread.join(5)
+        for sock in socks:
+            sock.close()
+    assert not thread.is_alive()
+
+
+def test_evict_slow_subscriber():
+    """Test that a subscriber that does not read is disconnected, while one
+    that keeps up is not."""
+    packet = b'x' * 1024
+    server, thread = start(max_buffer=256 * len(packet))
+    fast, slow = connect(server, 2)
+    drained = [0]
+
+    def drain():
+        try:
+            while True:
+                data = fast.recv(65536)
+                if not data:
+                    break
+                drained[0] += len(data)
+        except OSError:
+            pass
+
+    drainer = threading.Thread(target=drain)
+    drainer.daemon = True
+    drainer.start()
+    try:
+        # Never let the fast subscriber fall more than a quarter of
+        # max_buffer behind, however slowly the drainer thread runs.
+        published = 0
+        deadline = time.monotonic() + 30
+        while len(server.subscribers) > 1 and time.monotonic() < deadline:
+            if published - drained[0] < server.max_buffer // 4:
+                server.publish(packet)
+                published += _size_len + len(packet)
+            else:
+                time.sleep(0.001)
+        assert [subscriber.addr for subscriber in
+                server.subscribers.values()] == [fast.getsockname()]
+    finally:
+        server.close()
+        thread.join(5)
+        fast.close()
+        slow.close()
+
+
+def test_iamalive():
+    server, thread = start(iamalive_interval=0.1)
+    sock, = connect(server, 1)
+    try:
+        root = fromstring(_recv_packet(sock))
+        assert root.attrib['role'] == 'iamalive'
+    finally:
+        server.close()
+        thread.join(5)
+        sock.close()
+
+
+class StopListening(Exception):
+    pass
+
+
+def stop_listening(*args):
+    raise StopListening
+
+
+def test_relay(tmp_path, monkeypatch):
+    """Test relaying from an upstream server to TCP and Unix socket
+    subscribers through a relay."""
+    upstream, upstream_thread = start()
+    handled = []
+    unix_path = str(tmp_path / 'relay.sock')
+    relay = Relay(port=0, unix_path=unix_path,
+                  handler=lambda payload, root: handled.append(payload))
+
+    def run():
+        with pytest.raises(StopListening):
+            relay.run(host=upstream.address[0], port=upstream.address[1])
+
+    relay_thread = threading.Thread(target=run)
+    relay_thread.daemon = True
+    relay_thread.start()
+
+    tcp = socket.create_connection(relay.address, timeout=5)
+    unix = socket.socket(socket.AF_UNIX)
+    unix.settimeout(5)
+    unix.connect(unix_path)
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline and (
+            len(upstream.subscribers) < 1 or len(relay.subscribers) < 2):
+        time.sleep(0.01)
+
+    try:
+        for payload in payloads:
+            upstream.publish(payload, fromstring(payload).attrib['ivorn'])
+        for sock in [tcp, unix]:
+            for payload in payloads:
+                assert _recv_packet(sock) == payload
+            # Acknowledge only the first one.
+            _send_packet(sock, _form_response(
+                'ack', fromstring(payloads[0]).attrib['ivorn'],
+                'ivo://gcn.test/client', '2026-01-01T00:00:00'))
+
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline and not all(
+                subscriber.acks for subscriber in relay.subscribers.values()):
+            time.sleep(0.01)
+        assert handled == payloads
+        for subscriber in relay.subscribers.values():
+            assert subscriber.acks == 1
+            assert list(subscriber.unacked) == [
+                fromstring(payloads[1]).attrib['ivorn']]
+
+        # The relay acknowledged both VOEvents upstream.
+        subscriber, = upstream.subscribers.values()
+        assert subscriber.acks == 2
+        assert not subscriber.unacked
+    finally:
+        tcp.close()
+        unix.close()
+        # Closing the upstream server drops the relay's connection, and then
+        # gcn.listen gives up instead of reconnecting, so Relay.run returns.
+        monkeypatch.setattr(ReconnectScheduler, 'connect', stop_listening)
+        upstream.close()
+        upstream_thread.join(5)
+        relay_thread.join(5)
+    assert not relay_thread.is_alive()
+    assert not os.path.exists(unix_path)
+
+
+def test_relay_stale_socket(tmp_path):
+    """Test that a relay replaces a Unix domain socket that was left behind,
+    but not one that is in use."""
+    unix_path = str(tmp_path / 'relay.sock')
+    with socket.socket(socket.AF_UNIX) as sock:
+        sock.bind(unix_path)
+    relay = Relay(port=0, unix_path=unix_path)
+    relay.close()
+    relay.serve_forever()
+
+    with socket.socket(socket.AF_UNIX) as sock:
+        sock.bind(unix_path + '.live')
+        sock.listen(1)
+        with pytest.raises(OSError):
+            Relay(port=0, unix_path=unix_path + '.live')
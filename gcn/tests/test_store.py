@@ -0,0 +1,152 @@
+import gzip
+from importlib import resources
+import lzma
+import os
+from urllib.parse import quote_plus
+
+from lxml.etree import fromstring
+import pytest
+
+from . import data
+from ..codec import DictionaryCodec
+from .. import notice_types
+from ..store import ArchiveReader, BackgroundArchive, SegmentedArchive
+
+payloads = [resources.read_binary(data, 'gbm_flt_pos.xml'),
+            resources.read_binary(data, 'kill_socket.xml')]
+
+
+def test_segmented_archive(tmp_path):
+    directory = str(tmp_path / 'archive')
+
+    # Small segments, so that each one holds only one or two VOEvents.
+    with SegmentedArchive(directory, segment_size=8192,
+                          fsync_every=2) as archive:
+        for payload in payloads * 2:
+            archive(payload, fromstring(payload))
+    assert archive.segment > 0
+
+    # Reopening continues where it left off.
+    with SegmentedArchive(directory, segment_size=8192) as archive:
+        archive.append(b'<VOEvent/>', 'ivo://gcn.test/other', timestamp=1.0)
+
+    with ArchiveReader(directory) as reader:
+        assert len(reader) == 5
+        entries = list(reader)
+        assert [entry.notice_type for entry in entries] == [
+            notice_types.FERMI_GBM_FLT_POS, notice_types.KILL_SOCKET] * 2 + [
+            -1]
+        assert [reader.read(entry) for entry in entries] == (
+            payloads * 2 + [b'<VOEvent/>'])
+        assert entries[-1].timestamp == 1.0
+        assert entries[-1].segment == archive.segment
+
+        for payload in payloads:
+            ivorn = fromstring(payload).attrib['ivorn']
+            assert ivorn in reader
+            assert reader[ivorn] == payload
+        assert 'ivo://gcn.test/missing' not in reader
+
+        # The reader sees VOEvents that are archived later.
+        with SegmentedArchive(directory, segment_size=8192) as archive:
+            archive(payloads[0], fromstring(payloads[0]))
+        reader.refresh()
+        assert len(reader) == 6
+        assert list(reader.payloads())[-1] == payloads[0]
+
+
+def test_segmented_archive_codec(tmp_path):
+    directory = str(tmp_path / 'archive')
+    codec = DictionaryCodec.train(payloads * 4, backend='zlib')
+    with SegmentedArchive(directory, codec=codec) as archive:
+        for payload in payloads:
+            archive(payload, fromstring(payload))
+
+    with ArchiveReader(directory) as reader:
+        assert reader.codec == codec
+        assert list(reader.payloads()) == payloads
+        assert all(entry.length < len(payload) / 2
+                   for entry, payload in zip(reader, payloads))
+
+    # The codec cannot be changed, or added to an existing archive.
+    with pytest.raises(ValueError):
+        SegmentedArchive(directory)
+    with pytest.raises(ValueError):
+        SegmentedArchive(directory, codec=DictionaryCodec(backend='zlib'))
+    with pytest.raises(ValueError):
+        SegmentedArchive(str(tmp_path / 'plain')).close()
+        SegmentedArchive(str(tmp_path / 'plain'), codec=codec)
+    SegmentedArchive(directory, codec=DictionaryCodec.loads(
+        codec.dumps())).close()
+
+
+def test_segmented_archive_recover(tmp_path):
+    """Test that reopening an archive after a crash in the middle of a write
+    discards the incomplete record."""
+    directory = str(tmp_path)
+    with SegmentedArchive(directory) as archive:
+        for i in range(3):
+            archive.append(payloads[0], 'ivo://gcn.test/%d' % i)
+
+    # Tear the last index record, and leave a partial payload after it.
+    index_path = tmp_path / '00000000.idx'
+    data_path = tmp_path / '00000000.vtp'
+    os.truncate(str(index_path), index_path.stat().st_size - 3)
+    with data_path.open('ab') as f:
+        f.write(b'\0\0\1\0<VOEv')
+
+    with SegmentedArchive(directory) as archive:
+        archive.append(payloads[1], 'ivo://gcn.test/3')
+
+    with ArchiveReader(directory) as reader:
+        assert [entry.ivorn for entry in reader] == [
+            'ivo://gcn.test/0', 'ivo://gcn.test/1', 'ivo://gcn.test/3']
+        assert list(reader.payloads()) == [payloads[0]] * 2 + [payloads[1]]
+
+
+@pytest.mark.parametrize('compression,decompress', [
+    (None, bytes), ('gzip', gzip.decompress), ('xz', lzma.decompress)])
+def test_background_archive(tmp_path, compression, decompress):
+    with BackgroundArchive(str(tmp_path), max_batch=2, max_latency=0.01,
+                           compression=compression, fsync=True) as archive:
+        for payload in payloads:
+            archive(payload, fromstring(payload))
+        archive.flush()
+        assert archive.written == 2
+        archive(payloads[0], fromstring(payloads[0]))
+    # Closing writes whatever is still queued.
+    assert archive.written == 3
+
+    ext = {None: '', 'gzip': '.gz', 'xz': '.xz'}[compression]
+    assert sorted(os.listdir(str(tmp_path))) == sorted(
+        quote_plus(fromstring(payload).attrib['ivorn']) + ext
+        for payload in payloads)
+    for payload in payloads:
+        path = tmp_path / (
+            quote_plus(fromstring(payload).attrib['ivorn']) + ext)
+        assert decompress(path.read_bytes()) == payload
+
+
+def test_background_archive_error(tmp_path):
+    archive = BackgroundArchive(str(tmp_path), max_latency=0.01)
+
+    def compress(payload):
+        if payload == payloads[0]:
+            raise RuntimeError('compressor failed')
+        return payload
+
+    archive._compress = compress
+    with archive:
+        for payload in payloads:
+            archive(payload, fromstring(payload))
+
+    # The failed VOEvent leaves no temporary file behind, and does not keep
+    # the rest of the batch from being written.
+    assert archive.written == 1
+    assert os.listdir(str(tmp_path)) == [
+        quote_plus(fromstring(payloads[1]).attrib['ivorn'])]
+
+
+def test_background_archive_invalid():
+    with pytest.raises(ValueError):
+        BackgroundArchive(compression='rar')
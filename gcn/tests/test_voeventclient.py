@@ -1,7 +1,22 @@
+from importlib import resources
+import logging
+import random
+import socket
+import threading
+import time
+
+from lxml import etree
 import pytest
 
+from . import data
+from .. import listen
+from .. import voeventclient
 from ..voeventclient import _validate_host_port
 
+payloads = [resources.read_binary(data, 'gbm_flt_pos.xml'),
+            resources.read_binary(data, 'kill_socket.xml')]
+iamalive = resources.read_binary(data, 'iamalive.xml')
+
 
 @pytest.mark.parametrize('host', ['a', ['a'], ('a',)])
 @pytest.mark.parametrize('port', [1, [1], (1,)])
@@ -40,3 +55,407 @@ def test_validate_mismatched_numbers_of_hosts_and_ports():
     port = [1, 2, 3]
     with pytest.raises(ValueError):
         _validate_host_port(host, port)
+
+
+def test_seen_ivorns_window(monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(voeventclient.time, 'monotonic', lambda: now[0])
+    seen = voeventclient._SeenIvorns(window=10, maxsize=2)
+    assert seen.add('a')
+    assert not seen.add('a')
+    now[0] = 11
+    assert seen.add('a')
+    assert seen.add('b')
+    assert seen.add('c')
+    # 'a' was evicted to stay within maxsize
+    assert seen.add('a')
+    assert not seen.add('c')
+
+
+def test_recent_payloads():
+    recent = voeventclient._RecentPayloads(maxsize=2)
+    digests = [recent.digest(payload) for payload in [b'a', b'b', b'c']]
+    recent.add(digests[0], 'ivo://a')
+    recent.add(digests[1], 'ivo://b')
+    assert recent.get(digests[0]) == 'ivo://a'
+    recent.add(digests[2], 'ivo://c')
+    # 'b' was evicted because 'a' was used more recently
+    assert recent.get(digests[1]) is None
+    assert recent.get(digests[0]) == 'ivo://a'
+    assert recent.get(digests[2]) == 'ivo://c'
+
+
+def test_dispatch_duplicate_payload(monkeypatch):
+    """Test that an identical payload is acknowledged without parsing it and
+    without calling the handler again."""
+    received = []
+    log = logging.getLogger('gcn.test')
+    recent = voeventclient._RecentPayloads()
+    a, b = socket.socketpair()
+    with a, b:
+        a.settimeout(1)
+        assert voeventclient._dispatch(
+            payloads[0], b, 'ivo://gcn.test/client',
+            lambda payload, root: received.append(payload), log,
+            recent=recent)
+        first = voeventclient._recv_packet(a)
+
+        def fail(payload):
+            raise AssertionError('should not have parsed the payload')
+
+        monkeypatch.setattr(voeventclient, 'fromstring', fail)
+        assert voeventclient._dispatch(
+            bytearray(payloads[0]), b, 'ivo://gcn.test/client',
+            lambda payload, root: received.append(payload), log,
+            recent=recent)
+        second = voeventclient._recv_packet(a)
+
+    assert received == [payloads[0]]
+    assert b'role="ack"' in second
+    assert (first.split(b'<TimeStamp>')[0] ==
+            second.split(b'<TimeStamp>')[0])
+
+
+def serve_once(sock, payloads):
+    """Send payloads to the first client to connect, reading its responses,
+    and then hold the connection open."""
+    conn, _ = sock.accept()
+    conn.settimeout(5)
+    for payload in payloads:
+        voeventclient._send_packet(conn, payload)
+        voeventclient._recv_packet(conn)
+    conn.recv(1)
+
+
+def test_redundant():
+    """Test that each VOEvent is handled once in redundant mode, even though
+    every server sends it."""
+    received = []
+    socks = []
+    for _ in range(3):
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        sock.listen(1)
+        sock.settimeout(5)
+        socks.append(sock)
+        thread = threading.Thread(target=serve_once, args=(sock, payloads))
+        thread.daemon = True
+        thread.start()
+
+    client_thread = threading.Thread(
+        target=listen,
+        kwargs=dict(host='127.0.0.1',
+                    port=[sock.getsockname()[1] for sock in socks],
+                    handler=lambda payload, root: received.append(payload),
+                    redundant=True))
+    client_thread.daemon = True
+    client_thread.start()
+
+    deadline = time.monotonic() + 5
+    while len(received) < len(payloads) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.2)
+    assert sorted(received) == sorted(payloads)
+
+
+def test_parse_header():
+    header = voeventclient._parse_header(payloads[0], chunk_size=64)
+    assert header.tag == '{http://www.ivoa.net/xml/VOEvent/v1.1}VOEvent'
+    assert header.role == 'observation'
+    assert header.ivorn == (
+        'ivo://nasa.gsfc.gcn/Fermi#GBM_Flt_Pos_2011-09-04T03:54:36.02_'
+        '336801278_45-956')
+    assert header.notice_type == 111
+
+    header = voeventclient._parse_header(payloads[1])
+    assert header.ivorn == 'ivo://nasa.gsfc.gcn/gcn'
+    assert header.notice_type == 4
+
+    header = voeventclient._parse_header(voeventclient._form_response(
+        'iamalive', 'ivo://gcn.test/server', 'ivo://gcn.test/client',
+        '2026-01-01T00:00:00'))
+    assert header.tag in voeventclient._valid_vtp_root_tags
+    assert header.role == 'iamalive'
+    assert header.notice_type is None
+
+
+def test_respond_skips_unaccepted(monkeypatch):
+    def fail(payload):
+        raise AssertionError('should not have parsed the whole payload')
+
+    log = logging.getLogger('gcn.test')
+    monkeypatch.setattr(voeventclient, 'fromstring', fail)
+    response, root = voeventclient._respond(
+        payloads[0], 'ivo://gcn.test/client', log, lambda _: False)
+    assert root is None
+    assert b'role="ack"' in response
+    assert b'GBM_Flt_Pos' in response
+
+    monkeypatch.undo()
+    response, root = voeventclient._respond(
+        payloads[0], 'ivo://gcn.test/client', log, lambda _: True)
+    assert root is not None
+    assert b'role="ack"' in response
+
+
+def test_respond_header_only(monkeypatch):
+    def fail(payload):
+        raise AssertionError('should not have parsed the whole payload')
+
+    log = logging.getLogger('gcn.test')
+    monkeypatch.setattr(voeventclient, 'fromstring', fail)
+    response, header = voeventclient._respond(
+        payloads[0], 'ivo://gcn.test/client', log, header_only=True)
+    assert b'role="ack"' in response
+    assert header.ivorn.startswith('ivo://nasa.gsfc.gcn/Fermi#GBM_Flt_Pos')
+    assert header.notice_type == 111
+
+
+def test_respond_parser():
+    log = logging.getLogger('gcn.test')
+    payload = payloads[0].replace(b'<Who>', b'<!-- comment --><Who>', 1)
+    _, root = voeventclient._respond(
+        payload, 'ivo://gcn.test/client', log)
+    assert any(isinstance(element, etree._Comment)
+               for element in root.iter())
+
+    parser = etree.XMLParser(remove_blank_text=True, remove_comments=True,
+                             resolve_entities=False)
+    _, root = voeventclient._respond(
+        payload, 'ivo://gcn.test/client', log, parser=parser)
+    assert not any(isinstance(element, etree._Comment)
+                   for element in root.iter())
+    assert all(element.tail is None for element in root.iter())
+    assert root.find('./Who/Date') is not None
+
+
+def test_respond_header_parser(caplog):
+    """Test that the header scan uses the same options as the parser."""
+    log = logging.getLogger('gcn.test')
+    # Malformed before the notice type, so only a recovering parser can read
+    # the notice type
+    payload = payloads[0].replace(b'<Who>', b'<Who>&', 1)
+    accepts = lambda notice_type: notice_type != 111  # noqa: E731
+
+    with pytest.raises(etree.XMLSyntaxError):
+        voeventclient._respond(payload, 'ivo://gcn.test/client', log,
+                               accepts=accepts)
+    assert 'base64-encoded payload' in caplog.text
+
+    # The header scan recovers too, and skips the unaccepted notice.
+    parser = voeventclient._XMLParser(recover=True)
+    response, root = voeventclient._respond(
+        payload, 'ivo://gcn.test/client', log, accepts=accepts,
+        parser=parser)
+    assert b'role="ack"' in response
+    assert root is None
+
+    # With a parser whose options are not known, the header scan fails, and
+    # the payload is left to the parser.
+    parser = etree.XMLParser(recover=True)
+    response, root = voeventclient._respond(
+        payload, 'ivo://gcn.test/client', log, accepts=accepts,
+        parser=parser)
+    assert b'role="ack"' in response
+    assert root is not None
+
+
+def test_packet_reader():
+    """Test framing of several packets from one read, and of a packet that is
+    bigger than the buffer."""
+    big = b'x' * 1000
+    a, b = socket.socketpair()
+    with a, b:
+        b.settimeout(1)
+        reader = voeventclient._PacketReader(b, bufsize=64)
+        a.sendall(b''.join(
+            voeventclient._size_struct.pack(len(payload)) + payload
+            for payload in [b'one', b'two', big, b'three']))
+        assert reader.recv_packet() == b'one'
+        assert reader.recv_packet() == b'two'
+        assert reader.recv_packet() == big
+        assert reader.recv_packet() == b'three'
+
+        with pytest.raises(socket.timeout):
+            reader.recv_packet()
+
+        a.shutdown(socket.SHUT_WR)
+        with pytest.raises(socket.error):
+            reader.recv_packet()
+
+
+def test_packet_reader_max_payload_size():
+    """Test that an oversized packet is refused before its payload is read."""
+    a, b = socket.socketpair()
+    with a, b:
+        b.settimeout(1)
+        reader = voeventclient._PacketReader(b, max_payload_size=4)
+        a.sendall(voeventclient._size_struct.pack(4) + b'four')
+        assert reader.recv_packet() == b'four'
+        # Send only the length prefix; the reader must not wait for the rest.
+        a.sendall(voeventclient._size_struct.pack(1 << 30))
+        with pytest.raises(socket.error, match='exceeds the maximum'):
+            reader.recv_packet()
+
+
+def reference_iamalive_origin(payload):
+    """Find the origin of an iamalive message the slow way, with lxml."""
+    try:
+        root = etree.fromstring(payload)
+    except etree.XMLSyntaxError:
+        return None
+    if (root.tag in voeventclient._valid_vtp_root_tags and
+            root.get('role') == 'iamalive'):
+        origin = root.find('Origin')
+        if origin is not None:
+            return origin.text
+
+
+def random_iamalive(rng):
+    """Make an iamalive message, choosing at random among the ways that the
+    same document can be written."""
+    def ws(minimum=0):
+        return ''.join(rng.choice(' \t\r\n') for _ in range(
+            rng.randint(minimum, 2)))
+
+    def quote(value):
+        q = rng.choice('"\'')
+        return q + value + q
+
+    prefix = rng.choice(['trn', 'vtp', 'a.b-c'])
+    namespace = rng.choice(sorted(
+        tag[1:tag.index('}')] for tag in voeventclient._valid_vtp_root_tags))
+    attributes = [
+        ('version', '1.0'),
+        ('xmlns:' + prefix, namespace),
+        ('xmlns:xsi', 'http://www.w3.org/2001/XMLSchema-instance'),
+        ('xsi:schemaLocation', namespace + ' schema.xsd'),
+        ('role', 'iamalive')]
+    rng.shuffle(attributes)
+    children = [
+        ('Origin', rng.choice(['ivo://nasa.gsfc.gcn/gcn', ' ivo://a\tb ',
+                               'ivo://x?y=1#z'])),
+        ('TimeStamp', '2026-01-01T00:00:00'),
+        ('Response', 'ivo://gcn.test')]
+    rng.shuffle(children)
+    declaration = rng.choice([
+        '', "<?xml version='1.0'?>", '<?xml version = "1.0" encoding = '
+        '"UTF-8"?>', "<?xml version='1.0' encoding='utf-8' "
+        "standalone='yes' ?>"])
+    return (
+        declaration + ws() + '<' + prefix + ':Transport' + ''.join(
+            ws(1) + name + ws() + '=' + ws() + quote(value)
+            for name, value in attributes) + ws() + '>' + ''.join(
+            ws() + '<' + name + '>' + text + '</' + name + '>'
+            for name, text in children) + ws() + '</' + prefix +
+        ':Transport' + ws() + '>' + ws()).encode('UTF-8')
+
+
+def mutate(rng, payload):
+    """Insert, delete, replace, or duplicate a few bytes of a payload."""
+    payload = bytearray(payload)
+    tokens = [b'<', b'>', b'&amp;', b'"', b"'", b':', b'/', b' ', b'\r',
+              b'<!-- -->', b'<![CDATA[x]]>', b'xmlns="x"', b' role="ack"',
+              b'<Origin/>', b'<Origin>ivo://y</Origin>', b'\xc3\xa9',
+              b'\x00', b'\x0b', b'xmlns:trn=""', b'trn:', b']]>']
+    for _ in range(rng.randint(1, 3)):
+        i = rng.randrange(len(payload) + 1)
+        action = rng.randrange(4)
+        if action == 0:
+            payload[i:i] = rng.choice(tokens)
+        elif action == 1:
+            del payload[i:i + rng.randint(1, 8)]
+        elif action == 2:
+            payload[i:i + 1] = bytes([rng.randrange(256)])
+        else:
+            j = rng.randrange(len(payload) + 1)
+            payload[i:i] = payload[min(i, j):max(i, j)][:16]
+    return bytes(payload)
+
+
+def test_iamalive_origin():
+    response = voeventclient._form_response(
+        'iamalive', 'ivo://gcn.test/server', 'ivo://gcn.test/client',
+        '2026-01-01T00:00:00')
+    for payload in [iamalive, response]:
+        origin = voeventclient._iamalive_origin(payload)
+        assert origin is not None
+        assert origin == reference_iamalive_origin(payload)
+        assert voeventclient._iamalive_origin(memoryview(payload)) == origin
+
+    for payload in payloads + [voeventclient._form_response(
+            'ack', 'ivo://gcn.test/server', 'ivo://gcn.test/client',
+            '2026-01-01T00:00:00')]:
+        assert voeventclient._iamalive_origin(payload) is None
+
+
+def test_iamalive_origin_cache(monkeypatch):
+    """Test that a message that differs from a known one only in its time
+    stamp is recognized without checking it all again."""
+    monkeypatch.setattr(voeventclient, '_iamalive_cache', {})
+    origin = voeventclient._iamalive_origin(iamalive)
+    assert origin == 'ivo://nasa.gsfc.gcn/gcn'
+    assert len(voeventclient._iamalive_cache) == 1
+
+    def fail(payload):
+        raise AssertionError('should not have checked the whole payload')
+
+    monkeypatch.setattr(voeventclient, '_match_iamalive', fail)
+    assert voeventclient._iamalive_origin(iamalive.replace(
+        b'2022-07-20T12:00:00', b'2026-10-18T01:02:03.456')) == origin
+
+    # These are left to lxml.
+    monkeypatch.undo()
+    for timestamp in [b'<!-- -->', b'&lt;', b']]>']:
+        payload = iamalive.replace(b'2022-07-20T12:00:00', timestamp)
+        assert voeventclient._iamalive_origin(payload) is None
+
+
+def test_iamalive_origin_variants():
+    """Test that the fast path agrees with lxml for many ways of writing the
+    same iamalive message."""
+    rng = random.Random(0)
+    for _ in range(2000):
+        payload = random_iamalive(rng)
+        origin = voeventclient._iamalive_origin(payload)
+        assert origin is not None, payload
+        assert origin == reference_iamalive_origin(payload), payload
+
+
+def test_iamalive_origin_fuzz():
+    """Test that whenever the fast path recognizes a corrupted iamalive
+    message, lxml agrees with it; otherwise, the payload is parsed as
+    usual."""
+    rng = random.Random(1)
+    seeds = [iamalive, voeventclient._form_response(
+        'iamalive', 'ivo://gcn.test/server', 'ivo://gcn.test/client',
+        '2026-01-01T00:00:00')]
+    matched = 0
+    for _ in range(10000):
+        payload = mutate(rng, rng.choice(seeds) if rng.random() < 0.5
+                         else random_iamalive(rng))
+        origin = voeventclient._iamalive_origin(payload)
+        if origin is not None:
+            matched += 1
+            assert origin == reference_iamalive_origin(payload), payload
+    # Many mutations are harmless, such as changes to the time stamp.
+    assert matched > 500
+
+
+def test_respond_iamalive(monkeypatch):
+    def fail(payload, parser=None):
+        raise AssertionError('should not have parsed the payload')
+
+    log = logging.getLogger('gcn.test')
+    expected, root = voeventclient._respond(
+        iamalive, 'ivo://gcn.test/client', log)
+    assert root is None
+
+    monkeypatch.setattr(voeventclient, 'fromstring', fail)
+    response, root = voeventclient._respond(
+        iamalive, 'ivo://gcn.test/client', log)
+    assert root is None
+    assert (response.split(b'<TimeStamp>')[0] ==
+            expected.split(b'<TimeStamp>')[0])
+    assert b'role="iamalive"' in response
+    assert b'<Origin>ivo://nasa.gsfc.gcn/gcn</Origin>' in response
@@ -0,0 +1,217 @@
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import functools
+from importlib import resources
+import logging
+import os
+import threading
+import time
+
+from lxml.etree import fromstring, XMLParser
+import pytest
+
+from . import data, make_payload
+from .. import listen
+from ..voeventclient import _dispatch
+from ..workers import ShardedProcessPool, WorkerPool
+
+payloads = [resources.read_binary(data, 'gbm_flt_pos.xml'),
+            resources.read_binary(data, 'kill_socket.xml')]
+
+
+class BlockingHandler(object):
+    """Handler that records the payloads that it sees, but does not return
+    until it is released."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.payloads = []
+        self.threads = set()
+
+    def __call__(self, payload, root):
+        self.release.wait()
+        self.threads.add(threading.current_thread())
+        self.payloads.append(payload)
+
+
+def write_ivorn(dirname, payload, root):
+    (dirname / root.attrib['ivorn'].rpartition('/')[2]).write_bytes(payload)
+
+
+def test_bad_overflow():
+    with pytest.raises(ValueError):
+        WorkerPool(None, overflow='explode')
+
+
+def test_threads():
+    handler = BlockingHandler()
+    pool = WorkerPool(handler, workers=2)
+    for payload in payloads:
+        pool(payload, fromstring(payload))
+    handler.release.set()
+    pool.close()
+    assert sorted(handler.payloads) == sorted(payloads)
+    assert threading.current_thread() not in handler.threads
+
+
+def test_drop_oldest():
+    handler = BlockingHandler()
+    pool = WorkerPool(handler, maxsize=2, overflow='drop-oldest')
+    for i in range(10):
+        payload = str(i).encode()
+        pool(payload, None)
+    handler.release.set()
+    pool.close()
+    # One payload is already with the worker; the rest are the newest ones.
+    assert handler.payloads[-2:] == [b'8', b'9']
+    assert pool.dropped + len(handler.payloads) == 10
+
+
+def test_spill(tmp_path):
+    handler = BlockingHandler()
+    pool = WorkerPool(handler, maxsize=1, overflow='spill',
+                      spill_dir=str(tmp_path))
+    for payload in payloads * 3:
+        pool(payload, fromstring(payload))
+    assert pool.spilled > 0
+    handler.release.set()
+    pool.close()
+    assert handler.payloads == payloads * 3
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_thread_executor():
+    handler = BlockingHandler()
+    handler.release.set()
+    with ThreadPoolExecutor(2) as executor:
+        pool = WorkerPool(handler, workers=2, executor=executor)
+        for payload in payloads:
+            pool(payload, fromstring(payload))
+        pool.close()
+    assert sorted(handler.payloads) == sorted(payloads)
+
+
+def test_executor_shut_down():
+    """Test that payloads that cannot be submitted do not use up slots."""
+    handler = BlockingHandler()
+    executor = ThreadPoolExecutor(1)
+    executor.shutdown()
+    pool = WorkerPool(handler, workers=1, executor=executor)
+    for payload in payloads:
+        pool(payload, fromstring(payload))
+    pool.join()
+    # close() would wait forever for a lost slot.
+    thread = threading.Thread(target=pool.close)
+    thread.start()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert handler.payloads == []
+
+
+def test_process_executor(tmp_path):
+    handler = functools.partial(write_ivorn, tmp_path)
+    with ProcessPoolExecutor(2) as executor:
+        pool = WorkerPool(handler, workers=2, executor=executor)
+        for payload in payloads:
+            pool(payload, fromstring(payload))
+        pool.close()
+    assert sorted(path.read_bytes() for path in tmp_path.iterdir()) == (
+        sorted(payloads))
+
+
+def trigger_and_pid(payload, root):
+    trigger = root.find(".//Param[@name='TrigID']")
+    if trigger is None:
+        raise ValueError('no trigger')
+    time.sleep(0.01 * (int(trigger.attrib['value']) % 2))
+    return root.attrib['ivorn'], trigger.attrib['value'], os.getpid()
+
+
+def test_sharded_process_pool():
+    sent = []
+    results = []
+    pool = ShardedProcessPool(trigger_and_pid, processes=3,
+                              callback=results.append)
+    log = logging.getLogger('gcn.tests.test_workers')
+    try:
+        for i in range(24):
+            payload = make_payload(i, trigger=i % 4)
+            sent.append(fromstring(payload).attrib['ivorn'])
+            # Go through the same path as gcn.listen, which acks after
+            # reading only the header.
+            assert _dispatch(payload, None, 'ivo://gcn.test', pool, log)
+        # The handler raises for this one, so it has no result.
+        assert _dispatch(payloads[1], None, 'ivo://gcn.test', pool, log)
+    finally:
+        pool.close()
+
+    assert [ivorn for ivorn, _, _ in results] == sent
+    pids = {}
+    for _, trigger, pid in results:
+        assert pids.setdefault(trigger, pid) == pid
+
+
+def exit_on_trigger_13(payload, root):
+    result = trigger_and_pid(payload, root)
+    if result[1] == '13':
+        os._exit(1)
+    return result
+
+
+def test_sharded_process_pool_worker_dies():
+    results = []
+    pool = ShardedProcessPool(exit_on_trigger_13, processes=1,
+                              callback=results.append)
+    try:
+        for i, trigger in enumerate([0, 13, 2]):
+            if i == 2:
+                process = pool._processes[0]
+                process.join(10)
+                assert not process.is_alive()
+            payload = make_payload(i, trigger=trigger)
+            pool(payload, fromstring(payload))
+    finally:
+        pool.close()
+
+    assert [trigger for _, trigger, _ in results] == ['0', '2']
+    assert pool._processes[0] is not process
+
+
+def has_blank_text(payload, root):
+    return root.text is not None and not root.text.strip()
+
+
+def write_has_blank_text(filename, payload, root):
+    with open(filename, 'w') as f:
+        f.write(str(has_blank_text(payload, root)))
+
+
+@pytest.mark.parametrize('parser_options,expected', [
+    (None, True), ({'remove_blank_text': True}, False)])
+def test_parser_options(tmp_path, parser_options, expected):
+    payload = payloads[0]
+
+    results = []
+    pool = ShardedProcessPool(has_blank_text, processes=1,
+                              callback=results.append,
+                              parser_options=parser_options)
+    pool(payload, fromstring(payload))
+    pool.close()
+    assert results == [expected]
+
+    filename = tmp_path / 'result'
+    with ProcessPoolExecutor(1) as executor:
+        pool = WorkerPool(functools.partial(write_has_blank_text, filename),
+                          executor=executor, parser_options=parser_options)
+        pool(payload, fromstring(payload))
+        pool.close()
+    assert filename.read_text() == str(expected)
+
+
+def test_sharded_process_pool_invalid():
+    with pytest.raises(ValueError):
+        ShardedProcessPool(None, processes=0)
+    with pytest.raises(ValueError):
+        listen(handler=trigger_and_pid, processes=2, workers=2)
+    # A parser object cannot be sent to the worker processes.
+    with pytest.raises(ValueError):
+        listen(handler=trigger_and_pid, processes=2, parser=XMLParser())
@@ -19,14 +19,20 @@ VOEvent Transport Protocol <http://www.ivoa.net/documents/VOEventTransport>.
 """
 
 import base64
+import collections
 import datetime
+import hashlib
 import logging
+import re
 import socket
 import struct
+import sys
+import threading
 import time
-import itertools
 
-from lxml.etree import fromstring, XMLSyntaxError
+from lxml.etree import fromstring, XMLParser, XMLPullParser, XMLSyntaxError
+
+from .reconnect import ReconnectScheduler
 
 __all__ = ('listen', 'serve')
 
@@ -39,47 +45,70 @@ _valid_vtp_root_tags = {
     '{http://telescope-networks.org/schema/Transport/v1.1}Transport',
     '{http://www.telescope-networks.org/xml/Transport/v1.1}Transport'}
 
+_valid_voevent_root_tags = {
+    '{http://www.ivoa.net/xml/VOEvent/v1.1}VOEvent',
+    '{http://www.ivoa.net/xml/VOEvent/v2.0}VOEvent'}
+
+# Fields from the start of a VOEvent Transport Protocol payload.
+_Header = collections.namedtuple('_Header', 'tag role ivorn notice_type')
+
+# Byte patterns for recognizing plain iamalive messages without parsing them;
+# see `_iamalive_origin`. They only match a subset of well-formed XML: there
+# are no comments, processing instructions, CDATA sections, entity or
+# character references, or non-ASCII characters, and the child elements of
+# the root have neither attributes nor children of their own.
+_vtp_namespaces = {tag[1:tag.index('}')].encode('UTF-8')
+                   for tag in _valid_vtp_root_tags}
+# Namespace names must be valid URIs, so only allow ones that are known to be.
+_known_namespaces = _vtp_namespaces | {
+    b'http://www.w3.org/2001/XMLSchema-instance'}
+_ws = rb'[ \t\r\n]'
+_name = rb'[A-Za-z_][A-Za-z0-9_.-]*'
+_qname = _name + rb'(?::' + _name + rb')?'
+# Printable ASCII, tabs, and newlines, except for &, <, and >
+_text = rb'[\t\n\x20-\x25\x27-\x3b\x3d\x3f-\x7e]'
+# Quoted attribute value of printable ASCII, except for & and <
+_value = (rb'(?:"[\t\n\x20\x21\x23-\x25\x27-\x3b\x3d-\x7e]*"|'
+          rb"'[\t\n\x20-\x25\x28-\x3b\x3d-\x7e]*')")
+
+
+def _quoted(pattern):
+    return rb'(?:"' + pattern + rb'"|\'' + pattern + rb'\')'
+
+
+def _pseudo_attribute(name, pattern):
+    return _ws + rb'+' + name + _ws + rb'*=' + _ws + rb'*' + _quoted(pattern)
+
+
+_iamalive_re = re.compile(
+    rb'(?:<\?xml' + _pseudo_attribute(rb'version', rb'1\.0') +
+    rb'(?:' + _pseudo_attribute(rb'encoding', rb'(?:UTF|utf)-8') + rb')?' +
+    rb'(?:' + _pseudo_attribute(rb'standalone', rb'(?:yes|no)') + rb')?' +
+    _ws + rb'*\?>)?' + _ws + rb'*' +
+    rb'<(?P<prefix>' + _name + rb'):Transport' +
+    rb'(?P<attributes>(?:' + _ws + rb'+' + _qname + _ws + rb'*=' + _ws +
+    rb'*' + _value + rb')*)' + _ws + rb'*>' +
+    rb'(?P<children>(?:' + _ws + rb'*<(?P<child>' + _name + rb')>' + _text +
+    rb'*</(?P=child)>)*)' + _ws + rb'*' +
+    rb'</(?P=prefix):Transport' + _ws + rb'*>' + _ws + rb'*')
+_iamalive_attribute_re = re.compile(
+    rb'(' + _qname + rb')' + _ws + rb'*=' + _ws +
+    rb'*(?:"([^"]*)"|\'([^\']*)\')')
+_iamalive_child_re = re.compile(rb'<(' + _name + rb')>(' + _text + rb'*)<')
+_iamalive_text_re = re.compile(_text + rb'*')
+# Iamalive messages are small; do not bother looking for them in big packets.
+_iamalive_max_size = 4096
+# Known iamalive messages from each server, minus the text of the TimeStamp,
+# and their origins.
+_iamalive_cache = {}
+_iamalive_cache_size = 64
+
 
 def _get_now_iso8601():
     """Get current date-time in ISO 8601 format."""
     return datetime.datetime.now().isoformat()
 
 
-def _open_socket(hosts_ports, iamalive_timeout, max_reconnect_timeout, log):
-    """Establish a connection. Wait 1 second after the first failed attempt.
-    Double the timeout after each failed attempt thereafter, until the
-    timeout reaches MAX_RECONNECT_TIMEOUT. Return the new, connected socket."""
-    reconnect_timeout = 1
-    for host, port in hosts_ports:
-        try:
-            # Open socket
-            sock = socket.socket()
-            try:
-                sock.settimeout(iamalive_timeout)
-                log.debug("opened socket")
-
-                # Connect to host
-                sock.connect((host, port))
-                log.info("connected to %s:%d", host, port)
-            except socket.error:
-                try:
-                    sock.close()
-                except socket.error:
-                    log.exception("could not close socket")
-                else:
-                    log.info("closed socket")
-                raise
-        except socket.error:
-            if reconnect_timeout < max_reconnect_timeout:
-                reconnect_timeout <<= 1
-            log.exception(
-                'could not connect to %s:%d, will retry in %d seconds',
-                host, port, reconnect_timeout)
-            time.sleep(reconnect_timeout)
-        else:
-            return sock
-
-
 def _recvall(sock, n):
     """Read exactly n bytes from a socket and return as a buffer."""
     ba = bytearray(n)
@@ -115,6 +144,74 @@ def _recv_packet(sock):
     return _recvall(sock, payload_len)
 
 
+class _PacketReader(object):
+    """Read length-prefixed VOEvent Transport Protocol packets from a socket
+    through one reusable buffer. Each `recv_into` call reads as much as the
+    socket has available, so several small packets may be framed from a
+    single read. The buffer grows as needed to hold the largest packet.
+
+    If `max_payload_size` is given, then a packet whose length prefix is
+    bigger than that is refused before any of its payload is read."""
+
+    def __init__(self, sock, bufsize=65536, max_payload_size=None):
+        self.sock = sock
+        self.max_payload_size = max_payload_size
+        self._buf = bytearray(bufsize)
+        self._start = 0
+        self._end = 0
+
+    def _fill(self, n):
+        """Make sure that there are at least n unread bytes in the buffer."""
+        if self._end - self._start >= n:
+            return
+
+        # Make room: move the unread bytes to the start of the buffer, or to a
+        # bigger buffer if they will not fit.
+        unread = self._end - self._start
+        if n > len(self._buf):
+            buf = bytearray(max(n, 2 * len(self._buf)))
+            buf[:unread] = self._buf[self._start:self._end]
+            self._buf = buf
+            self._start, self._end = 0, unread
+        elif self._start + n > len(self._buf):
+            self._buf[:unread] = self._buf[self._start:self._end]
+            self._start, self._end = 0, unread
+
+        timeout = self.sock.gettimeout()
+        start = time.monotonic()
+        with memoryview(self._buf) as mv:
+            while self._end - self._start < n:
+                if time.monotonic() - start > timeout:
+                    raise socket.timeout(
+                        'timed out while trying to read {0} bytes'.format(
+                            n - self._end + self._start))
+                nreceived = self.sock.recv_into(mv[self._end:])
+
+                # See _recvall.
+                if nreceived == 0:
+                    raise socket.error('connection closed by peer')
+
+                self._end += nreceived
+
+    def recv_packet(self):
+        """Read a packet and return the payload as a memoryview, which is only
+        valid until the next call."""
+        self._fill(_size_len)
+        payload_len, = _size_struct.unpack_from(self._buf, self._start)
+        if (self.max_payload_size is not None and
+                payload_len > self.max_payload_size):
+            raise socket.error(
+                'packet of {0} bytes exceeds the maximum of {1} bytes'.format(
+                    payload_len, self.max_payload_size))
+        self._start += _size_len
+
+        self._fill(payload_len)
+        payload = memoryview(self._buf)[
+            self._start:self._start + payload_len]
+        self._start += payload_len
+        return payload
+
+
 def _send_packet(sock, payload):
     """Send an array of bytes as a length-prefixed VOEvent Transport Protocol
     packet."""
@@ -137,21 +234,236 @@ def _form_response(role, origin, response, timestamp):
         '</TimeStamp></trn:Transport>').encode('UTF-8')
 
 
-def _ingest_packet(sock, ivorn, handler, log):
-    """Ingest one VOEvent Transport Protocol packet and act on it, first
-    sending the appropriate response and then calling the handler if the
-    payload is a VOEvent."""
-    # Receive payload
-    payload = _recv_packet(sock)
-    log.debug("received packet of %d bytes", len(payload))
-    log.debug("payload is:\n%s", payload)
+def _iamalive_origin(payload):
+    """Recognize a VOEvent Transport Protocol iamalive message from its bytes
+    alone, and return the text of its Origin element. Return None if the
+    payload is not an iamalive message, or if it is written in a way that
+    would take a real XML parser to be sure about, in which case it should be
+    parsed as usual.
+
+    A server sends the same iamalive message over and over again, except for
+    the time stamp. So, once a message has been checked by
+    `_match_iamalive`, the bytes before and after the text of its TimeStamp
+    element are remembered, and later messages that only differ in the time
+    stamp are recognized with a dictionary lookup. Most of the traffic on a
+    quiet connection is iamalive messages, and this is much faster than
+    parsing them with lxml."""
+    if len(payload) > _iamalive_max_size:
+        return None
+    payload = bytes(payload)
+    if b'iamalive' not in payload:
+        return None
+
+    # The first '<TimeStamp>' in a message that `_match_iamalive` accepts is
+    # always a start tag, because '<' cannot occur in text or attributes.
+    start = payload.find(b'<TimeStamp>')
+    end = payload.find(b'</TimeStamp>', start)
+    if start < 0 or end < 0:
+        return _match_iamalive(payload)
+    start += len(b'<TimeStamp>')
+    if not _iamalive_text_re.fullmatch(payload, start, end):
+        return _match_iamalive(payload)
+
+    key = (payload[:start], payload[end:])
+    origin = _iamalive_cache.get(key)
+    if origin is None:
+        origin = _match_iamalive(payload)
+        if origin is not None:
+            if len(_iamalive_cache) >= _iamalive_cache_size:
+                _iamalive_cache.clear()
+            _iamalive_cache[key] = origin
+    return origin
+
+
+def _match_iamalive(payload):
+    """Check that a payload is an iamalive message of the restricted form
+    described by `_iamalive_re`, and return the text of its Origin element,
+    or None."""
+    match = _iamalive_re.fullmatch(payload)
+    if match is None:
+        return None
+
+    attributes = {}
+    for name, value1, value2 in _iamalive_attribute_re.findall(
+            match.group('attributes')):
+        if name in attributes:
+            return None
+        attributes[name] = value1 or value2
+    if attributes.get(b'role') != b'iamalive':
+        return None
+
+    # The root element must be in the transport namespace, and the Origin
+    # element must be in no namespace, as `root.find('Origin')` expects.
+    if b'xmlns' in attributes:
+        return None
+    namespaces = {name[6:]: value for name, value in attributes.items()
+                  if name.startswith(b'xmlns:')}
+    if (namespaces.get(match.group('prefix')) not in _vtp_namespaces or
+            not _known_namespaces.issuperset(namespaces.values()) or
+            b'xml' in namespaces or b'xmlns' in namespaces):
+        return None
+
+    # Every prefix must be declared, and no two attributes may have the same
+    # namespace and local name.
+    expanded = set()
+    for name in attributes:
+        prefix, _, local = name.rpartition(b':')
+        if prefix == b'xmlns':
+            continue
+        if prefix:
+            if prefix not in namespaces:
+                return None
+            prefix = namespaces[prefix]
+        if (prefix, local) in expanded:
+            return None
+        expanded.add((prefix, local))
+
+    for child, text in _iamalive_child_re.findall(match.group('children')):
+        if child == b'Origin':
+            # A blank origin could be dropped by a parser that removes blank
+            # text, so leave it to the parser.
+            return text.decode('ascii') if text.strip() else None
+    return None
+
+
+class _XMLParser(XMLParser):
+    """An `lxml.etree.XMLParser` that remembers its keyword arguments, so that
+    `_parse_header` can scan payloads with the same options."""
+
+    def __init__(self, **options):
+        super(_XMLParser, self).__init__(**options)
+        self.options = options
+
+    def copy(self):
+        return _XMLParser(**self.options)
+
+
+# Options for scanning headers on behalf of a parser whose options are not
+# known.
+_strict_header_options = {'resolve_entities': False, 'huge_tree': False,
+                          'no_network': True}
+
+
+def _parse_header(payload, chunk_size=4096, parser=None):
+    """Scan a VOEvent Transport Protocol payload incrementally, only as far as
+    needed to find the root tag, the role and IVORN attributes of the root
+    element, and, for VOEvents, the GCN notice type from the `Packet_Type`
+    parameter. Fields that are absent are None.
+
+    If `parser` is a `_XMLParser`, the payload is scanned with the same
+    options. If it is any other parser, it is scanned with strict options,
+    and a payload that fails the scan is reported as having no root tag so
+    that it is left to that parser."""
+    strict = parser is not None and not isinstance(parser, _XMLParser)
+    if parser is None:
+        options = {}
+    elif strict:
+        options = _strict_header_options
+    else:
+        options = parser.options
+    parser = XMLPullParser(events=('start', 'end'), **options)
+    root = None
+    notice_type = None
+
+    for offset in range(0, len(payload), chunk_size):
+        try:
+            parser.feed(bytes(payload[offset:offset + chunk_size]))
+        except XMLSyntaxError:
+            if strict:
+                return _Header(None, None, None, None)
+            raise
+        for event, element in parser.read_events():
+            if root is None:
+                root = element
+                if root.tag not in _valid_voevent_root_tags:
+                    break
+            elif element.tag == 'What' and event == 'end':
+                if element.getparent() is root:
+                    break
+            elif element.tag == 'Param' and event == 'start':
+                parent = element.getparent()
+                if (element.get('name') == 'Packet_Type' and
+                        parent.tag == 'What' and parent.getparent() is root):
+                    notice_type = element.get('value')
+                    break
+        else:
+            continue
+        break
+
+    if root is None:
+        return _Header(None, None, None, None)
+    if notice_type is not None:
+        try:
+            notice_type = int(notice_type)
+        except ValueError:
+            notice_type = None
+    return _Header(root.tag, root.get('role'), root.get('ivorn'),
+                   notice_type)
+
+
+def _log_syntax_error(log, payload):
+    log.exception("failed to parse XML, base64-encoded payload is:\n%s",
+                  base64.b64encode(payload))
+
+
+def _respond(payload, ivorn, log, accepts=None, metrics=None,
+             header_only=False, parser=None):
+    """Parse a VOEvent Transport Protocol payload and work out how to act on
+    it. Return a tuple of the response packet to send back to the server (or
+    None) and the root element of the VOEvent to pass to the handler (or
+    None).
+
+    If `accepts` is provided, it should be a function that takes a GCN notice
+    type and returns whether the handler is interested in it. In that case, the
+    payload is first scanned with `_parse_header`, and VOEvents that the
+    handler does not accept are acknowledged without parsing the whole
+    document.
+
+    If `metrics` is provided, it should be an instance of `gcn.Metrics`, and
+    its `iamalive` method is called for iamalive messages.
+
+    If `header_only` is true, then VOEvents are never parsed in full: they
+    are acknowledged after scanning with `_parse_header`, and the `_Header` is
+    returned in place of the root element.
+
+    If `parser` is provided, it should be an `lxml.etree.XMLParser`, and it is
+    used to parse the payload instead of the default parser. It is also passed
+    on to `_parse_header`.
+
+    Plain iamalive messages are recognized by `_iamalive_origin` and are
+    answered without being parsed at all."""
+    origin = _iamalive_origin(payload)
+    if origin is not None:
+        log.debug("received iamalive message")
+        if metrics is not None:
+            metrics.iamalive()
+        return _form_response("iamalive", origin,
+                              ivorn, _get_now_iso8601()), None
+
+    if accepts is not None or header_only:
+        try:
+            header = _parse_header(payload, parser=parser)
+        except XMLSyntaxError:
+            _log_syntax_error(log, payload)
+            raise
+        if (header.tag in _valid_voevent_root_tags and
+                header.ivorn is not None):
+            if (accepts is not None and header.notice_type is not None and
+                    not accepts(header.notice_type)):
+                log.info("received VOEvent")
+                log.debug("handler does not accept notice type %d",
+                          header.notice_type)
+                return _form_response("ack", header.ivorn,
+                                      ivorn, _get_now_iso8601()), None
+            elif header_only:
+                log.info("received VOEvent")
+                return _form_response("ack", header.ivorn,
+                                      ivorn, _get_now_iso8601()), header
 
-    # Parse payload and act on it
     try:
-        root = fromstring(payload)
+        root = fromstring(payload, parser)
     except XMLSyntaxError:
-        log.exception("failed to parse XML, base64-encoded payload is:\n%s",
-                      base64.b64encode(payload))
+        _log_syntax_error(log, payload)
         raise
     else:
         if root.tag in _valid_vtp_root_tags:
@@ -159,31 +471,191 @@ def _ingest_packet(sock, ivorn, handler, log):
                 log.error("receieved transport message without a role")
             elif root.attrib["role"] == "iamalive":
                 log.debug("received iamalive message")
-                _send_packet(sock, _form_response("iamalive",
-                             root.find("Origin").text, ivorn,
-                             _get_now_iso8601()))
-                log.debug("sent iamalive response")
+                if metrics is not None:
+                    metrics.iamalive()
+                return _form_response("iamalive", root.find("Origin").text,
+                                      ivorn, _get_now_iso8601()), None
             else:
                 log.error(
                     'received transport message with unrecognized role: %s',
                     root.attrib["role"])
-        elif root.tag in ('{http://www.ivoa.net/xml/VOEvent/v1.1}VOEvent',
-                          '{http://www.ivoa.net/xml/VOEvent/v2.0}VOEvent'):
+        elif root.tag in _valid_voevent_root_tags:
             log.info("received VOEvent")
             if 'ivorn' not in root.attrib:
                 log.error("received voevent message without ivorn")
             else:
-                _send_packet(sock, _form_response("ack", root.attrib["ivorn"],
-                             ivorn, _get_now_iso8601()))
-                log.debug("sent receipt response")
-                if handler is not None:
-                    try:
-                        handler(payload, root)
-                    except:  # noqa: E722
-                        log.exception("exception in payload handler")
+                return _form_response("ack", root.attrib["ivorn"],
+                                      ivorn, _get_now_iso8601()), root
         else:
             log.error('received XML document with unrecognized root tag: %s',
                       root.tag)
+    return None, None
+
+
+def _ingest_packet(reader, ivorn, handler, log, metrics=None, recent=None,
+                   parser=None):
+    """Ingest one VOEvent Transport Protocol packet from a `_PacketReader` and
+    act on it with `_dispatch`."""
+    _dispatch(reader.recv_packet(), reader.sock, ivorn, handler, log, metrics,
+              recent, parser)
+
+
+def _dispatch(payload, sock, ivorn, handler, log, metrics=None, recent=None,
+              parser=None):
+    """Act on a VOEvent Transport Protocol payload, first sending the
+    appropriate response to `sock` (unless it is None) and then calling the
+    handler if the payload is a VOEvent. If `metrics` is provided, report to
+    it along the way. Return whether there was a response.
+
+    If the handler has a true `header_only` attribute, then it is passed the
+    `_Header` of the VOEvent instead of the root element, and the VOEvent is
+    not parsed in full here.
+
+    If `recent` is provided, it should be a `_RecentPayloads`. A payload that
+    is byte for byte the same as a recently handled VOEvent is acknowledged
+    without being parsed, and the handler is not called for it.
+
+    If `parser` is provided, it is passed on to `_respond`."""
+    log.debug("received packet of %d bytes", len(payload))
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("payload is:\n%s", bytes(payload))
+
+    # Look for an identical payload before doing any parsing
+    digest = duplicate = None
+    if recent is not None:
+        digest = recent.digest(payload)
+        duplicate = recent.get(digest)
+
+    # Parse payload and act on it
+    accepts = getattr(handler, 'accepts', None)
+    header_only = getattr(handler, 'header_only', False)
+    if duplicate is not None:
+        log.info("received VOEvent")
+        log.debug("ignoring duplicate payload of VOEvent %s", duplicate)
+        if metrics is not None:
+            metrics.received(_size_len + len(payload))
+        response = _form_response("ack", duplicate, ivorn, _get_now_iso8601())
+        root = None
+    elif metrics is None:
+        response, root = _respond(payload, ivorn, log, accepts,
+                                  header_only=header_only, parser=parser)
+    else:
+        metrics.received(_size_len + len(payload))
+        start = time.perf_counter()
+        response, root = _respond(payload, ivorn, log, accepts, metrics,
+                                  header_only, parser)
+        metrics.parsed(time.perf_counter() - start)
+
+    if digest is not None and root is not None:
+        recent.add(digest, root.ivorn if isinstance(root, _Header)
+                   else root.get('ivorn'))
+
+    if response is not None and sock is not None:
+        if metrics is None:
+            _send_packet(sock, response)
+        else:
+            start = time.perf_counter()
+            _send_packet(sock, response)
+            metrics.sent(time.perf_counter() - start)
+        log.debug("sent response")
+
+    if root is not None and handler is not None:
+        # The handler may hold on to the payload, so give it a copy rather
+        # than a view of the receive buffer.
+        if metrics is not None:
+            start = time.perf_counter()
+        try:
+            handler(bytes(payload), root)
+        except:  # noqa: E722
+            log.exception("exception in payload handler")
+            if metrics is not None:
+                metrics.handled(time.perf_counter() - start, sys.exc_info()[1])
+        else:
+            if metrics is not None:
+                metrics.handled(time.perf_counter() - start)
+
+    return response is not None
+
+
+class _SeenIvorns(object):
+    """Set of IVORNs seen in the last `window` seconds, holding at most
+    `maxsize` of them. Safe to share between threads."""
+
+    def __init__(self, window=3600, maxsize=65536):
+        self.window = window
+        self.maxsize = maxsize
+        self._seen = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, ivorn):
+        """Add an IVORN. Return True if it had not been seen yet."""
+        now = time.monotonic()
+        with self._lock:
+            # Entries are in order of arrival, so expire from the front.
+            while self._seen and (
+                    now - next(iter(self._seen.values())) > self.window):
+                self._seen.popitem(last=False)
+            if ivorn in self._seen:
+                return False
+            if len(self._seen) >= self.maxsize:
+                self._seen.popitem(last=False)
+            self._seen[ivorn] = now
+            return True
+
+
+class _RecentPayloads(object):
+    """Table of the digests of the last `maxsize` VOEvent payloads that were
+    handled, and their IVORNs. Safe to share between threads."""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._ivorns = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(payload):
+        """Hash a payload. This is much faster than parsing it."""
+        return hashlib.blake2b(payload, digest_size=16).digest()
+
+    def get(self, digest):
+        """Return the IVORN of the payload with the given digest, or None if
+        it is not in the table."""
+        with self._lock:
+            ivorn = self._ivorns.get(digest)
+            if ivorn is not None:
+                self._ivorns.move_to_end(digest)
+            return ivorn
+
+    def add(self, digest, ivorn):
+        """Add the digest of a payload and its IVORN."""
+        with self._lock:
+            self._ivorns[digest] = ivorn
+            self._ivorns.move_to_end(digest)
+            while len(self._ivorns) > self.maxsize:
+                self._ivorns.popitem(last=False)
+
+
+def _first_copy(handler, log):
+    """Wrap a handler so that it is called only for the first copy of each
+    VOEvent, and only from one thread at a time."""
+    seen = _SeenIvorns()
+    lock = threading.Lock()
+
+    def handle(payload, root):
+        if isinstance(root, _Header):
+            ivorn = root.ivorn
+        else:
+            ivorn = root.attrib['ivorn']
+        if seen.add(ivorn):
+            with lock:
+                handler(payload, root)
+        else:
+            log.debug("ignoring duplicate VOEvent %s", ivorn)
+
+    if hasattr(handler, 'accepts'):
+        handle.accepts = handler.accepts
+    handle.header_only = getattr(handler, 'header_only', False)
+    return handle
 
 
 def _validate_host_port(host, port):
@@ -212,7 +684,10 @@ def _validate_host_port(host, port):
 
 def listen(host=("45.58.43.186", "68.169.57.253"), port=8099,
            ivorn="ivo://python_voeventclient/anonymous", iamalive_timeout=150,
-           max_reconnect_timeout=1024, handler=None, log=None):
+           max_reconnect_timeout=1024, handler=None, log=None, workers=0,
+           executor=None, queue_size=64, overflow='block', redundant=False,
+           metrics=None, processes=0, dedupe=0, parser=None,
+           max_payload_size=None):
     """Connect to a VOEvent Transport Protocol server on the given `host` and
     `port`, then listen for VOEvents until interrupted (i.e., by a keyboard
     interrupt, `SIGINTR`, or `SIGTERM`).
@@ -221,8 +696,12 @@ def listen(host=("45.58.43.186", "68.169.57.253"), port=8099,
 
     If `iamalive_timeout` seconds elapse without any packets from the server,
     it is assumed that the connection has been dropped; the client closes the
-    connection and attempts to re-open it, retrying with an exponential backoff
-    up to a maximum timeout of `max_reconnect_timeout` seconds.
+    connection and attempts to re-open it. If there are several hosts, then
+    they are tried in order of their health, in parallel if the first ones do
+    not answer promptly, and the first to answer is used. Each host that
+    fails is retried with a jittered exponential backoff up to a maximum
+    timeout of `max_reconnect_timeout` seconds; see
+    `gcn.reconnect.ReconnectScheduler`.
 
     If `handler` is provided, it should be a callable that takes two arguments,
     the raw VOEvent payload and the ElementTree root object of the XML
@@ -233,20 +712,151 @@ def listen(host=("45.58.43.186", "68.169.57.253"), port=8099,
     used for reporting the client's status. If `log` is not provided, a default
     logger will be used.
 
+    By default, the handler is called on the same thread that reads from the
+    socket, so a slow handler delays responses to the server. If `workers` is
+    nonzero or `executor` is provided, then the handler is instead called by
+    a `gcn.workers.WorkerPool` with the given number of worker threads (or the
+    given `concurrent.futures.Executor`), a queue of up to `queue_size`
+    payloads, and the given `overflow` policy for when the queue is full.
+
+    If `processes` is nonzero, then the socket thread only frames and
+    acknowledges packets, and VOEvents are parsed and passed to the handler by
+    a `gcn.workers.ShardedProcessPool` with that many worker processes, each
+    with a queue of up to `queue_size` payloads. Notices for the same trigger
+    are handled in order. The handler must be picklable.
+
+    If `redundant` is True, then instead of cycling through the hosts, keep a
+    connection open to every one of them at once, each reconnecting on its
+    own. Every VOEvent is passed to the handler once, for the first copy to
+    arrive from any host; later copies with the same IVORN are acknowledged
+    but otherwise ignored.
+
+    If `metrics` is provided, it should be an instance of `gcn.Metrics`, such
+    as `gcn.InMemoryMetrics`, and is told about connections, received packets,
+    parsing and response times, iamalive messages, and the handler's run time
+    and exceptions. With `workers`, `executor`, or `processes`, the handler's
+    run time is only the time that it takes to queue the payload, and its
+    exceptions are logged but not counted.
+
+    If `dedupe` is nonzero, then the digests of that many of the most recent
+    VOEvent payloads are remembered. A payload that is identical to one of
+    them, such as a copy that is sent again after reconnecting or a copy from
+    another host in redundant mode, is acknowledged without being parsed and
+    is not passed to the handler.
+
+    If `parser` is provided, it should be an `lxml.etree.XMLParser`, which is
+    used (or, with several connections, copied and used) to parse every
+    packet. For example, this parser drops whitespace and comments that the
+    handler has no use for, never expands entities, and refuses very deep or
+    very large documents:
+
+        parser = lxml.etree.XMLParser(
+            remove_blank_text=True, remove_comments=True,
+            resolve_entities=False, huge_tree=False)
+
+    The parser may also be given as a dictionary of keyword arguments for
+    `lxml.etree.XMLParser`. This is required with `processes`, a
+    `concurrent.futures.ProcessPoolExecutor`, or the ``'spill'`` overflow
+    policy, because then payloads are parsed again in other processes or
+    threads, which cannot share a parser object. It also lets the quick scan
+    of VOEvent headers for handlers with an `accepts` method use the same
+    options; for a parser object, whose options cannot be read back, the
+    scan never resolves entities or reads huge trees, and leaves anything
+    that it cannot handle to the parser.
+
+    If `max_payload_size` is provided, then a packet with a length prefix of
+    more than that many bytes is treated as a protocol error: it is not read,
+    and the client reconnects.
+
     Note that this function does not return."""
     if log is None:
         log = logging.getLogger('gcn.listen')
 
-    hosts_ports = itertools.cycle(zip(*_validate_host_port(host, port)))
+    hosts_ports = list(zip(*_validate_host_port(host, port)))
+
+    if processes and (workers or executor is not None):
+        raise ValueError(
+            'processes cannot be combined with workers or executor')
+
+    if isinstance(parser, dict):
+        parser_options = parser
+        parser = _XMLParser(**parser_options)
+    else:
+        parser_options = None
+
+    if handler is not None and (processes or workers or
+                                executor is not None):
+        # Imported here because it is slow to import and often not needed.
+        from concurrent.futures import ProcessPoolExecutor
+        from .workers import ShardedProcessPool, WorkerPool
+
+        if parser is not None and parser_options is None and (
+                processes or overflow == 'spill' or
+                isinstance(executor, ProcessPoolExecutor)):
+            raise ValueError(
+                'parser must be a dictionary of XMLParser keyword arguments '
+                'when payloads are parsed again by workers')
+
+    if handler is not None and processes:
+        pool = handler = ShardedProcessPool(
+            handler, processes, maxsize=queue_size, log=log,
+            parser_options=parser_options)
+    elif handler is not None and (workers or executor is not None):
+        pool = handler = WorkerPool(
+            handler, workers=max(workers, 1), executor=executor,
+            maxsize=queue_size, overflow=overflow, log=log,
+            parser_options=parser_options)
+    else:
+        pool = None
+
+    recent = _RecentPayloads(dedupe) if dedupe else None
+
+    try:
+        if redundant:
+            if handler is not None:
+                handler = _first_copy(handler, log)
+            threads = [
+                threading.Thread(
+                    target=_listen, name='gcn-listen-%s:%d' % host_port,
+                    args=(ReconnectScheduler(
+                        [host_port], iamalive_timeout,
+                        max_backoff=max_reconnect_timeout, log=log),
+                        ivorn, handler, log, metrics, recent,
+                        # lxml parsers must not be shared between threads
+                        None if parser is None else parser.copy(),
+                        max_payload_size))
+                for host_port in hosts_ports]
+            for thread in threads:
+                thread.daemon = True
+                thread.start()
+            for thread in threads:
+                thread.join()
+        else:
+            _listen(ReconnectScheduler(
+                hosts_ports, iamalive_timeout,
+                max_backoff=max_reconnect_timeout, log=log),
+                ivorn, handler, log, metrics, recent, parser,
+                max_payload_size)
+    finally:
+        if pool is not None:
+            pool.close()
+
 
+def _listen(scheduler, ivorn, handler, log, metrics=None, recent=None,
+            parser=None, max_payload_size=None):
+    """Connect and listen for VOEvents forever, reconnecting as needed with a
+    `gcn.reconnect.ReconnectScheduler`."""
     while True:
 
-        sock = _open_socket(hosts_ports, iamalive_timeout,
-                            max_reconnect_timeout, log)
+        sock, health = scheduler.connect()
+        if metrics is not None:
+            metrics.connected(health.host, health.port)
 
+        reader = _PacketReader(sock, max_payload_size=max_payload_size)
         try:
             while True:
-                _ingest_packet(sock, ivorn, handler, log)
+                _ingest_packet(reader, ivorn, handler, log, metrics, recent,
+                               parser)
         except socket.timeout:
             log.warn("timed out")
         except socket.error:
@@ -265,6 +875,9 @@ def listen(host=("45.58.43.186", "68.169.57.253"), port=8099,
                 log.exception("could not close socket")
             else:
                 log.info("closed socket")
+            scheduler.disconnected(health)
+            if metrics is not None:
+                metrics.disconnected(health.host, health.port)
 
 
 def serve(payloads, host='127.0.0.1', port=8099, retransmit_timeout=0,
@@ -0,0 +1,448 @@
+# Copyright (C) 2026  Leo Singer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+"""
+Run payload handlers outside of the socket loop.
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import heapq
+import logging
+import multiprocessing
+import os
+import queue
+import re
+import tempfile
+import threading
+import zlib
+
+from lxml.etree import XMLParser, fromstring
+
+__all__ = ('WorkerPool', 'ShardedProcessPool')
+
+_overflow_policies = frozenset({'block', 'drop-oldest', 'spill'})
+
+_trigger_pattern = re.compile(
+    rb'<Param\s+name="(?:TrigID|GraceID)"\s+value="([^"]*)"')
+
+
+def _make_parser(parser_options):
+    """Build a parser from a dictionary of `lxml.etree.XMLParser` keyword
+    arguments, which unlike the parser itself can be pickled."""
+    if parser_options is None:
+        return None
+    return XMLParser(**parser_options)
+
+
+def _call_handler(handler, payload, parser_options=None):
+    """Parse the payload and call the handler. Used to run handlers in
+    another process, because lxml element trees cannot be pickled."""
+    return handler(payload, fromstring(payload, _make_parser(parser_options)))
+
+
+class _Spilled(object):
+    """A queue entry for a payload that has been spilled to disk."""
+
+    __slots__ = ('filename',)
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def load(self, parser=None):
+        with open(self.filename, 'rb') as f:
+            payload = f.read()
+        os.remove(self.filename)
+        return payload, fromstring(payload, parser)
+
+
+class WorkerPool(object):
+    """Payload handler that puts payloads on a bounded queue and calls
+    `handler` on them from background workers, so that a slow handler never
+    delays reading from the socket or answering iamalive messages.
+
+    By default, `workers` threads call the handler. If `executor` is
+    provided, it should be an instance of `concurrent.futures.Executor`, and
+    payloads are submitted to it, with at most `workers` in flight at once. If
+    `executor` is a `concurrent.futures.ProcessPoolExecutor`, then `handler`
+    must be picklable, and the worker processes parse the payload again
+    because lxml element trees cannot be pickled.
+
+    At most `maxsize` payloads wait in the queue. The `overflow` policy
+    decides what happens to a new payload when the queue is full:
+
+    - ``'block'``: wait until there is room in the queue.
+    - ``'drop-oldest'``: discard the oldest waiting payload.
+    - ``'spill'``: write the payload to a temporary file in `spill_dir`
+      (by default, the system's temporary directory) and read it back when
+      its turn comes.
+
+    If `parser_options` is provided, it should be a dictionary of keyword
+    arguments for `lxml.etree.XMLParser`, and payloads that are parsed again
+    (in another process, or after being spilled) are parsed with such a
+    parser.
+
+    Use as the `handler` argument of `gcn.listen`, or pass the `workers`
+    argument to `gcn.listen` to have it set one up for you. Call `close` to
+    finish the queued payloads and stop the workers."""
+
+    def __init__(self, handler, workers=1, executor=None, maxsize=64,
+                 overflow='block', spill_dir=None, log=None,
+                 parser_options=None):
+        if overflow not in _overflow_policies:
+            raise ValueError(
+                'overflow must be one of {0}'.format(
+                    ', '.join(sorted(_overflow_policies))))
+        if workers < 1:
+            raise ValueError('workers must be at least 1')
+        if maxsize < 1:
+            raise ValueError('maxsize must be at least 1')
+        if log is None:
+            log = logging.getLogger('gcn.workers')
+
+        self.handler = handler
+        if hasattr(handler, 'accepts'):
+            self.accepts = handler.accepts
+        self.workers = workers
+        self.executor = executor
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.spill_dir = spill_dir
+        self.log = log
+        self.parser_options = parser_options
+        self.dropped = 0
+        self.spilled = 0
+
+        # Spilled payloads take up only a file name in the queue, so the
+        # queue itself is unbounded for the 'spill' policy.
+        self._queue = queue.Queue(0 if overflow == 'spill' else maxsize)
+
+        if executor is None:
+            nthreads = workers
+            self._in_flight = None
+        else:
+            nthreads = 1
+            self._in_flight = threading.BoundedSemaphore(workers)
+        self._threads = [
+            threading.Thread(target=self._work, name='gcn-worker-%d' % i)
+            for i in range(nthreads)]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def __call__(self, payload, root):
+        if self.overflow == 'block':
+            self._queue.put((payload, root))
+        elif self.overflow == 'drop-oldest':
+            while True:
+                try:
+                    self._queue.put_nowait((payload, root))
+                except queue.Full:
+                    try:
+                        self._queue.get_nowait()
+                    except queue.Empty:
+                        pass
+                    else:
+                        self._queue.task_done()
+                        self.dropped += 1
+                        self.log.warning('queue full, dropped oldest payload')
+                else:
+                    break
+        elif self._queue.qsize() >= self.maxsize:
+            fd, filename = tempfile.mkstemp(
+                suffix='.xml', prefix='gcn-spill-', dir=self.spill_dir)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(payload)
+            self._queue.put(_Spilled(filename))
+            self.spilled += 1
+            self.log.info('queue full, spilled payload to %s', filename)
+        else:
+            self._queue.put((payload, root))
+
+    def _done(self, future):
+        self._in_flight.release()
+        try:
+            future.result()
+        except:  # noqa: E722
+            self.log.exception("exception in payload handler")
+
+    def _work(self):
+        # lxml parsers must not be shared between threads
+        parser = _make_parser(self.parser_options)
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                elif isinstance(item, _Spilled):
+                    payload, root = item.load(parser)
+                else:
+                    payload, root = item
+
+                if self.executor is None:
+                    self.handler(payload, root)
+                else:
+                    self._in_flight.acquire()
+                    try:
+                        if isinstance(self.executor, ProcessPoolExecutor):
+                            future = self.executor.submit(
+                                _call_handler, self.handler, payload,
+                                self.parser_options)
+                        else:
+                            future = self.executor.submit(
+                                self.handler, payload, root)
+                    except:  # noqa: E722
+                        # For example, the executor was shut down or one of
+                        # its processes died; `_done` will never be called.
+                        self._in_flight.release()
+                        self.log.exception("could not submit payload")
+                    else:
+                        future.add_done_callback(self._done)
+            except:  # noqa: E722
+                self.log.exception("exception in payload handler")
+            finally:
+                self._queue.task_done()
+
+    def join(self):
+        """Wait until every queued payload has been handed to a worker."""
+        self._queue.join()
+
+    def close(self):
+        """Finish the queued payloads and stop the workers."""
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        if self._in_flight is not None:
+            # Wait for the payloads that are still in the executor.
+            for _ in range(self.workers):
+                self._in_flight.acquire()
+            for _ in range(self.workers):
+                self._in_flight.release()
+
+
+def _shard_worker(handler, tasks, results, parser_options=None):
+    """Main loop of a `ShardedProcessPool` worker process."""
+    log = logging.getLogger('gcn.workers')
+    parser = _make_parser(parser_options)
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        seq, payload = task
+        try:
+            result = handler(payload, fromstring(payload, parser))
+        except:  # noqa: E722
+            log.exception("exception in payload handler")
+            ok, result = False, None
+        else:
+            ok = True
+        if results is not None:
+            results.put((seq, ok, result))
+
+
+class ShardedProcessPool(object):
+    """Payload handler that parses payloads and calls `handler` on them in
+    `processes` worker processes (by default, one per CPU), so that parsing
+    and CPU-heavy handlers can use more than one core.
+
+    Each worker process has its own queue of at most `maxsize` payloads, and
+    every payload for a given trigger (as identified by its `TrigID` or
+    `GraceID` parameter, or failing that its IVORN) goes to the same worker,
+    so notices for the same trigger are handled in the order in which they
+    arrived.
+
+    When used as the `handler` of `gcn.listen` (or by passing the `processes`
+    argument to `gcn.listen`), the socket thread reads only as much of each
+    VOEvent as it needs to acknowledge it, and the full document is parsed
+    only in the worker process.
+
+    If `callback` is provided, it is called in this process with the return
+    value of the handler for each payload, in the order in which the payloads
+    arrived, skipping payloads for which the handler raised an exception. The
+    handler, the return values, and the payloads are sent between processes,
+    so they must be picklable. The `mp_context` argument selects the
+    `multiprocessing` start method. If `parser_options` is provided, it should
+    be a dictionary of keyword arguments for `lxml.etree.XMLParser`, and the
+    workers parse payloads with such a parser.
+
+    If a worker process dies, it is restarted with an empty queue. The
+    payloads that were waiting for it are lost, and are skipped when
+    delivering results to the callback.
+
+    Call `close` to finish the queued payloads and stop the workers."""
+
+    header_only = True
+
+    def __init__(self, handler, processes=None, maxsize=64, callback=None,
+                 mp_context=None, log=None, parser_options=None):
+        if processes is None:
+            processes = os.cpu_count() or 1
+        if processes < 1:
+            raise ValueError('processes must be at least 1')
+        if log is None:
+            log = logging.getLogger('gcn.workers')
+
+        self._ctx = multiprocessing.get_context(mp_context)
+        self.handler = handler
+        if hasattr(handler, 'accepts'):
+            self.accepts = handler.accepts
+        self.callback = callback
+        self.log = log
+        self.maxsize = maxsize
+        self.parser_options = parser_options
+        self._lock = threading.Lock()
+        self._seq = 0
+        # Sequence numbers of payloads that have no result yet, and the shard
+        # that each one went to; and those that were lost with their shard.
+        self._pending = {}
+        self._lost = set()
+        self._results = None if callback is None else self._ctx.Queue()
+        self._tasks = [None] * processes
+        self._processes = [None] * processes
+        for i in range(processes):
+            self._start(i)
+
+        if callback is None:
+            self._collector = None
+        else:
+            self._collector = threading.Thread(
+                target=self._collect, name='gcn-shard-results')
+            self._collector.daemon = True
+            self._collector.start()
+
+    def _shard(self, payload, ivorn):
+        """Pick the worker for a payload."""
+        match = _trigger_pattern.search(payload)
+        if match is not None:
+            key = match.group(1)
+        elif ivorn is not None:
+            key = ivorn.encode('UTF-8')
+        else:
+            key = b''
+        return zlib.crc32(key) % len(self._tasks)
+
+    def _start(self, i):
+        """Start the worker process for shard `i`, with a new queue."""
+        self._tasks[i] = tasks = self._ctx.Queue(self.maxsize)
+        self._processes[i] = process = self._ctx.Process(
+            target=_shard_worker, name='gcn-shard-%d' % i,
+            args=(self.handler, tasks, self._results, self.parser_options),
+            daemon=True)
+        process.start()
+
+    def _restart(self, i):
+        """Replace the worker process for shard `i` if it has died. Must be
+        called with the lock held."""
+        process = self._processes[i]
+        if process.is_alive():
+            return
+        self.log.error('worker process %s exited with code %s; restarting',
+                       process.name, process.exitcode)
+        # Do not wait for the dead process's queue to be flushed.
+        self._tasks[i].cancel_join_thread()
+        self._tasks[i].close()
+        lost = [seq for seq, shard in self._pending.items() if shard == i]
+        for seq in lost:
+            del self._pending[seq]
+        self._lost.update(lost)
+        self._start(i)
+
+    def _put(self, i, task):
+        """Queue a task for shard `i`, restarting its worker process if it
+        has died. Must be called with the lock held."""
+        while True:
+            self._restart(i)
+            if task is not None and self._results is not None:
+                self._pending[task[0]] = i
+            try:
+                self._tasks[i].put(task, timeout=1)
+            except queue.Full:
+                pass
+            else:
+                return
+
+    def __call__(self, payload, root):
+        # With `gcn.listen`, `root` is just the header of the VOEvent.
+        ivorn = getattr(root, 'ivorn', None)
+        if ivorn is None:
+            ivorn = root.get('ivorn')
+        payload = bytes(payload)
+        i = self._shard(payload, ivorn)
+        with self._lock:
+            seq = self._seq
+            self._seq += 1
+            self._put(i, (seq, payload))
+
+    def _deliver(self, result):
+        try:
+            self.callback(result)
+        except:  # noqa: E722
+            self.log.exception("exception in result callback")
+
+    def _collect(self):
+        """Deliver results to the callback in order."""
+        heap = []
+        next_seq = 0
+        while True:
+            try:
+                item = self._results.get(timeout=1)
+            except queue.Empty:
+                # Check for dead workers, whose payloads will never have
+                # results.
+                with self._lock:
+                    for i in range(len(self._processes)):
+                        self._restart(i)
+            else:
+                if item is None:
+                    break
+                heapq.heappush(heap, item)
+                with self._lock:
+                    self._pending.pop(item[0], None)
+            ready = []
+            with self._lock:
+                while True:
+                    if heap and heap[0][0] < next_seq:
+                        # A late result for a payload that was given up on.
+                        heapq.heappop(heap)
+                    elif heap and heap[0][0] == next_seq:
+                        _, ok, result = heapq.heappop(heap)
+                        self._lost.discard(next_seq)
+                        next_seq += 1
+                        if ok:
+                            ready.append(result)
+                    elif next_seq in self._lost:
+                        self._lost.remove(next_seq)
+                        next_seq += 1
+                    else:
+                        break
+            for result in ready:
+                self._deliver(result)
+        # All of the workers have exited, so any gaps are payloads that were
+        # lost with a worker that died.
+        while heap:
+            _, ok, result = heapq.heappop(heap)
+            if ok:
+                self._deliver(result)
+
+    def close(self):
+        """Finish the queued payloads and stop the workers."""
+        with self._lock:
+            for i in range(len(self._tasks)):
+                self._put(i, None)
+        for process in self._processes:
+            process.join()
+        if self._collector is not None:
+            self._results.put(None)
+            self._collector.join()